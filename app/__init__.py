@@ -1,20 +1,57 @@
+import os
 from flask import Flask
-from apscheduler.schedulers.background import BackgroundScheduler
-import atexit
-from config import config
-from .extensions import db, bcrypt, login_manager
+from config import config, nom_config
+from .extensions import db, bcrypt, login_manager, smtp_pool
 
-def create_app(config_name='default'):
-    app = Flask(__name__)
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Une seule application par processus : un seul moteur SQLAlchemy, un seul planificateur
+_application = None
+
+
+def create_app(config_name=None):
+    """Crée l'application, ou retourne celle déjà créée dans ce processus.
+
+    Tous les points d'entrée (``run.py``, ``wsgi.py``, ``app.py``, scripts)
+    passent par ici. Demander une autre configuration que celle de
+    l'application existante est une erreur.
+    """
+    global _application
+    config_name = config_name or nom_config()
+    if _application is not None:
+        if _application.config['CONFIG_NAME'] != config_name:
+            raise RuntimeError(
+                f"Application déjà créée avec la configuration '{_application.config['CONFIG_NAME']}' "
+                f"dans ce processus (demandée : '{config_name}')."
+            )
+        return _application
+
+    app = Flask(__name__,
+                template_folder=os.path.join(RACINE, 'templates'),
+                static_folder=os.path.join(RACINE, 'static'),
+                instance_path=os.path.join(RACINE, 'instance'))
     app.config.from_object(config[config_name])
+    app.config['CONFIG_NAME'] = config_name
+    if app.config['TRUSTED_PROXIES']:
+        # IP et schéma du client transmis par Nginx (X-Forwarded-For, X-Forwarded-Proto)
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'],
+                                x_proto=app.config['TRUSTED_PROXIES'])
 
     db.init_app(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
+    smtp_pool.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Veuillez vous connecter pour accéder à cette page.'
     login_manager.login_message_category = 'info'
 
+    from .models import utilisateurs_cache
+    utilisateurs_cache.maxsize = app.config['USER_CACHE_SIZE']
+
+    from .filtres import register_filters
+    register_filters(app)
+
     with app.app_context():
         from .main import main as main_blueprint
         app.register_blueprint(main_blueprint)
@@ -28,16 +65,26 @@ def create_app(config_name='default'):
         from .emails import emails as emails_blueprint
         app.register_blueprint(emails_blueprint)
 
-        from .email import envoyer_rappels_automatiques_func
+        from .cli import register_commands
+        register_commands(app)
 
-        scheduler = BackgroundScheduler()
-        scheduler.add_job(
-            func=envoyer_rappels_automatiques_func,
-            trigger="interval",
-            days=7,  # Vérifie chaque semaine
-            id='rappels_automatiques'
-        )
-        scheduler.start()
-        atexit.register(lambda: scheduler.shutdown())
+        from .scheduler import init_scheduler
+        init_scheduler(app)
 
+    _application = app
     return app
+
+
+def apres_fork():
+    """À appeler dans chaque worker gunicorn, une fois l'application chargée (``post_worker_init``).
+
+    Les connexions ouvertes par le maître (application préchargée) ne
+    doivent pas être partagées : le pool est vidé sans les fermer, puis le
+    worker se porte candidat au planificateur.
+    """
+    if _application is None:
+        return
+    with _application.app_context():
+        db.engine.dispose(close=False)
+    from .scheduler import demarrer_apres_fork
+    demarrer_apres_fork(_application)
@@ -0,0 +1,138 @@
+"""Actions groupées sur une sélection de clients.
+
+Une sélection est soit une liste d'ids, soit les filtres (recherche,
+statut) de la liste des clients. Chaque action s'exécute en une seule
+instruction ensembliste UPDATE, DELETE ou INSERT ... SELECT, sauf l'envoi
+d'un template personnalisé, mis en file par lots avec les variables de
+chaque client. Ces
+instructions ne déclenchent pas les événements ORM : les cumuls
+statistiques sont corrigés à partir d'un agrégat de la sélection et
+l'index de recherche est mis à jour explicitement.
+"""
+from collections import Counter
+from datetime import timedelta
+from sqlalchemy import delete, func, update
+from .extensions import db
+from .models import Client, EmailLog, EmailOutbox
+from .outbox import PENDING, enqueue_many, enqueue_selection, nouvelle_cle
+from .queries import ajouter_jours, filtrer_clients
+from .rendu import est_personnalise, variables_lot
+from .search import desindexer
+from .stats import appliquer_deltas_clients, deltas_client
+
+ACTIONS = [
+    ('statut', 'Changer le statut'),
+    ('prolonger', "Prolonger l'expiration"),
+    ('email', 'Envoyer un template'),
+    ('supprimer', 'Supprimer'),
+]
+
+
+def condition_selection(ids=None, search='', status_filter=''):
+    """Condition SQL désignant les clients sélectionnés."""
+    if ids is not None:
+        return Client.id.in_(ids)
+    query = filtrer_clients(db.session.query(Client.id), search, status_filter)
+    return Client.id.in_(query.subquery().select())
+
+
+def _corriger_cumuls(condition, transformation):
+    """Reporte sur les cumuls l'effet de ``transformation`` sur chaque groupe de la sélection.
+
+    ``transformation(date_ajout, date_expiration, statut)`` retourne les
+    nouvelles valeurs, ou None pour un client supprimé.
+    """
+    groupes = db.session.execute(
+        db.select(Client.date_ajout, Client.date_expiration, Client.statut, func.count())
+        .where(condition)
+        .group_by(Client.date_ajout, Client.date_expiration, Client.statut)
+    )
+    deltas = Counter()
+    for date_ajout, date_expiration, statut, nombre in groupes:
+        deltas.update(deltas_client(date_ajout, date_expiration, statut, -nombre))
+        apres = transformation(date_ajout, date_expiration, statut)
+        if apres is not None:
+            deltas.update(deltas_client(*apres, nombre))
+    appliquer_deltas_clients(db.session.connection(), deltas)
+
+
+def changer_statut(condition, statut):
+    _corriger_cumuls(condition, lambda ajout, expiration, _: (ajout, expiration, statut))
+    resultat = db.session.execute(
+        update(Client).where(condition).values(statut=statut)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return resultat.rowcount
+
+
+def prolonger(condition, jours):
+    _corriger_cumuls(condition, lambda ajout, expiration, statut: (
+        ajout, expiration + timedelta(days=jours) if expiration else None, statut))
+    resultat = db.session.execute(
+        update(Client).where(condition)
+        .values(date_expiration=ajouter_jours(Client.date_expiration, jours))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return resultat.rowcount
+
+
+def supprimer(condition):
+    """Supprime les clients sélectionnés sans historique d'emails ; retourne (supprimés, conservés).
+
+    Un client dont un email a été envoyé (ou est en cours d'envoi) est
+    conservé, comme pour la suppression individuelle ; les emails encore en
+    attente des clients supprimés sont retirés de la file.
+    """
+    selectionnes = db.session.scalar(db.select(func.count()).select_from(Client).where(condition))
+    condition = db.and_(
+        condition,
+        ~db.select(EmailLog.id).where(EmailLog.client_id == Client.id).exists(),
+        ~db.select(EmailOutbox.id)
+        .where(EmailOutbox.client_id == Client.id, EmailOutbox.statut != PENDING).exists(),
+    )
+    _corriger_cumuls(condition, lambda *_: None)
+    db.session.execute(
+        delete(EmailOutbox)
+        .where(EmailOutbox.client_id.in_(db.select(Client.id).where(condition)))
+        .execution_options(synchronize_session=False)
+    )
+    ids = db.session.scalars(
+        delete(Client).where(condition).returning(Client.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    desindexer(db.session.connection(), ids)
+    db.session.commit()
+    return len(ids), selectionnes - len(ids)
+
+
+def envoyer_template(condition, template, batch_size=1000):
+    """Met en file le template pour chaque client sélectionné.
+
+    Un template sans variable est mis en file en une seule instruction ;
+    sinon les clients sont lus par lots de ``batch_size`` et le template est
+    mis en file avec leurs variables, rendu par le worker.
+    """
+    prefixe_cle = f'lot:{nouvelle_cle()}:'
+    if not (est_personnalise(template.sujet) or est_personnalise(template.contenu)):
+        return enqueue_selection(condition, template.sujet, template.contenu,
+                                 prefixe_cle=prefixe_cle, template_id=template.id)
+
+    clients = db.session.execute(
+        db.select(Client.id, Client.nom, Client.email, Client.telephone,
+                  Client.statut, Client.date_expiration)
+        .where(condition)
+        .order_by(Client.id)
+        .execution_options(yield_per=batch_size)
+    )
+    total = 0
+    for lot in clients.partitions():
+        total += enqueue_many(
+            [(client.id, client.email, client.nom, template.sujet, template.contenu,
+              f'{prefixe_cle}{client.id}', variables)
+             for client, variables in variables_lot(template, lot)],
+            commit=False, template_id=template.id,
+        )
+    db.session.commit()
+    return total
@@ -0,0 +1,445 @@
+"""Archivage et partitionnement de l'historique des emails.
+
+Les mois entiers plus anciens que ``EMAIL_LOG_RETENTION_DAYS`` sont écrits
+dans ``EMAIL_ARCHIVE_DIR``, un fichier JSONL compressé par mois, puis
+retirés de ``email_log`` ; une ligne ``email_log_archive`` résume chaque
+mois archivé.
+
+Le fichier est trié comme l'historique (date d'envoi puis id, du plus
+récent au plus ancien) et découpé en blocs de ``TAILLE_BLOC`` lignes, chacun
+compressé séparément (membre gzip : le fichier reste lisible par ``zcat``).
+Un index voisin (``.index.json``) donne la position et les clés extrêmes
+de chaque bloc, et le bloc de chaque id : une page ou un email se lit en
+décompressant un ou deux blocs, quelle que soit la taille du mois. Les cumuls ``daily_email_stats`` sont conservés : le
+dashboard et le total de l'historique comptent toujours les emails archivés.
+
+Sur PostgreSQL, ``partitionner_email_log`` convertit ``email_log`` en table
+partitionnée par mois sur ``date_envoi`` ; l'archivage d'un mois supprime
+alors sa partition au lieu d'exécuter un DELETE.
+"""
+import gzip
+import heapq
+import json
+import os
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import delete, text
+from .extensions import db
+from .models import Client, EmailLog, EmailLogArchive
+from .pagination import KeysetPage, decoder_curseur, encoder_curseur
+from .queries import expression_mois
+from .rendu import rendre_enregistre
+
+
+def _debut_mois(jour):
+    return jour.replace(day=1)
+
+
+def _mois_suivant(jour):
+    return (jour.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _bornes(mois):
+    debut = datetime.strptime(mois, '%Y-%m').date()
+    return datetime.combine(debut, time.min), datetime.combine(_mois_suivant(debut), time.min)
+
+
+def limite_retention(retention_days, today=None):
+    """Début du plus ancien mois conservé : seuls des mois entiers sont archivés."""
+    today = today or date.today()
+    return _debut_mois(today - timedelta(days=retention_days))
+
+
+TAILLE_BLOC = 500
+
+
+def chemin_archive(mois):
+    return os.path.join(current_app.config['EMAIL_ARCHIVE_DIR'], f'email_log-{mois}.jsonl.gz')
+
+
+def chemin_index(chemin):
+    return chemin[:-len('.jsonl.gz')] + '.index.json'
+
+
+def mois_a_archiver(limite):
+    mois = expression_mois(EmailLog.date_envoi)
+    return [
+        m for (m,) in db.session.query(mois)
+        .filter(EmailLog.date_envoi < datetime.combine(limite, time.min))
+        .distinct().order_by(mois)
+    ]
+
+
+def est_partitionnee(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'email_log')"
+    )).scalar()
+
+
+def _nom_partition(debut):
+    return f'email_log_{debut:%Y_%m}'
+
+
+def creer_partitions(connection, debut, fin):
+    """Crée les partitions mensuelles manquantes couvrant [debut, fin)."""
+    jour = _debut_mois(debut)
+    while jour < fin:
+        suivant = _mois_suivant(jour)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {_nom_partition(jour)} PARTITION OF email_log "
+            f"FOR VALUES FROM ('{jour.isoformat()}') TO ('{suivant.isoformat()}')"
+        ))
+        jour = suivant
+
+
+def partitionner_email_log(mois_a_venir=3):
+    """Convertit ``email_log`` en table partitionnée par mois (PostgreSQL).
+
+    Retourne False si la table l'est déjà. La clé primaire devient
+    (id, date_envoi), la partition key devant en faire partie ; la séquence
+    des identifiants est conservée.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        raise RuntimeError("Le partitionnement natif n'est disponible que sur PostgreSQL.")
+    if est_partitionnee(connection):
+        return False
+
+    for instruction in (
+        "ALTER TABLE email_log RENAME TO email_log_ancien",
+        "ALTER TABLE email_log_ancien RENAME CONSTRAINT email_log_pkey TO email_log_ancien_pkey",
+        "ALTER INDEX IF EXISTS ix_email_log_date_envoi RENAME TO ix_email_log_ancien_date_envoi",
+        "ALTER INDEX IF EXISTS ix_email_log_content_hash RENAME TO ix_email_log_ancien_content_hash",
+        "UPDATE email_log_ancien SET date_envoi = to_timestamp(0) WHERE date_envoi IS NULL",
+        "CREATE TABLE email_log (LIKE email_log_ancien INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (date_envoi)",
+        "ALTER TABLE email_log ADD CONSTRAINT email_log_pkey PRIMARY KEY (id, date_envoi)",
+        "ALTER TABLE email_log ADD FOREIGN KEY (client_id) REFERENCES client (id)",
+        # Corps dédoublonnés (``contenus``) : références vérifiées et recherche par empreinte
+        "ALTER TABLE email_log ADD FOREIGN KEY (content_hash) REFERENCES email_content (hash)",
+        "CREATE INDEX ix_email_log_date_envoi ON email_log (date_envoi, id)",
+        "CREATE INDEX ix_email_log_content_hash ON email_log (content_hash)",
+        "CREATE TABLE email_log_defaut PARTITION OF email_log DEFAULT",
+    ):
+        connection.execute(text(instruction))
+
+    premier = connection.execute(text("SELECT min(date_envoi) FROM email_log_ancien")).scalar()
+    today = date.today()
+    fin = today
+    for _ in range(mois_a_venir + 1):
+        fin = _mois_suivant(fin)
+    creer_partitions(connection, (premier.date() if premier else today), fin)
+
+    for instruction in (
+        "INSERT INTO email_log SELECT * FROM email_log_ancien",
+        "ALTER SEQUENCE IF EXISTS email_log_id_seq OWNED BY email_log.id",
+        "DROP TABLE email_log_ancien",
+    ):
+        connection.execute(text(instruction))
+    db.session.commit()
+    return True
+
+
+def _supprimer_mois(connection, mois, max_id):
+    debut, fin = _bornes(mois)
+    if est_partitionnee(connection):
+        nom = _nom_partition(debut)
+        existe = connection.execute(text("SELECT to_regclass(:nom) IS NOT NULL"), {'nom': nom}).scalar()
+        if existe:
+            connection.execute(text(f"ALTER TABLE email_log DETACH PARTITION {nom}"))
+            connection.execute(text(f"DROP TABLE {nom}"))
+            return
+    db.session.execute(
+        delete(EmailLog)
+        .where(EmailLog.date_envoi >= debut, EmailLog.date_envoi < fin, EmailLog.id <= max_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _cle(donnees):
+    return datetime.fromisoformat(donnees['date_envoi']), donnees['id']
+
+
+def _lire_tout(chemin):
+    """Toutes les lignes d'une archive, quel que soit son format, dédoublonnées et triées."""
+    lignes = {}
+    with gzip.open(chemin, 'rt', encoding='utf-8') as fichier:
+        for brut in fichier:
+            donnees = json.loads(brut)
+            lignes[donnees['id']] = donnees
+    return sorted(lignes.values(), key=_cle, reverse=True)
+
+
+def _paquets(lignes, taille):
+    paquet = []
+    for ligne in lignes:
+        paquet.append(ligne)
+        if len(paquet) == taille:
+            yield paquet
+            paquet = []
+    if paquet:
+        yield paquet
+
+
+def ecrire_archive(chemin, lignes, taille_bloc=TAILLE_BLOC):
+    """Écrit ``lignes`` (dicts triés du plus récent au plus ancien, ids uniques) et leur index.
+
+    Les deux fichiers sont écrits à côté puis remplacés ; l'index porte la
+    taille du fichier qu'il décrit.
+    """
+    temporaire = chemin + '.tmp'
+    blocs = []
+    ids = []
+    nombre = 0
+    with open(temporaire, 'wb') as fichier:
+        for paquet in _paquets(lignes, taille_bloc):
+            donnees = gzip.compress(''.join(
+                json.dumps(ligne, ensure_ascii=False) + '\n' for ligne in paquet
+            ).encode('utf-8'))
+            ids.extend((ligne['id'], len(blocs)) for ligne in paquet)
+            blocs.append({
+                'offset': fichier.tell(), 'taille': len(donnees),
+                'debut': nombre, 'lignes': len(paquet),
+                'premier': [paquet[0]['date_envoi'], paquet[0]['id']],
+                'dernier': [paquet[-1]['date_envoi'], paquet[-1]['id']],
+            })
+            fichier.write(donnees)
+            nombre += len(paquet)
+        taille = fichier.tell()
+    with open(chemin_index(chemin) + '.tmp', 'w', encoding='utf-8') as fichier:
+        ids.sort()
+        json.dump({'version': 1, 'taille': taille, 'nombre': nombre, 'blocs': blocs,
+                   'ids': [i for i, _ in ids], 'blocs_ids': [b for _, b in ids]}, fichier)
+    os.replace(temporaire, chemin)
+    os.replace(chemin_index(chemin) + '.tmp', chemin_index(chemin))
+    return nombre
+
+
+def archiver_mois(mois, batch_size=1000):
+    """Archive les emails d'un mois et les retire de la base ; retourne leur nombre.
+
+    Si le mois a déjà été archivé, les nouvelles lignes sont fusionnées
+    avec l'archive existante. Le fichier est remplacé avant le commit : une
+    interruption peut laisser des lignes à la fois dans l'archive et dans la
+    base (elles sont dédoublonnées par id), jamais en perdre.
+    """
+    debut, fin = _bornes(mois)
+    chemin = chemin_archive(mois)
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+
+    requete = (
+        db.select(EmailLog.id, EmailLog.client_id, Client.nom, Client.email, EmailLog.sujet,
+                  EmailLog.message, EmailLog.variables, EmailLog.date_envoi, EmailLog.statut)
+        .outerjoin(Client, Client.id == EmailLog.client_id)
+        .where(EmailLog.date_envoi >= debut, EmailLog.date_envoi < fin)
+        .order_by(EmailLog.date_envoi.desc(), EmailLog.id.desc())
+        .execution_options(yield_per=batch_size)
+    )
+    nouvelles = {'nombre': 0, 'max_id': None}
+
+    def lignes_base():
+        for ligne in db.session.execute(requete):
+            nouvelles['nombre'] += 1
+            nouvelles['max_id'] = max(nouvelles['max_id'] or ligne.id, ligne.id)
+            yield {
+                'id': ligne.id,
+                'client_id': ligne.client_id,
+                'client_nom': ligne.nom,
+                'client_email': ligne.email,
+                'sujet': ligne.sujet,
+                # Les archives gardent le corps tel qu'envoyé
+                'contenu': rendre_enregistre(ligne.message, ligne.variables),
+                'date_envoi': ligne.date_envoi.isoformat(),
+                'statut': ligne.statut,
+            }
+
+    totaux = {'nombre': 0, 'envoyes': 0, 'premier': None, 'dernier': None}
+
+    def fusion():
+        existantes = _lire_tout(chemin) if os.path.exists(chemin) else []
+        vus = set()
+        for ligne in heapq.merge(existantes, lignes_base(), key=_cle, reverse=True):
+            if ligne['id'] in vus:
+                continue
+            vus.add(ligne['id'])
+            date_envoi = datetime.fromisoformat(ligne['date_envoi'])
+            totaux['nombre'] += 1
+            totaux['envoyes'] += ligne['statut'] == 'envoyé'
+            totaux['premier'] = min(totaux['premier'] or date_envoi, date_envoi)
+            totaux['dernier'] = max(totaux['dernier'] or date_envoi, date_envoi)
+            yield ligne
+
+    # Rien à archiver : l'archive existante n'est pas réécrite
+    if not db.session.execute(
+        db.select(EmailLog.id).where(EmailLog.date_envoi >= debut, EmailLog.date_envoi < fin).limit(1)
+    ).first():
+        return 0
+    ecrire_archive(chemin, fusion())
+
+    _supprimer_mois(db.session.connection(), mois, nouvelles['max_id'])
+    archive = db.session.get(EmailLogArchive, mois)
+    if archive is None:
+        archive = EmailLogArchive(mois=mois, chemin=chemin)
+        db.session.add(archive)
+    archive.chemin = chemin
+    archive.nombre = totaux['nombre']
+    archive.envoyes = totaux['envoyes']
+    archive.echecs = totaux['nombre'] - totaux['envoyes']
+    archive.premier_envoi = totaux['premier']
+    archive.dernier_envoi = totaux['dernier']
+    db.session.commit()
+    return nouvelles['nombre']
+
+
+def archiver_emails(retention_days=None, today=None, dry_run=False, mois_a_venir=3):
+    """Archive tous les mois échus ; retourne [(mois, nombre d'emails)]."""
+    if retention_days is None:
+        retention_days = current_app.config['EMAIL_LOG_RETENTION_DAYS']
+    today = today or date.today()
+    connection = db.session.connection()
+    if not dry_run and est_partitionnee(connection):
+        # Partitions d'avance : les nouveaux emails ne tombent jamais dans la partition par défaut
+        fin = today
+        for _ in range(mois_a_venir + 1):
+            fin = _mois_suivant(fin)
+        creer_partitions(connection, today, fin)
+        db.session.commit()
+
+    resultats = []
+    for mois in mois_a_archiver(limite_retention(retention_days, today)):
+        if dry_run:
+            debut, fin = _bornes(mois)
+            nombre = EmailLog.query.filter(EmailLog.date_envoi >= debut, EmailLog.date_envoi < fin).count()
+        else:
+            nombre = archiver_mois(mois)
+        resultats.append((mois, nombre))
+    return resultats
+
+
+@lru_cache(maxsize=16)
+def _charger_index(chemin, version):
+    """Index d'une archive ; ``version`` (mtime, taille) invalide le cache quand le fichier change."""
+    try:
+        with open(chemin_index(chemin), encoding='utf-8') as fichier:
+            index = json.load(fichier)
+    except (OSError, ValueError):
+        return None
+    if index.get('taille') != version[1]:
+        # Index d'une autre version du fichier (réécriture en cours ou interrompue)
+        return None
+    for bloc in index['blocs']:
+        bloc['premier'] = (datetime.fromisoformat(bloc['premier'][0]), bloc['premier'][1])
+        bloc['dernier'] = (datetime.fromisoformat(bloc['dernier'][0]), bloc['dernier'][1])
+    # Tableaux compacts : l'index reste en cache pour les pages suivantes
+    index['ids'] = array('q', index['ids'])
+    index['blocs_ids'] = array('l', index['blocs_ids'])
+    return index
+
+
+def _archive_indexee(mois):
+    """(chemin, index) de l'archive d'un mois ; (None, None) si elle n'existe pas.
+
+    Une archive sans index (format antérieur, non trié) est réécrite une fois.
+    """
+    archive = db.session.get(EmailLogArchive, mois)
+    if archive is None or not os.path.exists(archive.chemin):
+        return None, None
+    chemin = archive.chemin
+    for tentative in range(2):
+        stat = os.stat(chemin)
+        index = _charger_index(chemin, (stat.st_mtime_ns, stat.st_size))
+        if index is not None or tentative:
+            return chemin, index
+        ecrire_archive(chemin, _lire_tout(chemin))
+
+
+def _lire_bloc(chemin, bloc):
+    with open(chemin, 'rb') as fichier:
+        fichier.seek(bloc['offset'])
+        brut = fichier.read(bloc['taille'])
+    return [json.loads(ligne) for ligne in gzip.decompress(brut).decode('utf-8').splitlines()]
+
+
+def _email(donnees):
+    return SimpleNamespace(
+        id=donnees['id'],
+        client_id=donnees['client_id'],
+        client=SimpleNamespace(nom=donnees['client_nom'], email=donnees['client_email']),
+        sujet=donnees['sujet'],
+        message_envoye=donnees['contenu'],
+        date_envoi=datetime.fromisoformat(donnees['date_envoi']),
+        statut=donnees['statut'],
+    )
+
+
+def _rang(chemin, index, repere, inclus):
+    """Position de la première ligne de clé < ``repere`` (<= si ``inclus``)."""
+    avant = (lambda cle: cle <= repere) if inclus else (lambda cle: cle < repere)
+    for bloc in index['blocs']:
+        if avant(bloc['dernier']):
+            lignes = _lire_bloc(chemin, bloc)
+            return bloc['debut'] + next(i for i, ligne in enumerate(lignes) if avant(_cle(ligne)))
+    return index['nombre']
+
+
+def _tranche(chemin, index, debut, nombre):
+    lignes = []
+    for bloc in index['blocs']:
+        if bloc['debut'] + bloc['lignes'] <= debut:
+            continue
+        if bloc['debut'] >= debut + nombre:
+            break
+        contenu = _lire_bloc(chemin, bloc)
+        lignes.extend(contenu[max(debut - bloc['debut'], 0):debut + nombre - bloc['debut']])
+    return lignes
+
+
+def lire_archive(mois):
+    """Emails archivés d'un mois, du plus récent au plus ancien."""
+    chemin, index = _archive_indexee(mois)
+    if index is None:
+        return []
+    return [_email(donnees) for bloc in index['blocs'] for donnees in _lire_bloc(chemin, bloc)]
+
+
+def page_archive(mois, per_page, curseur=None):
+    """Page de l'historique archivé, avec les mêmes curseurs que ``keyset_paginate``."""
+    chemin, index = _archive_indexee(mois)
+    if index is None:
+        return KeysetPage([], per_page)
+    position = decoder_curseur(curseur)
+    debut = 0
+    if position is not None:
+        valeur, ident, direction = position
+        repere = (datetime.fromisoformat(valeur), ident)
+        if direction == 'prev':
+            debut = max(_rang(chemin, index, repere, inclus=True) - per_page, 0)
+        else:
+            debut = _rang(chemin, index, repere, inclus=False)
+    items = [_email(donnees) for donnees in _tranche(chemin, index, debut, per_page)]
+
+    next_cursor = prev_cursor = None
+    if items:
+        if debut + len(items) < index['nombre']:
+            next_cursor = encoder_curseur(items[-1].date_envoi, items[-1].id, direction='next')
+        if debut > 0:
+            prev_cursor = encoder_curseur(items[0].date_envoi, items[0].id, direction='prev')
+    return KeysetPage(items, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def contenu_archive(mois, log_id):
+    chemin, index = _archive_indexee(mois)
+    if index is None:
+        return None
+    position = bisect_left(index['ids'], log_id)
+    if position == len(index['ids']) or index['ids'][position] != log_id:
+        return None
+    bloc = index['blocs'][index['blocs_ids'][position]]
+    return next(_email(donnees) for donnees in _lire_bloc(chemin, bloc) if donnees['id'] == log_id)
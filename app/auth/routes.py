@@ -1,9 +1,10 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import current_app, render_template, redirect, url_for, flash, request, session
 from flask_login import login_user, logout_user, login_required, current_user
 from . import auth
 from .. import db
-from ..models import User
+from ..models import CLE_SESSION, User
 from .forms import LoginForm, RegisterForm
+from .securite import ServiceSature, limiteur_connexions, verificateur_mots_de_passe
 
 @auth.route('/login', methods=['GET', 'POST'])
 def login():
@@ -12,8 +13,30 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
+        ip = request.remote_addr
+        limiteur = limiteur_connexions(current_app)
+        attente = limiteur.attente(ip, form.username.data)
+        if attente:
+            flash(f'Trop de tentatives de connexion. Réessayez dans {attente} secondes.', 'error')
+            return render_template('login.html', form=form), 429, {'Retry-After': str(attente)}
+
+        verificateur = verificateur_mots_de_passe(current_app)
         user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            valide = verificateur.verifier(user.password_hash if user else None, form.password.data)
+        except ServiceSature:
+            flash('Le service de connexion est momentanément saturé. Réessayez dans quelques secondes.', 'error')
+            return render_template('login.html', form=form), 503, {'Retry-After': '5'}
+        limiteur.enregistrer(ip, form.username.data, valide)
+
+        if valide:
+            if user.doit_rehacher():
+                # Facteur de coût modifié depuis la création du hash ; sinon refait à la prochaine connexion
+                try:
+                    user.password_hash = verificateur.hacher(form.password.data)
+                    db.session.commit()
+                except ServiceSature:
+                    pass
             login_user(user)
             next_page = request.args.get('next')
             flash('Connexion réussie!', 'success')
@@ -28,6 +51,14 @@ def register():
     
     form = RegisterForm()
     if form.validate_on_submit():
+        ip = request.remote_addr
+        limiteur = limiteur_connexions(current_app)
+        attente = limiteur.attente_ip(ip)
+        if attente:
+            flash(f'Trop de tentatives. Réessayez dans {attente} secondes.', 'error')
+            return render_template('register.html', form=form), 429, {'Retry-After': str(attente)}
+        limiteur.enregistrer_ip(ip)
+
         if User.query.filter_by(username=form.username.data).first():
             flash('Ce nom d\'utilisateur existe déjà.', 'error')
             return render_template('register.html', form=form)
@@ -37,7 +68,11 @@ def register():
             return render_template('register.html', form=form)
         
         user = User(username=form.username.data, email=form.email.data)
-        user.set_password(form.password.data)
+        try:
+            user.password_hash = verificateur_mots_de_passe(current_app).hacher(form.password.data)
+        except ServiceSature:
+            flash('Le service est momentanément saturé. Réessayez dans quelques secondes.', 'error')
+            return render_template('register.html', form=form), 503, {'Retry-After': '5'}
         db.session.add(user)
         db.session.commit()
         flash('Inscription réussie! Vous pouvez maintenant vous connecter.', 'success')
@@ -48,5 +83,6 @@ def register():
 @login_required
 def logout():
     logout_user()
+    session.pop(CLE_SESSION, None)
     flash('Vous avez été déconnecté.', 'info')
     return redirect(url_for('main.index'))
@@ -0,0 +1,224 @@
+"""Protection de la connexion : limitation des tentatives et vérification bornée.
+
+Le limiteur compte les tentatives sur une fenêtre glissante : toutes les
+tentatives par IP, les échecs par nom d'utilisateur (une connexion réussie
+remet ce compteur à zéro). Les inscriptions comptent comme des tentatives
+de leur IP. Une tentative refusée n'est pas comptée et ne coûte aucun
+calcul bcrypt. Les instants sont gardés par un backend :
+``memoire`` (propre au processus), ``base`` (table ``login_attempt``,
+partagée par tous les workers et serveurs) ou une classe ``module:Classe``
+construite avec l'application et offrant les mêmes méthodes.
+
+bcrypt est volontairement coûteux en CPU : les vérifications passent par un
+pool de BCRYPT_MAX_CONCURRENCY threads, avec au plus BCRYPT_QUEUE_SIZE
+vérifications en attente. Au-delà, la connexion est refusée tout de suite
+(``ServiceSature``) au lieu d'occuper les threads qui servent les autres
+pages.
+"""
+import importlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select
+from ..extensions import bcrypt, db
+from ..models import LoginAttempt, hacher_mot_de_passe
+
+
+class ServiceSature(Exception):
+    """Trop de vérifications de mot de passe en cours dans ce processus."""
+
+
+class BackendMemoire:
+    """Instants des tentatives par clé, dans la mémoire du processus."""
+
+    # Purge des clés inactives toutes les PURGE ajouts
+    PURGE = 1000
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._instants = {}
+        self._ajouts = 0
+        self._fenetre_max = timedelta(0)
+
+    def recents(self, cle, depuis, limite):
+        """Au plus ``limite`` instants postérieurs à ``depuis``, du plus récent au plus ancien."""
+        with self._lock:
+            instants = self._instants.get(cle)
+            if not instants:
+                return []
+            while instants and instants[0] <= depuis:
+                instants.popleft()
+            return list(instants)[:-limite - 1:-1]
+
+    def ajouter(self, cle, instant, fenetre):
+        with self._lock:
+            self._instants.setdefault(cle, deque()).append(instant)
+            self._fenetre_max = max(self._fenetre_max, fenetre)
+            self._ajouts += 1
+            if self._ajouts % self.PURGE == 0:
+                limite = instant - self._fenetre_max
+                for cle_inactive in [c for c, i in self._instants.items() if i[-1] <= limite]:
+                    del self._instants[cle_inactive]
+
+    def effacer(self, cle):
+        with self._lock:
+            self._instants.pop(cle, None)
+
+
+class BackendBase:
+    """Instants des tentatives dans la table ``login_attempt``.
+
+    Chaque opération a sa propre transaction, hors de la session de la requête.
+    """
+
+    PURGE = 100
+
+    def __init__(self, app):
+        with app.app_context():
+            self.engine = db.engine
+        self.table = LoginAttempt.__table__
+        self._ajouts = 0
+
+    def recents(self, cle, depuis, limite):
+        table = self.table
+        with self.engine.connect() as conn:
+            return list(conn.execute(
+                select(table.c.instant)
+                .where(table.c.cle == cle, table.c.instant > depuis)
+                .order_by(table.c.instant.desc())
+                .limit(limite)
+            ).scalars())
+
+    def ajouter(self, cle, instant, fenetre):
+        table = self.table
+        self._ajouts += 1
+        with self.engine.begin() as conn:
+            conn.execute(insert(table).values(cle=cle, instant=instant))
+            if self._ajouts % self.PURGE == 0:
+                conn.execute(delete(table).where(table.c.instant <= instant - fenetre))
+
+    def effacer(self, cle):
+        table = self.table
+        with self.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.cle == cle))
+
+
+BACKENDS = {'memoire': BackendMemoire, 'base': BackendBase}
+
+
+def charger_backend(nom):
+    if nom in BACKENDS:
+        return BACKENDS[nom]
+    module, _, classe = nom.partition(':')
+    return getattr(importlib.import_module(module), classe)
+
+
+class LimiteurConnexions:
+    def __init__(self, backend, fenetre, max_par_ip, max_echecs_par_utilisateur):
+        self.backend = backend
+        self.fenetre = timedelta(seconds=fenetre)
+        self.max_par_ip = max_par_ip
+        self.max_echecs_par_utilisateur = max_echecs_par_utilisateur
+
+    @staticmethod
+    def _cles(ip, username):
+        return f'ip:{ip}', f'utilisateur:{(username or "").strip().lower()}'
+
+    def _attente(self, cle, limite, maintenant):
+        recents = self.backend.recents(cle, maintenant - self.fenetre, limite)
+        if len(recents) < limite:
+            return 0
+        # La plus ancienne des ``limite`` dernières tentatives doit sortir de la fenêtre
+        return max((recents[-1] + self.fenetre - maintenant).total_seconds(), 1)
+
+    def attente(self, ip, username, maintenant=None):
+        """Secondes avant la prochaine tentative autorisée ; 0 si elle l'est tout de suite."""
+        maintenant = maintenant or datetime.utcnow()
+        cle_ip, cle_utilisateur = self._cles(ip, username)
+        return int(max(self._attente(cle_ip, self.max_par_ip, maintenant),
+                       self._attente(cle_utilisateur, self.max_echecs_par_utilisateur, maintenant)))
+
+    def attente_ip(self, ip, maintenant=None):
+        """Comme ``attente``, pour la seule limite par IP (inscription)."""
+        maintenant = maintenant or datetime.utcnow()
+        return int(self._attente(self._cles(ip, None)[0], self.max_par_ip, maintenant))
+
+    def enregistrer_ip(self, ip, maintenant=None):
+        self.backend.ajouter(self._cles(ip, None)[0], maintenant or datetime.utcnow(), self.fenetre)
+
+    def enregistrer(self, ip, username, succes, maintenant=None):
+        maintenant = maintenant or datetime.utcnow()
+        cle_ip, cle_utilisateur = self._cles(ip, username)
+        self.backend.ajouter(cle_ip, maintenant, self.fenetre)
+        if succes:
+            self.backend.effacer(cle_utilisateur)
+        else:
+            self.backend.ajouter(cle_utilisateur, maintenant, self.fenetre)
+
+
+class VerificateurMotsDePasse:
+    """Pool borné pour les calculs bcrypt."""
+
+    def __init__(self, max_workers, file, timeout):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        # Une place par calcul en cours ou en attente, rendue quand il se termine
+        self._places = threading.BoundedSemaphore(max_workers + file)
+        self._hash_factice = None
+
+    def executer(self, fonction, *args):
+        if not self._places.acquire(blocking=False):
+            raise ServiceSature()
+        try:
+            future = self._executor.submit(fonction, *args)
+        except Exception:
+            self._places.release()
+            raise
+        future.add_done_callback(lambda f: self._places.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise ServiceSature()
+
+    def verifier(self, password_hash, password):
+        """Vérifie le mot de passe ; sans hash (utilisateur inconnu), compare à un hash factice
+        pour que la réponse prenne le même temps."""
+        if password_hash is None:
+            if self._hash_factice is None:
+                self._hash_factice = self.executer(hacher_mot_de_passe, 'utilisateur-inconnu')
+            self.executer(bcrypt.check_password_hash, self._hash_factice, password)
+            return False
+        return self.executer(bcrypt.check_password_hash, password_hash, password)
+
+    def hacher(self, password):
+        return self.executer(hacher_mot_de_passe, password)
+
+
+_limiteur = None
+_verificateur = None
+_lock = threading.Lock()
+
+
+def limiteur_connexions(app):
+    global _limiteur
+    with _lock:
+        if _limiteur is None:
+            config = app.config
+            backend = charger_backend(config['LOGIN_RATE_LIMIT_BACKEND'])(app)
+            _limiteur = LimiteurConnexions(
+                backend, config['LOGIN_RATE_WINDOW'],
+                config['LOGIN_MAX_ATTEMPTS_PER_IP'], config['LOGIN_MAX_FAILURES_PER_USERNAME'],
+            )
+        return _limiteur
+
+
+def verificateur_mots_de_passe(app):
+    global _verificateur
+    with _lock:
+        if _verificateur is None:
+            config = app.config
+            _verificateur = VerificateurMotsDePasse(
+                config['BCRYPT_MAX_CONCURRENCY'], config['BCRYPT_QUEUE_SIZE'], config['BCRYPT_TIMEOUT'],
+            )
+        return _verificateur
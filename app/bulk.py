@@ -0,0 +1,29 @@
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from .extensions import db
+
+
+def insert_on_conflict(model, index_elements, update_columns=None, bind=None,
+                       increment_columns=None):
+    """INSERT ... ON CONFLICT pour SQLite et PostgreSQL.
+
+    Sans ``update_columns`` ni ``increment_columns`` les lignes en conflit
+    sont ignorées. Les colonnes de ``update_columns`` prennent les valeurs
+    proposées (upsert) ; celles de ``increment_columns`` leur sont ajoutées
+    (compteurs).
+    """
+    # Insertion Core sur la table : on garde le rowcount du curseur
+    model = getattr(model, '__table__', model)
+    dialecte = (bind or db.session.get_bind()).dialect.name
+    if dialecte == 'postgresql':
+        stmt = postgresql.insert(model)
+    elif dialecte == 'sqlite':
+        stmt = sqlite.insert(model)
+    else:
+        return insert(model)
+    if not update_columns and not increment_columns:
+        return stmt.on_conflict_do_nothing(index_elements=index_elements)
+    set_ = {colonne: stmt.excluded[colonne] for colonne in update_columns or ()}
+    for colonne in increment_columns or ():
+        set_[colonne] = model.c[colonne] + stmt.excluded[colonne]
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
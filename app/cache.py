@@ -0,0 +1,100 @@
+"""Cache en mémoire du processus, avec durée de vie et invalidation sur écriture.
+
+``invalider_sur_ecriture`` vide un cache dès qu'une transaction modifiant
+l'un des modèles surveillés est validée : écritures ORM classiques
+(flush) comme instructions groupées ``insert()/update()/delete()``
+exécutées par la session. Chaque processus a son propre cache ; les autres
+processus voient la modification au plus tard après la durée de vie.
+
+Avec ``maxsize``, le cache ne garde que les ``maxsize`` clés lues ou
+écrites le plus récemment.
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, ttl=60, maxsize=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            if self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+
+_surveillances = []
+
+
+def invalider_sur_ecriture(cache, *modeles):
+    _surveillances.append((cache, tuple(modeles)))
+
+
+def _marquer(session, classes):
+    caches = session.info.setdefault('caches_a_invalider', set())
+    for cache, modeles in _surveillances:
+        if any(issubclass(classe, modele) for classe in classes for modele in modeles):
+            caches.add(cache)
+
+
+@event.listens_for(Session, 'after_flush')
+def _apres_flush(session, flush_context):
+    classes = {type(obj) for obj in list(session.new) + list(session.dirty) + list(session.deleted)}
+    if classes:
+        _marquer(session, classes)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _apres_execution(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _marquer(orm_execute_state.session, {mapper.class_})
+
+
+@event.listens_for(Session, 'after_commit')
+def _apres_commit(session):
+    for cache in session.info.pop('caches_a_invalider', ()):
+        cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _apres_rollback(session):
+    session.info.pop('caches_a_invalider', None)
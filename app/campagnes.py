@@ -0,0 +1,211 @@
+"""Campagnes : envoi d'un template à une audience filtrée.
+
+À la création, les ids des clients correspondant au filtre (statut,
+intervalle d'expiration, recherche) sont copiés dans
+``campaign_recipient`` par une seule instruction INSERT ... SELECT : c'est
+l'instantané de l'audience, qui ne change plus ensuite.
+
+La tâche planifiée ``alimenter_campagnes`` met ensuite en file, à chaque
+tour, la tranche suivante de destinataires (par client_id croissant)
+autorisée par le débit de la campagne ; le worker de l'outbox se charge de
+l'envoi. Seule une tranche est en mémoire à la fois, quelle que soit la
+taille de l'audience. Une campagne en pause n'est plus alimentée : les
+emails déjà en file partent quand même.
+
+La progression est lue dans ``email_outbox`` (index campaign_id, statut).
+"""
+import math
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, literal
+from .actions import condition_selection
+from .extensions import db
+from .models import Campaign, CampaignRecipient, Client, EmailOutbox
+from .outbox import FAILED, PENDING, SENDING, SENT, enqueue_many
+from .rendu import ErreurRendu, variables_lot
+
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+CANCELLED = 'cancelled'
+
+
+def condition_audience(statut='', recherche='', expiration_min=None, expiration_max=None):
+    conditions = [condition_selection(search=recherche or '', status_filter=statut or '')]
+    if expiration_min:
+        conditions.append(Client.date_expiration >= expiration_min)
+    if expiration_max:
+        conditions.append(Client.date_expiration <= expiration_max)
+    return db.and_(*conditions)
+
+
+def creer_campagne(nom, template, debit, statut='', recherche='', expiration_min=None, expiration_max=None):
+    """Crée la campagne et l'instantané de son audience ; la démarre aussitôt."""
+    campagne = Campaign(
+        nom=nom, template=template, debit=debit, statut=RUNNING,
+        filtre_statut=statut or None, filtre_recherche=recherche or None,
+        expiration_min=expiration_min, expiration_max=expiration_max,
+        derniere_alimentation=datetime.utcnow(),
+    )
+    db.session.add(campagne)
+    db.session.flush()
+    resultat = db.session.execute(
+        insert(CampaignRecipient).from_select(
+            ['campaign_id', 'client_id'],
+            db.select(literal(campagne.id), Client.id)
+            .where(condition_audience(statut, recherche, expiration_min, expiration_max)),
+        )
+    )
+    campagne.total = resultat.rowcount
+    if not campagne.total:
+        campagne.statut = DONE
+        campagne.termine_a = datetime.utcnow()
+    db.session.commit()
+    return campagne
+
+
+def _quota(campagne, maintenant, batch_size):
+    depuis = campagne.derniere_alimentation or campagne.created_at
+    return min(int((maintenant - depuis).total_seconds() * campagne.debit / 60), batch_size)
+
+
+def alimenter(campagne, maintenant=None, batch_size=None, intervalle=None):
+    """Met en file la tranche suivante de destinataires ; retourne le nombre d'emails ajoutés."""
+    config = current_app.config
+    maintenant = maintenant or datetime.utcnow()
+    batch_size = batch_size or config['CAMPAIGN_BATCH_SIZE']
+    intervalle = intervalle or config['CAMPAIGN_TICK_SECONDS']
+    quota = _quota(campagne, maintenant, batch_size)
+    if quota <= 0:
+        return 0
+
+    lignes = db.session.execute(
+        db.select(CampaignRecipient.client_id, Client.id.label('present'), Client.nom, Client.email,
+                  Client.telephone, Client.statut, Client.date_expiration)
+        .outerjoin(Client, Client.id == CampaignRecipient.client_id)
+        .where(CampaignRecipient.campaign_id == campagne.id,
+               CampaignRecipient.client_id > campagne.curseur)
+        .order_by(CampaignRecipient.client_id)
+        .limit(quota)
+    ).all()
+    if not lignes:
+        return 0
+
+    # Les clients supprimés depuis l'instantané sont ignorés
+    presents = [ligne for ligne in lignes if ligne.present is not None]
+    template = campagne.template
+    ajoutes = enqueue_many(
+        [(client.client_id, client.email, client.nom, template.sujet, template.contenu,
+          f'campagne:{campagne.id}:{client.client_id}', variables)
+         for client, variables in variables_lot(template, presents)],
+        commit=False, campaign_id=campagne.id, template_id=template.id,
+    )
+    campagne.curseur = lignes[-1].client_id
+    campagne.mis_en_file += len(presents)
+    campagne.ignores += len(lignes) - len(presents)
+    # Le crédit non consommé reste acquis, dans la limite d'un tour
+    consomme = campagne.derniere_alimentation + timedelta(seconds=len(lignes) * 60 / campagne.debit)
+    campagne.derniere_alimentation = min(maintenant, max(consomme, maintenant - timedelta(seconds=intervalle)))
+    return ajoutes
+
+
+def compteurs_file(campagne_id):
+    return dict(
+        db.session.query(EmailOutbox.statut, func.count())
+        .filter(EmailOutbox.campaign_id == campagne_id)
+        .group_by(EmailOutbox.statut)
+    )
+
+
+def _terminer_si_complete(campagne):
+    if campagne.mis_en_file + campagne.ignores < campagne.total:
+        return False
+    compteurs = compteurs_file(campagne.id)
+    if compteurs.get(PENDING, 0) or compteurs.get(SENDING, 0):
+        return False
+    campagne.statut = DONE
+    campagne.termine_a = datetime.utcnow()
+    return True
+
+
+def alimenter_campagnes(maintenant=None):
+    """Tour de la tâche planifiée : alimente chaque campagne en cours ; retourne le total ajouté."""
+    total = 0
+    for campagne in Campaign.query.filter_by(statut=RUNNING).order_by(Campaign.id).all():
+        try:
+            total += alimenter(campagne, maintenant)
+        except ErreurRendu as e:
+            db.session.rollback()
+            campagne = db.session.get(Campaign, campagne.id)
+            campagne.statut = PAUSED
+            campagne.erreur = str(e)
+        else:
+            _terminer_si_complete(campagne)
+        db.session.commit()
+    return total
+
+
+def mettre_en_pause(campagne):
+    if campagne.statut == RUNNING:
+        campagne.statut = PAUSED
+        db.session.commit()
+
+
+def reprendre(campagne):
+    if campagne.statut == PAUSED:
+        campagne.statut = RUNNING
+        campagne.erreur = None
+        # Pas de rattrapage du temps passé en pause
+        campagne.derniere_alimentation = datetime.utcnow()
+        db.session.commit()
+
+
+def annuler(campagne):
+    """Arrête la campagne et retire de la file les emails pas encore réclamés."""
+    if campagne.statut in (DONE, CANCELLED):
+        return 0
+    retires = db.session.execute(
+        delete(EmailOutbox)
+        .where(EmailOutbox.campaign_id == campagne.id, EmailOutbox.statut == PENDING)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    campagne.statut = CANCELLED
+    campagne.termine_a = datetime.utcnow()
+    db.session.commit()
+    return retires
+
+
+def progression(campagne, maintenant=None, fenetre=5):
+    """Compteurs et débits d'envoi de la campagne.
+
+    ``debit_recent`` est le nombre d'emails envoyés par minute sur les
+    ``fenetre`` dernières minutes, ``debit_moyen`` celui depuis le premier envoi.
+    """
+    maintenant = maintenant or datetime.utcnow()
+    compteurs = compteurs_file(campagne.id)
+    envoyes = compteurs.get(SENT, 0)
+    premier, dernier = db.session.query(func.min(EmailOutbox.sent_at), func.max(EmailOutbox.sent_at)) \
+        .filter(EmailOutbox.campaign_id == campagne.id, EmailOutbox.statut == SENT).one()
+    recents = db.session.query(func.count()).select_from(EmailOutbox) \
+        .filter(EmailOutbox.campaign_id == campagne.id, EmailOutbox.statut == SENT,
+                EmailOutbox.sent_at >= maintenant - timedelta(minutes=fenetre)).scalar()
+    duree = (dernier - premier).total_seconds() / 60 if premier and dernier else 0
+    traites = envoyes + compteurs.get(FAILED, 0) + campagne.ignores
+    restants = max(campagne.total - traites, 0)
+    debit_moyen = round(envoyes / duree, 1) if duree >= 1 else None
+    return {
+        'statut': campagne.statut,
+        'total': campagne.total,
+        'a_mettre_en_file': max(campagne.total - campagne.mis_en_file - campagne.ignores, 0),
+        'en_file': compteurs.get(PENDING, 0) + compteurs.get(SENDING, 0),
+        'envoyes': envoyes,
+        'echecs': compteurs.get(FAILED, 0),
+        'ignores': campagne.ignores,
+        'pourcentage': round(100 * traites / campagne.total, 1) if campagne.total else 100,
+        'debit_cible': campagne.debit,
+        'debit_recent': round(recents / fenetre, 1),
+        'debit_moyen': debit_moyen,
+        'minutes_restantes': math.ceil(restants / min(campagne.debit, debit_moyen or campagne.debit))
+        if restants and campagne.statut == RUNNING else None,
+        'erreur': campagne.erreur,
+    }
@@ -0,0 +1,147 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from .archives import archiver_emails, partitionner_email_log
+from .contenus import dedoublonner_historique
+from .email import envoyer_email_func
+from .extensions import db
+from .models import creer_utilisateur
+from .moteurs import mesurer_demarrage
+from .outbox import OutboxWorker
+from .schema import completer_schema
+from .search import reconstruire_index
+from .stats import reconstruire_statistiques
+
+search_cli = AppGroup('search', help="Gestion de l'index de recherche des clients.")
+
+@search_cli.command('rebuild')
+@click.option('--batch-size', default=1000, show_default=True, help='Taille des lots de réindexation.')
+def rebuild_search(batch_size):
+    """Reconstruit l'index plein texte à partir de la table client."""
+    total = reconstruire_index(batch_size=batch_size)
+    click.echo(f"{total} clients indexés.")
+
+stats_cli = AppGroup('stats', help='Gestion des tables de statistiques journalières.')
+
+@stats_cli.command('rebuild')
+def rebuild_stats():
+    """Recalcule les cumuls journaliers à partir des clients et des emails."""
+    jours_clients, jours_emails = reconstruire_statistiques()
+    click.echo(f"{jours_clients} cumuls clients et {jours_emails} cumuls emails recalculés.")
+
+archive_cli = AppGroup('archive', help="Archivage de l'historique des emails.")
+
+@archive_cli.command('run')
+@click.option('--retention-days', type=int, default=None, help='Âge (jours) au-delà duquel les mois sont archivés.')
+@click.option('--dry-run', is_flag=True, help='Affiche les mois concernés sans rien archiver.')
+def archive_run(retention_days, dry_run):
+    """Archive les emails des mois échus dans des fichiers JSONL compressés."""
+    resultats = archiver_emails(retention_days=retention_days, dry_run=dry_run)
+    for mois, nombre in resultats:
+        click.echo(f"{mois} : {nombre} emails{' à archiver' if dry_run else ' archivés'}.")
+    if not resultats:
+        click.echo("Aucun mois à archiver.")
+
+@archive_cli.command('partition')
+@click.option('--mois-a-venir', default=3, show_default=True, help="Partitions créées d'avance.")
+def archive_partition(mois_a_venir):
+    """Convertit email_log en table partitionnée par mois (PostgreSQL)."""
+    try:
+        if partitionner_email_log(mois_a_venir=mois_a_venir):
+            click.echo("Table email_log partitionnée par mois.")
+        else:
+            click.echo("La table email_log est déjà partitionnée.")
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+contents_cli = AppGroup('contents', help="Stockage des corps d'emails de l'historique.")
+
+@contents_cli.command('dedup')
+@click.option('--batch-size', default=1000, show_default=True, help='Taille des lots de conversion.')
+def dedup_contents(batch_size):
+    """Remplace les corps stockés dans email_log par des références dédoublonnées."""
+    total = dedoublonner_historique(batch_size=batch_size)
+    click.echo(f"{total} emails convertis.")
+
+schema_cli = AppGroup('schema', help='Mise à niveau du schéma de la base.')
+
+@schema_cli.command('upgrade')
+def schema_upgrade():
+    """Ajoute les tables, colonnes et index manquants déclarés dans les modèles."""
+    try:
+        ajouts = completer_schema(db.session.connection())
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    for ajout in ajouts:
+        click.echo(f"Ajouté : {ajout}")
+    if not ajouts:
+        click.echo("Le schéma est à jour.")
+
+@click.command('create-admin')
+@click.option('--username', prompt="Nom d'utilisateur")
+@click.option('--email', prompt='Email')
+@click.option('--password', prompt='Mot de passe', hide_input=True, confirmation_prompt=True)
+@with_appcontext
+def create_admin(username, email, password):
+    """Crée un utilisateur administrateur (et les tables manquantes)."""
+    completer_schema(db.session.connection())
+    db.session.commit()
+    try:
+        creer_utilisateur(username, email, password)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Utilisateur administrateur '{username}' créé.")
+
+@click.command('startup-check')
+@click.option('--budget', type=float, default=None, help='Durée maximale (s) du démarrage à froid.')
+@click.option('--repetitions', default=3, show_default=True, help='Mesures effectuées ; la meilleure est retenue.')
+@with_appcontext
+def startup_check(budget, repetitions):
+    """Mesure le démarrage à froid de create_app et échoue au-delà du budget."""
+    budget = budget or current_app.config['STARTUP_BUDGET_SECONDS']
+    mesures = [mesurer_demarrage() for _ in range(max(repetitions, 1))]
+    secondes = min(duree for duree, _ in mesures)
+    modules = sorted({m for _, charges in mesures for m in charges})
+    click.echo(f"Démarrage à froid : {secondes:.2f} s (budget {budget:.2f} s)")
+    if modules:
+        raise click.ClickException(f"Modules lourds chargés au démarrage : {', '.join(modules)}")
+    if secondes > budget:
+        raise click.ClickException("Budget de démarrage dépassé.")
+
+@click.command('worker')
+@click.option('--once', is_flag=True, help="Vide la file d'attente, termine les tâches puis s'arrête.")
+@click.option('--batch-size', type=int, default=None, help='Nombre d\'emails réclamés par lot.')
+@click.option('--poll-interval', type=int, default=None, help='Pause (s) quand la file est vide.')
+@with_appcontext
+def worker(once, batch_size, poll_interval):
+    """Envoie les emails en attente dans la file (outbox) et exécute les exports et imports."""
+    outbox_worker = OutboxWorker(envoyer_email_func, batch_size=batch_size)
+    click.echo(f"Worker {outbox_worker.worker_id} démarré.")
+    try:
+        outbox_worker.executer(poll_interval=poll_interval, once=once)
+    except KeyboardInterrupt:
+        click.echo("Worker arrêté.")
+
+@click.command('scheduler')
+@with_appcontext
+def scheduler():
+    """Lance le planificateur des tâches périodiques au premier plan (quel que soit SCHEDULER_ENABLED)."""
+    leader_scheduler = current_app.extensions['scheduler']
+    click.echo(f"Candidat au planificateur : {leader_scheduler.lock.owner}")
+    try:
+        leader_scheduler.attendre()
+    except KeyboardInterrupt:
+        leader_scheduler.stop()
+        click.echo("Planificateur arrêté.")
+
+def register_commands(app):
+    app.cli.add_command(search_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(contents_cli)
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(startup_check)
+    app.cli.add_command(create_admin)
+    app.cli.add_command(worker)
+    app.cli.add_command(scheduler)
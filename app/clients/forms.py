@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, DateField, SubmitField, SelectField
-from wtforms.validators import DataRequired, Email
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import StringField, TextAreaField, DateField, SubmitField, SelectField, BooleanField, HiddenField, IntegerField
+from wtforms.validators import DataRequired, Email, NumberRange, Optional
 
 class ClientForm(FlaskForm):
     nom = StringField('Nom', validators=[DataRequired()])
@@ -11,3 +12,30 @@ class ClientForm(FlaskForm):
     notes = TextAreaField('Notes')
     statut = SelectField('Statut', choices=[('actif', 'Actif'), ('inactif', 'Inactif')])
     submit = SubmitField('Enregistrer')
+
+class ImportForm(FlaskForm):
+    fichier = FileField('Fichier CSV ou Excel', validators=[
+        FileRequired(), FileAllowed(['csv', 'xlsx'], 'Formats acceptés : CSV ou XLSX.')
+    ])
+    submit = SubmitField('Importer')
+
+class ActionsGroupeesForm(FlaskForm):
+    action = SelectField('Action', validators=[DataRequired()])
+    tous = BooleanField('Tous les clients du filtre')
+    search = HiddenField()
+    status = HiddenField()
+    statut = SelectField('Statut', choices=[('actif', 'Actif'), ('inactif', 'Inactif')], default='actif')
+    jours = IntegerField('Jours', validators=[Optional(), NumberRange(min=1, max=3650)])
+    template_id = SelectField('Template', coerce=int, validate_choice=False)
+    submit = SubmitField('Appliquer')
+
+def actions_groupees_form(search='', status_filter=''):
+    from ..actions import ACTIONS
+    from ..models import EmailTemplate
+    form = ActionsGroupeesForm(search=search, status=status_filter)
+    form.action.choices = ACTIONS
+    form.template_id.choices = [
+        (t.id, t.nom) for t in EmailTemplate.query.with_entities(EmailTemplate.id, EmailTemplate.nom)
+        .order_by(EmailTemplate.nom)
+    ]
+    return form
@@ -1,9 +1,12 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, current_app, send_file
 from flask_login import login_required
 from . import clients
 from .. import db
-from ..models import Client
-from .forms import ClientForm
+from .. import actions
+from ..imports import ErreurImport, lancer_import
+from ..models import Client, EmailTemplate, ImportJob
+from ..rendu import ErreurRendu
+from .forms import ClientForm, ImportForm, actions_groupees_form
 
 @clients.route('/ajouter_client', methods=['GET', 'POST'])
 @login_required
@@ -40,8 +43,87 @@ def modifier_client(id):
 @clients.route('/supprimer_client/<int:id>')
 @login_required
 def supprimer_client(id):
-    client = Client.query.get_or_404(id)
-    db.session.delete(client)
-    db.session.commit()
-    flash('Client supprimé avec succès!', 'success')
+    Client.query.get_or_404(id)
+    supprimes, _ = actions.supprimer(Client.id == id)
+    if supprimes:
+        flash('Client supprimé avec succès!', 'success')
+    else:
+        flash('Client conservé : il a un historique d\'emails.', 'warning')
     return redirect(url_for('main.index'))
+
+@clients.route('/clients/import', methods=['GET', 'POST'])
+@login_required
+def import_clients():
+    form = ImportForm()
+    if form.validate_on_submit():
+        try:
+            job = lancer_import(current_app._get_current_object(), form.fichier.data)
+        except ErreurImport as e:
+            flash(str(e), 'danger')
+        else:
+            return redirect(url_for('.import_status', job_id=job.id))
+    imports = ImportJob.query.order_by(ImportJob.created_at.desc()).limit(10).all()
+    return render_template('import_clients.html', form=form, imports=imports)
+
+@clients.route('/clients/import/<job_id>')
+@login_required
+def import_status(job_id):
+    job = ImportJob.query.get_or_404(job_id)
+    return render_template('import_status.html', job=job)
+
+@clients.route('/clients/import/<job_id>/erreurs')
+@login_required
+def import_erreurs(job_id):
+    job = ImportJob.query.get_or_404(job_id)
+    if not job.rapport_chemin:
+        return redirect(url_for('.import_status', job_id=job.id))
+    return send_file(
+        job.rapport_chemin,
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name=f'import_erreurs_{job.created_at.strftime("%Y%m%d_%H%M")}.csv'
+    )
+
+@clients.route('/clients/actions', methods=['POST'])
+@login_required
+def actions_groupees():
+    form = actions_groupees_form()
+    retour = redirect(url_for('main.index', search=form.search.data or None, status=form.status.data or None))
+    if not form.validate_on_submit():
+        flash('Action groupée invalide.', 'danger')
+        return retour
+
+    if form.tous.data:
+        condition = actions.condition_selection(search=form.search.data or '', status_filter=form.status.data or '')
+    else:
+        ids = request.form.getlist('ids', type=int)
+        if not ids:
+            flash('Aucun client sélectionné.', 'warning')
+            return retour
+        condition = actions.condition_selection(ids=ids)
+
+    action = form.action.data
+    if action == 'statut':
+        total = actions.changer_statut(condition, form.statut.data)
+        flash(f'Statut mis à jour pour {total} client(s).', 'success')
+    elif action == 'prolonger':
+        if not form.jours.data:
+            flash('Indiquez le nombre de jours de prolongation.', 'warning')
+            return retour
+        total = actions.prolonger(condition, form.jours.data)
+        flash(f'Expiration prolongée de {form.jours.data} jours pour {total} client(s).', 'success')
+    elif action == 'email':
+        template = EmailTemplate.query.get_or_404(form.template_id.data)
+        try:
+            total = actions.envoyer_template(condition, template)
+        except ErreurRendu as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return retour
+        flash(f'{total} email(s) mis en file d\'envoi.', 'success')
+    elif action == 'supprimer':
+        total, conserves = actions.supprimer(condition)
+        flash(f'{total} client(s) supprimé(s).', 'success')
+        if conserves:
+            flash(f'{conserves} client(s) conservé(s) : ils ont un historique d\'emails.', 'warning')
+    return retour
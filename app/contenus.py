@@ -0,0 +1,65 @@
+"""Stockage dédoublonné des corps d'emails.
+
+Chaque texte distinct est écrit une seule fois dans ``email_content``, sous
+son empreinte SHA-256 ; les lignes d'``EmailLog`` ne gardent que cette
+empreinte. Un envoi de rappels à des milliers de clients n'ajoute ainsi
+qu'un seul corps à la base.
+
+Sur une base existante, ``flask contents dedup`` complète le schéma
+(colonne ``email_log.content_hash``) puis convertit l'historique.
+"""
+import hashlib
+from sqlalchemy import update
+from .bulk import insert_on_conflict
+from .extensions import db
+from .models import EmailContent, EmailLog
+from .schema import completer_schema
+
+
+def empreinte(texte):
+    return hashlib.sha256(texte.encode('utf-8')).hexdigest()
+
+
+def stocker_contenus(connection, textes):
+    """Enregistre les ``textes`` absents de ``email_content`` ; retourne {texte: empreinte}."""
+    empreintes = {texte: empreinte(texte) for texte in set(textes)}
+    if empreintes:
+        connection.execute(
+            insert_on_conflict(EmailContent, ['hash'], bind=connection),
+            [{'hash': h, 'contenu': texte} for texte, h in empreintes.items()],
+        )
+    return empreintes
+
+
+def dedoublonner_historique(batch_size=1000):
+    """Déplace les corps encore stockés dans ``email_log`` vers ``email_content``.
+
+    Traite les lignes par lots et retourne le nombre de lignes converties.
+    """
+    completer_schema(db.session.connection())
+    db.session.commit()
+
+    total = 0
+    dernier_id = 0
+    while True:
+        lignes = db.session.execute(
+            db.select(EmailLog.id, EmailLog.contenu)
+            .where(EmailLog.content_hash.is_(None), EmailLog.contenu != '',
+                   EmailLog.id > dernier_id)
+            .order_by(EmailLog.id)
+            .limit(batch_size)
+        ).all()
+        if not lignes:
+            break
+        dernier_id = lignes[-1].id
+        connection = db.session.connection()
+        empreintes = stocker_contenus(connection, [ligne.contenu for ligne in lignes])
+        connection.execute(
+            update(EmailLog.__table__)
+            .where(EmailLog.__table__.c.id == db.bindparam('ident'))
+            .values(content_hash=db.bindparam('hash'), contenu=''),
+            [{'ident': ligne.id, 'hash': empreintes[ligne.contenu]} for ligne in lignes],
+        )
+        db.session.commit()
+        total += len(lignes)
+    return total
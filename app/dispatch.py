@@ -0,0 +1,164 @@
+"""Envoi concurrent d'emails par lots.
+
+Les envois sont répartis sur un pool de threads borné, avec une limite de
+connexions simultanées par serveur SMTP. Les ``EmailLog`` d'un lot sont
+écrits en une seule insertion groupée et un seul commit.
+
+Un ``Envoi`` avec des ``variables`` porte un gabarit : le sujet est rendu
+ici, le corps par ``send_func`` et l'historique garde le gabarit et les
+variables. Une erreur de rendu est un échec définitif.
+"""
+import json
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert
+from .extensions import db
+from .contenus import stocker_contenus
+from .models import EmailLog
+from .rendu import ErreurRendu, rendre_texte
+from .stats import comptabiliser_emails
+
+Envoi = namedtuple('Envoi', 'client_id email nom sujet message variables template_id',
+                   defaults=(None, None))
+Resultat = namedtuple('Resultat', 'envoi succes detail definitif', defaults=(False,))
+
+_limites_serveurs = {}
+_limites_lock = threading.Lock()
+
+
+def limite_serveur(hote, port, limite):
+    """Sémaphore partagé par tous les envois vers un même serveur SMTP."""
+    cle = (hote, port)
+    with _limites_lock:
+        if cle not in _limites_serveurs:
+            _limites_serveurs[cle] = threading.BoundedSemaphore(limite)
+        return _limites_serveurs[cle]
+
+
+class RapportEnvoi:
+    def __init__(self):
+        self.envoyes = 0
+        self.echecs = 0
+        self.erreurs = []
+        self.debut = time.monotonic()
+        self.fin = None
+
+    @property
+    def total(self):
+        return self.envoyes + self.echecs
+
+    @property
+    def duree(self):
+        return (self.fin or time.monotonic()) - self.debut
+
+    @property
+    def debit(self):
+        duree = self.duree
+        return self.total / duree if duree > 0 else 0.0
+
+    def ajouter(self, resultat):
+        if resultat.succes:
+            self.envoyes += 1
+        else:
+            self.echecs += 1
+            self.erreurs.append((resultat.envoi.client_id, resultat.detail))
+
+    def terminer(self):
+        self.fin = time.monotonic()
+        return self
+
+    def __str__(self):
+        return (f"{self.total} emails traités en {self.duree:.1f}s "
+                f"({self.debit:.1f}/s) : {self.envoyes} envoyés, {self.echecs} échecs")
+
+
+class DispatchEngine:
+    """Distribue des ``Envoi`` sur un pool de threads et journalise par lots.
+
+    Le pool est créé au premier envoi et réutilisé ensuite ; ``fermer`` l'arrête.
+    """
+
+    def __init__(self, send_func, max_workers=None, limite_par_serveur=None, app=None):
+        self.app = app or current_app._get_current_object()
+        config = self.app.config
+        self.send_func = send_func
+        self.max_workers = max_workers or config.get('DISPATCH_MAX_WORKERS', 8)
+        self.limite = limite_serveur(
+            config['SMTP_SERVER'],
+            config['SMTP_PORT'],
+            limite_par_serveur or config.get('SMTP_MAX_CONCURRENCY_PER_SERVER', 4),
+        )
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _envoyer(self, envoi):
+        with self.app.app_context():
+            try:
+                if envoi.variables is not None:
+                    envoi = envoi._replace(sujet=rendre_texte(envoi.sujet, envoi.variables))
+                with self.limite:
+                    succes, detail = self.send_func(envoi.email, envoi.nom, envoi.sujet,
+                                                    envoi.message, envoi.variables)
+            except ErreurRendu as e:
+                return Resultat(envoi, False, str(e), True)
+            except Exception as e:
+                succes, detail = False, f"Erreur lors de l'envoi: {str(e)}"
+        return Resultat(envoi, succes, detail)
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='dispatch')
+            return self._executor
+
+    def fermer(self):
+        """Arrête le pool après les envois en cours."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def envoyer(self, lot):
+        """Envoie un lot et retourne les ``Resultat`` dans l'ordre du lot."""
+        return list(self.executor.map(self._envoyer, lot))
+
+    def journaliser(self, resultats, commit=True):
+        if resultats:
+            maintenant = datetime.utcnow()
+            empreintes = stocker_contenus(db.session.connection(),
+                                          [r.envoi.message for r in resultats])
+            lignes = [
+                {
+                    'client_id': r.envoi.client_id,
+                    'sujet': r.envoi.sujet,
+                    'content_hash': empreintes[r.envoi.message],
+                    'variables': json.dumps(r.envoi.variables, ensure_ascii=False)
+                    if r.envoi.variables is not None else None,
+                    'template_id': r.envoi.template_id,
+                    'date_envoi': maintenant,
+                    'statut': 'envoyé' if r.succes else 'échec',
+                }
+                for r in resultats
+            ]
+            db.session.execute(insert(EmailLog), lignes)
+            # L'insertion groupée ne passe pas par les événements ORM
+            comptabiliser_emails(db.session.connection(),
+                                 [(l['date_envoi'], l['statut']) for l in lignes])
+        if commit:
+            db.session.commit()
+
+    def executer(self, lots):
+        """Envoie chaque lot (itérable de listes d'``Envoi``) et retourne le rapport."""
+        rapport = RapportEnvoi()
+        for lot in lots:
+            resultats = self.envoyer(lot)
+            self.journaliser(resultats)
+            for resultat in resultats:
+                rapport.ajouter(resultat)
+        return rapport.terminer()
@@ -1,12 +1,28 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SubmitField, FileField
-from wtforms.validators import DataRequired
+from wtforms import StringField, TextAreaField, SubmitField, FileField, HiddenField, SelectField, DateField, IntegerField
+from wtforms.validators import DataRequired, Length, NumberRange, Optional, ValidationError
 
 class EmailForm(FlaskForm):
     sujet = StringField('Sujet', validators=[DataRequired()])
     message = TextAreaField('Message', validators=[DataRequired()])
+    idempotency_key = HiddenField()
+    template_id = HiddenField()
     submit = SubmitField('Envoyer')
 
 class SignatureForm(FlaskForm):
     signature = FileField('Image de signature')
     submit = SubmitField('Télécharger')
+
+class CampagneForm(FlaskForm):
+    nom = StringField('Nom de la campagne', validators=[DataRequired(), Length(max=100)])
+    template_id = SelectField('Template', coerce=int)
+    statut = SelectField('Statut des clients', choices=[('', 'Tous'), ('actif', 'Actif'), ('inactif', 'Inactif')], default='actif')
+    expiration_min = DateField('Expiration à partir du', validators=[Optional()])
+    expiration_max = DateField("Expiration jusqu'au", validators=[Optional()])
+    recherche = StringField('Recherche', validators=[Optional(), Length(max=200)])
+    debit = IntegerField('Débit (emails par minute)', validators=[DataRequired(), NumberRange(min=1, max=100000)])
+    submit = SubmitField('Lancer la campagne')
+
+    def validate_expiration_max(self, field):
+        if field.data and self.expiration_min.data and field.data < self.expiration_min.data:
+            raise ValidationError("La fin de l'intervalle doit suivre son début.")
@@ -1,10 +1,17 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, abort
 from flask_login import login_required
 from . import emails
 from .. import db
-from ..models import Client, EmailTemplate, EmailLog
-from .forms import EmailForm, SignatureForm
-from ..email import envoyer_email_func, envoyer_rappels_automatiques_func
+from ..models import Campaign, Client, EmailTemplate, EmailLog, EmailLogArchive
+from .forms import CampagneForm, EmailForm, SignatureForm
+from ..email import envoyer_rappels_automatiques_func
+from ..archives import contenu_archive, page_archive
+from ..campagnes import annuler, creer_campagne, mettre_en_pause, progression, reprendre
+from ..outbox import enqueue, nouvelle_cle, stats_smtp_workers
+from ..pagination import keyset_paginate
+from ..rendu import VARIABLES, ErreurRendu, est_personnalise, rendre_texte, valider, variables_client
+from ..stats import total_emails
+import json
 import os
 from werkzeug.utils import secure_filename
 
@@ -14,20 +21,41 @@ def envoyer_email_client(id):
     client = Client.query.get_or_404(id)
     form = EmailForm()
     if form.validate_on_submit():
-        success, result = envoyer_email_func(
-            client.email, 
-            client.nom, 
-            form.sujet.data, 
-            form.message.data
-        )
-        if success:
-            flash('Email envoyé avec succès!', 'success')
+        sujet, message = form.sujet.data, form.message.data
+        variables = None
+        # Seul un message issu d'un template est un gabarit : un texte libre est envoyé tel quel
+        if form.template_id.data:
+            variables = variables_client(client)
+            try:
+                for source in (sujet, message):
+                    rendre_texte(source, variables)
+            except ErreurRendu as e:
+                flash(str(e), 'danger')
+                return render_template('envoyer_email.html', form=form, client=client,
+                                       sujet_prefill=sujet, message_prefill=message)
+            # Comme pour les templates, le worker rend le message avec les variables du client
+            variables = json.dumps(variables, ensure_ascii=False) \
+                if est_personnalise(sujet) or est_personnalise(message) else None
+        # La clé générée à l'affichage du formulaire évite un double envoi en cas de double soumission
+        if enqueue(client, sujet, message, idempotency_key=form.idempotency_key.data or None,
+                   variables=variables):
+            flash('Email mis en file d\'envoi!', 'success')
         else:
-            flash(f'Erreur lors de l\'envoi: {result}', 'error')
+            flash('Cet email a déjà été mis en file d\'envoi.', 'info')
         return redirect(url_for('main.index'))
+    if not form.idempotency_key.data:
+        form.idempotency_key.data = nouvelle_cle()
+    if not form.template_id.data:
+        form.template_id.data = request.args.get('template_id', '')
     sujet_prefill = request.args.get('sujet', '')
     message_prefill = request.args.get('message', '')
-    return render_template('envoyer_email.html', form=form, sujet_prefill=sujet_prefill, message_prefill=message_prefill)
+    return render_template('envoyer_email.html', form=form, client=client, sujet_prefill=sujet_prefill, message_prefill=message_prefill)
+
+@emails.route('/smtp/stats')
+@login_required
+def smtp_stats():
+    # Le pool SMTP est celui des processus ``flask worker``, pas du serveur web
+    return jsonify({'workers': stats_smtp_workers()})
 
 @emails.route('/rappels_automatiques')
 @login_required
@@ -37,8 +65,8 @@ def gerer_rappels():
 @emails.route('/envoyer_rappels_maintenant')
 @login_required
 def envoyer_rappels_maintenant():
-    envoyer_rappels_automatiques_func()
-    flash('Rappels envoyés!', 'success')
+    total = envoyer_rappels_automatiques_func()
+    flash(f'{total} rappel(s) mis en file d\'envoi!', 'success')
     return redirect(url_for('.gerer_rappels'))
 
 @emails.route('/signature', methods=['GET', 'POST'])
@@ -71,6 +99,12 @@ def ajouter_template():
         nom = request.form['nom']
         sujet = request.form['sujet']
         contenu = request.form['contenu']
+        try:
+            valider(sujet, contenu)
+        except ErreurRendu as e:
+            flash(str(e), 'danger')
+            return render_template('ajouter_template.html', variables=VARIABLES,
+                                   nom=nom, sujet=sujet, contenu=contenu)
         
         template = EmailTemplate(nom=nom, sujet=sujet, contenu=contenu)
         db.session.add(template)
@@ -79,21 +113,109 @@ def ajouter_template():
         flash('Template ajouté avec succès!', 'success')
         return redirect(url_for('.templates'))
     
-    return render_template('ajouter_template.html')
+    return render_template('ajouter_template.html', variables=VARIABLES)
 
 @emails.route('/templates/supprimer/<int:template_id>', methods=['DELETE'])
 @login_required
 def supprimer_template(template_id):
     template = EmailTemplate.query.get_or_404(template_id)
+    if Campaign.query.filter_by(template_id=template_id).first() is not None:
+        return jsonify({'success': False, 'error': 'Ce template est utilisé par une campagne.'}), 409
     db.session.delete(template)
     db.session.commit()
     return jsonify({'success': True})
 
+@emails.route('/campagnes')
+@login_required
+def campagnes():
+    liste = Campaign.query.order_by(Campaign.id.desc()).limit(50).all()
+    return render_template('campagnes.html', campagnes=liste,
+                           progressions={c.id: progression(c) for c in liste})
+
+@emails.route('/campagnes/nouvelle', methods=['GET', 'POST'])
+@login_required
+def nouvelle_campagne():
+    form = CampagneForm()
+    form.template_id.choices = [
+        (t.id, t.nom) for t in EmailTemplate.query.with_entities(EmailTemplate.id, EmailTemplate.nom)
+        .order_by(EmailTemplate.nom)
+    ]
+    if request.method == 'GET':
+        form.debit.data = current_app.config['CAMPAIGN_DEFAULT_RATE']
+    if form.validate_on_submit():
+        campagne = creer_campagne(
+            form.nom.data, db.session.get(EmailTemplate, form.template_id.data), form.debit.data,
+            statut=form.statut.data, recherche=(form.recherche.data or '').strip(),
+            expiration_min=form.expiration_min.data, expiration_max=form.expiration_max.data,
+        )
+        flash(f'Campagne lancée pour {campagne.total} destinataire(s).', 'success')
+        return redirect(url_for('.campagne', campagne_id=campagne.id))
+    return render_template('nouvelle_campagne.html', form=form)
+
+@emails.route('/campagnes/<int:campagne_id>')
+@login_required
+def campagne(campagne_id):
+    campagne = Campaign.query.get_or_404(campagne_id)
+    return render_template('campagne.html', campagne=campagne, progression=progression(campagne))
+
+@emails.route('/campagnes/<int:campagne_id>/progression')
+@login_required
+def campagne_progression(campagne_id):
+    return jsonify(progression(Campaign.query.get_or_404(campagne_id)))
+
+@emails.route('/campagnes/<int:campagne_id>/<action>', methods=['POST'])
+@login_required
+def campagne_action(campagne_id, action):
+    campagne = Campaign.query.get_or_404(campagne_id)
+    if action == 'pause':
+        mettre_en_pause(campagne)
+        flash('Campagne mise en pause.', 'info')
+    elif action == 'reprendre':
+        reprendre(campagne)
+        flash('Campagne reprise.', 'success')
+    elif action == 'annuler':
+        retires = annuler(campagne)
+        flash(f'Campagne annulée ({retires} email(s) retiré(s) de la file).', 'info')
+    else:
+        abort(404)
+    return redirect(url_for('.campagne', campagne_id=campagne_id))
+
 @emails.route('/historique')
 @login_required
 def historique():
-    page = request.args.get('page', 1, type=int)
-    logs = EmailLog.query.order_by(EmailLog.date_envoi.desc()).paginate(
-        page=page, per_page=20, error_out=False
+    archives = EmailLogArchive.query.order_by(EmailLogArchive.mois.desc()).all()
+    mois = request.args.get('mois', '')
+    archive = next((a for a in archives if a.mois == mois), None)
+    if archive is not None:
+        logs = page_archive(mois, current_app.config['EMAIL_LOGS_PER_PAGE'],
+                            curseur=request.args.get('cursor'))
+        return render_template('historique.html', logs=logs, total=archive.nombre,
+                               archives=archives, mois=mois)
+
+    # Le corps des emails n'est lu qu'à l'ouverture de la fenêtre (historique_contenu)
+    query = EmailLog.query.options(
+        db.defer(EmailLog.contenu),
+        db.joinedload(EmailLog.client).load_only(Client.nom, Client.email),
+    )
+    logs = keyset_paginate(
+        query, EmailLog.date_envoi, EmailLog.id,
+        current_app.config['EMAIL_LOGS_PER_PAGE'],
+        curseur=request.args.get('cursor'),
+        descendant=True
     )
-    return render_template('historique.html', logs=logs)
+    # Les cumuls comptent aussi les emails archivés
+    total = total_emails() - sum(archive.nombre for archive in archives)
+    return render_template('historique.html', logs=logs, total=total,
+                           archives=archives, mois='')
+
+@emails.route('/historique/<int:log_id>/contenu')
+@login_required
+def historique_contenu(log_id):
+    mois = request.args.get('mois')
+    if mois:
+        log = contenu_archive(mois, log_id)
+        if log is None:
+            abort(404)
+    else:
+        log = EmailLog.query.get_or_404(log_id)
+    return jsonify({'id': log.id, 'sujet': log.sujet, 'contenu': log.message_envoye})
@@ -0,0 +1,232 @@
+"""Exports de la liste des clients.
+
+Les lignes sont lues par paquets (``yield_per``, curseur côté serveur quand
+la base le permet) sous forme de tuples, sans instancier d'objets ORM, et
+écrites au fil de l'eau : la mémoire reste constante quelle que soit la
+taille de la table. openpyxl et reportlab ne sont chargés qu'au premier
+export (``moteurs``). Les gros exports PDF sont générés par ``flask worker``
+(voir ``taches``) ; le PDF lit les clients par lots paginés sur l'id, pour
+que le worker prolonge le bail de la tâche entre deux lots.
+"""
+import os
+import tempfile
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from sqlalchemy import update
+from .extensions import db
+from .models import Client, ExportJob
+from .moteurs import moteur
+from .queries import filtrer_clients
+
+EXCEL_COLUMNS = [
+    ('ID', Client.id),
+    ('Nom', Client.nom),
+    ('Email', Client.email),
+    ('Téléphone', Client.telephone),
+    ('Date d\'ajout', Client.date_ajout),
+    ('Date d\'expiration', Client.date_expiration),
+    ('Dernière visite', Client.date_derniere_visite),
+    ('Statut', Client.statut),
+    ('Notes', Client.notes),
+]
+
+EXCEL_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _format(valeur):
+    if valeur is None:
+        return ''
+    if hasattr(valeur, 'strftime'):
+        return valeur.strftime('%d/%m/%Y')
+    return valeur
+
+
+def lignes_clients(colonnes, search='', status_filter='', batch_size=1000):
+    """Itère sur les clients filtrés, par paquets de ``batch_size`` lignes."""
+    query = db.session.query(*colonnes)
+    query = filtrer_clients(query, search, status_filter)
+    return query.order_by(Client.id).yield_per(batch_size)
+
+
+def exporter_excel(search='', status_filter='', batch_size=1000):
+    """Écrit le classeur dans un fichier temporaire et le retourne, rembobiné."""
+    workbook = moteur('excel').Workbook(write_only=True)
+    feuille = workbook.create_sheet('Clients')
+    feuille.append([titre for titre, _ in EXCEL_COLUMNS])
+
+    colonnes = [colonne for _, colonne in EXCEL_COLUMNS]
+    for ligne in lignes_clients(colonnes, search, status_filter, batch_size):
+        feuille.append([_format(valeur) for valeur in ligne])
+
+    fichier = tempfile.TemporaryFile()
+    workbook.save(fichier)
+    fichier.seek(0)
+    return fichier
+
+
+PDF_COLUMNS = [
+    ('Nom', Client.nom, 130, 28),
+    ('Email', Client.email, 170, 36),
+    ('Téléphone', Client.telephone, 90, 20),
+    ('Statut', Client.statut, 60, 12),
+    ('Expiration', Client.date_expiration, 90, 12),
+]
+
+PDF_ROWS_PER_PAGE = 35
+PDF_MARGIN = 36
+# Pages écrites entre deux signes de vie d'un export du worker
+PDF_PAGES_PAR_LOT = 20
+
+
+@lru_cache(maxsize=None)
+def _style_table():
+    pdf = moteur('pdf')
+    colors = pdf.colors
+    return pdf.TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+
+
+def _cellule(valeur, largeur_max):
+    valeur = str(_format(valeur))
+    if len(valeur) > largeur_max:
+        return valeur[:largeur_max - 1] + '…'
+    return valeur
+
+
+def _dessiner_page(pdf, lignes, page):
+    """Une table par page, avec sa ligne d'en-tête, dessinée directement sur le canvas."""
+    moteur_pdf = moteur('pdf')
+    largeur, hauteur = moteur_pdf.letter
+    data = [[titre for titre, _, _, _ in PDF_COLUMNS]] + lignes
+    table = moteur_pdf.Table(data, colWidths=[l for _, _, l, _ in PDF_COLUMNS], repeatRows=1)
+    table.setStyle(_style_table())
+    _, hauteur_table = table.wrapOn(pdf, largeur - 2 * PDF_MARGIN, hauteur - 2 * PDF_MARGIN)
+    table.drawOn(pdf, PDF_MARGIN, hauteur - PDF_MARGIN - hauteur_table)
+    pdf.setFont('Helvetica', 8)
+    pdf.drawRightString(largeur - PDF_MARGIN, PDF_MARGIN / 2, f'Page {page}')
+    pdf.showPage()
+
+
+def lots_clients(colonnes, search='', status_filter='', batch_size=1000):
+    """Comme ``lignes_clients``, en listes de ``batch_size`` lignes lues chacune par sa requête.
+
+    Les lots sont paginés sur l'id : aucune requête ne reste ouverte entre
+    deux lots, la session peut valider une transaction entre-temps.
+    """
+    dernier_id = 0
+    while True:
+        query = filtrer_clients(db.session.query(Client.id, *colonnes), search, status_filter)
+        lot = query.filter(Client.id > dernier_id).order_by(Client.id).limit(batch_size).all()
+        if not lot:
+            return
+        dernier_id = lot[-1][0]
+        yield [ligne[1:] for ligne in lot]
+
+
+def ecrire_pdf(fichier, search='', status_filter='', signe_de_vie=None, pages_par_lot=None):
+    """Écrit l'export PDF dans ``fichier``, une page à la fois.
+
+    Les clients sont lus par lots de ``pages_par_lot`` pages ;
+    ``signe_de_vie()`` est appelé après chaque lot.
+    """
+    moteur_pdf = moteur('pdf')
+    pdf = moteur_pdf.canvas.Canvas(fichier, pagesize=moteur_pdf.letter, pageCompression=1)
+    colonnes = [colonne for _, colonne, _, _ in PDF_COLUMNS]
+    largeurs = [largeur_max for _, _, _, largeur_max in PDF_COLUMNS]
+    taille_lot = (pages_par_lot or PDF_PAGES_PAR_LOT) * PDF_ROWS_PER_PAGE
+    page, lignes = 1, []
+    for lot in lots_clients(colonnes, search, status_filter, taille_lot):
+        for ligne in lot:
+            lignes.append([_cellule(v, l) for v, l in zip(ligne, largeurs)])
+            if len(lignes) == PDF_ROWS_PER_PAGE:
+                _dessiner_page(pdf, lignes, page)
+                page, lignes = page + 1, []
+        if signe_de_vie is not None:
+            signe_de_vie()
+    if lignes or page == 1:
+        _dessiner_page(pdf, lignes, page)
+    pdf.save()
+
+
+def exporter_pdf(search='', status_filter='', spool_max_size=8 * 1024 * 1024):
+    """Génère le PDF dans un fichier temporaire (en mémoire jusqu'à ``spool_max_size``)."""
+    fichier = tempfile.SpooledTemporaryFile(max_size=spool_max_size)
+    ecrire_pdf(fichier, search, status_filter)
+    fichier.seek(0)
+    return fichier
+
+
+def depasse_seuil(search, status_filter, seuil):
+    """Vrai si l'export comporte plus de ``seuil`` clients (sans tout compter)."""
+    query = filtrer_clients(db.session.query(Client.id), search, status_filter)
+    return db.session.query(query.limit(seuil + 1).subquery()).count() > seuil
+
+
+class ExportRepris(Exception):
+    """L'``ExportJob`` n'appartient plus à ce worker (marqué interrompu entre-temps)."""
+
+
+def _prolonger_bail(job_id, worker_id, **valeurs):
+    """Met à jour la tâche si ce worker l'exécute toujours ; sinon lève ``ExportRepris``."""
+    resultat = db.session.execute(
+        update(ExportJob)
+        .where(ExportJob.id == job_id, ExportJob.statut == 'running',
+               ExportJob.verrouille_par == worker_id)
+        .values(verrouille_a=datetime.utcnow(), **valeurs)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if not resultat.rowcount:
+        raise ExportRepris(job_id)
+
+
+def generer_export(app, job_id):
+    """Génère le PDF d'un ``ExportJob`` réclamé par le worker.
+
+    Le bail de la tâche (``verrouille_a``) est prolongé tous les
+    ``PDF_PAGES_PAR_LOT`` pages, comme l'import à chaque lot. Une tâche
+    marquée interrompue entre-temps est abandonnée sans toucher à son statut.
+    """
+    with app.app_context():
+        job = db.session.get(ExportJob, job_id)
+        chemin, worker_id = job.chemin, job.verrouille_par
+        try:
+            os.makedirs(os.path.dirname(chemin), exist_ok=True)
+            with open(chemin, 'wb') as fichier:
+                ecrire_pdf(fichier, job.search or '', job.status_filter or '',
+                           signe_de_vie=lambda: _prolonger_bail(job_id, worker_id))
+            _prolonger_bail(job_id, worker_id, statut='done', termine_a=datetime.utcnow())
+        except ExportRepris:
+            db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            try:
+                _prolonger_bail(job_id, worker_id, statut='failed', erreur=str(e),
+                                termine_a=datetime.utcnow())
+            except ExportRepris:
+                db.session.rollback()
+
+
+def lancer_export_pdf(app, search='', status_filter=''):
+    """Crée un ``ExportJob`` en attente ; ``flask worker`` génère le PDF."""
+    token = uuid.uuid4().hex
+    job = ExportJob(
+        id=token,
+        format='pdf',
+        search=search,
+        status_filter=status_filter,
+        chemin=os.path.join(app.config['EXPORT_DIR'], f'{token}.pdf'),
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
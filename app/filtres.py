@@ -0,0 +1,13 @@
+"""Filtres Jinja de l'application."""
+from markupsafe import Markup, escape
+
+
+def nl2br(texte):
+    """Retours à la ligne en ``<br>``, le texte lui-même restant échappé."""
+    if not texte:
+        return ''
+    return Markup('<br>\n').join(escape(texte).split('\n'))
+
+
+def register_filters(app):
+    app.add_template_filter(nl2br, 'nl2br')
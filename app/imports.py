@@ -0,0 +1,265 @@
+"""Import de clients depuis un fichier CSV ou XLSX.
+
+Le fichier est lu en flux (``csv`` ou openpyxl en lecture seule) et chaque
+ligne est validée avec les règles de ``ClientForm``. Les lignes valides
+sont écrites par lots de ``IMPORT_BATCH_SIZE`` : les clients déjà connus
+(même email, sans tenir compte de la casse) sont mis à jour par un upsert
+``INSERT ... ON CONFLICT (id)``, les nouveaux insérés en une instruction.
+Ces écritures groupées ne déclenchent pas les événements ORM : l'index de
+recherche et les cumuls statistiques sont mis à jour ici, lot par lot.
+L'import est exécuté par ``flask worker`` (voir ``taches``).
+"""
+import csv
+import os
+import uuid
+from collections import Counter
+from datetime import date, datetime
+from sqlalchemy import func, insert
+from werkzeug.datastructures import MultiDict
+from .bulk import insert_on_conflict
+from .extensions import db
+from .models import Client, ImportJob
+from .moteurs import moteur
+from .search import indexer, normaliser_texte
+from .stats import appliquer_deltas_clients, dashboard_cache, deltas_client
+
+EXTENSIONS = ('.csv', '.xlsx')
+
+CHAMPS = ('nom', 'email', 'telephone', 'date_derniere_visite', 'date_expiration', 'notes', 'statut')
+CHAMPS_DATE = ('date_derniere_visite', 'date_expiration')
+
+# En-têtes reconnus (normalisés sans accents ni casse), dont ceux de l'export Excel
+EN_TETES = {
+    'nom': 'nom',
+    'email': 'email',
+    'e-mail': 'email',
+    'telephone': 'telephone',
+    'tel': 'telephone',
+    'date derniere visite': 'date_derniere_visite',
+    'derniere visite': 'date_derniere_visite',
+    'date_derniere_visite': 'date_derniere_visite',
+    "date d'expiration": 'date_expiration',
+    'date expiration': 'date_expiration',
+    'expiration': 'date_expiration',
+    'date_expiration': 'date_expiration',
+    'notes': 'notes',
+    'statut': 'statut',
+}
+
+FORMATS_DATE = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y')
+
+
+class ErreurImport(ValueError):
+    pass
+
+
+def _champ(en_tete):
+    return EN_TETES.get(normaliser_texte(str(en_tete or '')).strip())
+
+
+def _lignes_csv(chemin):
+    with open(chemin, newline='', encoding='utf-8-sig') as fichier:
+        echantillon = fichier.read(4096)
+        fichier.seek(0)
+        try:
+            dialecte = csv.Sniffer().sniff(echantillon, delimiters=',;\t')
+        except csv.Error:
+            dialecte = csv.excel
+        yield from csv.reader(fichier, dialecte)
+
+
+def _lignes_xlsx(chemin):
+    classeur = moteur('excel').load_workbook(chemin, read_only=True, data_only=True)
+    try:
+        yield from classeur.worksheets[0].iter_rows(values_only=True)
+    finally:
+        classeur.close()
+
+
+def lire_fichier(chemin):
+    """Itère sur (numéro de ligne, {champ: valeur}) ; la première ligne est l'en-tête."""
+    if chemin.lower().endswith('.xlsx'):
+        lignes = _lignes_xlsx(chemin)
+    else:
+        lignes = _lignes_csv(chemin)
+    en_tetes = [_champ(titre) for titre in next(lignes, [])]
+    if 'email' not in en_tetes or 'nom' not in en_tetes:
+        raise ErreurImport("Le fichier doit comporter au moins les colonnes Nom et Email.")
+    for numero, ligne in enumerate(lignes, start=2):
+        valeurs = {
+            champ: valeur for champ, valeur in zip(en_tetes, ligne)
+            if champ is not None
+        }
+        if any(v not in (None, '') for v in valeurs.values()):
+            yield numero, valeurs, [c for c in en_tetes if c]
+
+
+def _texte_date(valeur):
+    if isinstance(valeur, datetime):
+        return valeur.date().isoformat()
+    if isinstance(valeur, date):
+        return valeur.isoformat()
+    valeur = str(valeur).strip()
+    for format_date in FORMATS_DATE:
+        try:
+            return datetime.strptime(valeur, format_date).date().isoformat()
+        except ValueError:
+            continue
+    return valeur
+
+
+def valider_ligne(valeurs):
+    """Valide une ligne avec ``ClientForm`` ; retourne (données, erreurs)."""
+    from .clients.forms import ClientForm
+
+    formdata = MultiDict()
+    for champ, valeur in valeurs.items():
+        if valeur is None or str(valeur).strip() == '':
+            continue
+        formdata[champ] = _texte_date(valeur) if champ in CHAMPS_DATE else str(valeur).strip()
+    # Cellules vides absentes de ``donnees`` : un client existant garde ses valeurs
+    renseignes = set(formdata)
+    if 'statut' in formdata:
+        formdata['statut'] = formdata['statut'].lower()
+    else:
+        formdata['statut'] = 'actif'
+    form = ClientForm(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        erreurs = [
+            f"{form[champ].label.text} : {' '.join(messages)}"
+            for champ, messages in form.errors.items()
+        ]
+        return None, erreurs
+    donnees = {champ: form[champ].data for champ in CHAMPS if champ in renseignes}
+    donnees['email'] = donnees['email'].lower()
+    return donnees, []
+
+
+def ecrire_lot(lot, colonnes):
+    """Upsert d'un lot {email: données} ; retourne (créés, mis à jour)."""
+    connection = db.session.connection()
+    existants = {
+        ligne.email_normalise: ligne for ligne in connection.execute(
+            db.select(Client.id, func.lower(Client.email).label('email_normalise'), Client.date_ajout,
+                      *[getattr(Client, champ) for champ in CHAMPS])
+            .where(func.lower(Client.email).in_(list(lot)))
+        )
+    }
+    nouveaux = [donnees for email, donnees in lot.items() if email not in existants]
+    modifies = [dict(donnees, id=existants[email].id) for email, donnees in lot.items() if email in existants]
+
+    deltas = Counter()
+    a_indexer = []
+    if nouveaux:
+        # Mêmes clés pour toutes les lignes de l'insertion groupée
+        lignes = [{champ: donnees.get(champ) for champ in CHAMPS} for donnees in nouveaux]
+        for ligne in lignes:
+            ligne['statut'] = ligne['statut'] or 'actif'
+        resultat = connection.execute(
+            insert(Client.__table__).returning(
+                Client.id, Client.nom, Client.email, Client.telephone,
+                Client.date_ajout, Client.date_expiration, Client.statut),
+            lignes,
+        )
+        for client in resultat:
+            a_indexer.append((client.id, client.nom, client.email, client.telephone))
+            deltas.update(deltas_client(client.date_ajout, client.date_expiration, client.statut, 1))
+
+    if modifies:
+        mises_a_jour = [c for c in colonnes if c in CHAMPS]
+        # Une cellule vide garde la valeur enregistrée
+        lignes = [
+            dict({champ: donnees.get(champ, getattr(existants[donnees['email']], champ))
+                  for champ in mises_a_jour}, id=donnees['id'])
+            for donnees in modifies
+        ]
+        connection.execute(
+            insert_on_conflict(Client, ['id'], update_columns=mises_a_jour, bind=connection),
+            lignes,
+        )
+        for ligne in lignes:
+            avant = existants[ligne['email']]
+            apres = {champ: ligne.get(champ, getattr(avant, champ, None))
+                     for champ in ('nom', 'telephone', 'date_expiration', 'statut')}
+            a_indexer.append((ligne['id'], apres['nom'], ligne['email'], apres['telephone']))
+            deltas.update(deltas_client(avant.date_ajout, avant.date_expiration, avant.statut, -1))
+            deltas.update(deltas_client(avant.date_ajout, apres['date_expiration'], apres['statut'], 1))
+
+    indexer(connection, a_indexer)
+    appliquer_deltas_clients(connection, deltas)
+    return len(nouveaux), len(modifies)
+
+
+def importer_fichier(job, batch_size=500):
+    """Importe le fichier de ``job`` en mettant à jour sa progression après chaque lot."""
+    job.statut = 'running'
+    db.session.commit()
+    rapport_chemin = os.path.splitext(job.chemin)[0] + '-erreurs.csv'
+    with open(rapport_chemin, 'w', newline='', encoding='utf-8-sig') as rapport_fichier:
+        rapport = csv.writer(rapport_fichier, delimiter=';')
+        rapport.writerow(['Ligne', 'Email', 'Erreurs'])
+        lot, colonnes = {}, []
+        for numero, valeurs, colonnes in lire_fichier(job.chemin):
+            job.lignes_lues += 1
+            donnees, erreurs = valider_ligne(valeurs)
+            if erreurs:
+                job.rejetees += 1
+                rapport.writerow([numero, valeurs.get('email') or '', ' | '.join(erreurs)])
+                continue
+            # Doublon dans le fichier : la dernière ligne l'emporte
+            lot[donnees['email']] = donnees
+            if len(lot) >= batch_size:
+                crees, mis_a_jour = ecrire_lot(lot, colonnes)
+                job.crees += crees
+                job.mis_a_jour += mis_a_jour
+                # Signe de vie pour la détection des tâches interrompues
+                job.verrouille_a = datetime.utcnow()
+                db.session.commit()
+                lot = {}
+        if lot:
+            crees, mis_a_jour = ecrire_lot(lot, colonnes)
+            job.crees += crees
+            job.mis_a_jour += mis_a_jour
+    job.rapport_chemin = rapport_chemin if job.rejetees else None
+    if not job.rejetees:
+        os.remove(rapport_chemin)
+    job.statut = 'done'
+    job.termine_a = datetime.utcnow()
+    db.session.commit()
+    dashboard_cache.invalidate()
+
+
+def executer_import(app, job_id):
+    """Importe le fichier d'un ``ImportJob`` réclamé par le worker, puis le supprime."""
+    with app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        chemin = job.chemin
+        try:
+            importer_fichier(job, app.config['IMPORT_BATCH_SIZE'])
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(ImportJob, job_id)
+            job.statut = 'failed'
+            job.erreur = str(e)
+            job.termine_a = datetime.utcnow()
+            db.session.commit()
+            dashboard_cache.invalidate()
+        finally:
+            if os.path.exists(chemin):
+                os.remove(chemin)
+
+
+def lancer_import(app, fichier):
+    """Enregistre le fichier téléversé et crée un ``ImportJob`` en attente pour ``flask worker``."""
+    nom_fichier = fichier.filename or 'import'
+    extension = os.path.splitext(nom_fichier)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ErreurImport("Formats acceptés : CSV ou XLSX.")
+    token = uuid.uuid4().hex
+    os.makedirs(app.config['IMPORT_DIR'], exist_ok=True)
+    chemin = os.path.join(app.config['IMPORT_DIR'], f'{token}{extension}')
+    fichier.save(chemin)
+    job = ImportJob(id=token, nom_fichier=nom_fichier, chemin=chemin)
+    db.session.add(job)
+    db.session.commit()
+    return job
@@ -1,118 +1,82 @@
-from flask import render_template, request, send_file, redirect, url_for, flash
+from flask import render_template, request, send_file, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from . import main
-from ..models import Client, EmailLog
-from datetime import datetime, timedelta
-import pandas as pd
-from io import BytesIO
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-from sqlalchemy import or_
+from ..models import Client, ExportJob
+from ..exports import EXCEL_MIMETYPE, depasse_seuil, exporter_excel, exporter_pdf, lancer_export_pdf
+from ..pagination import keyset_paginate
+from ..clients.forms import actions_groupees_form
+from ..stats import statistiques_dashboard
+from ..queries import CLIENT_SORT_COLUMNS, alert_class_expression, appliquer_recherche, filtrer_clients
+from datetime import datetime
 
 @main.route('/')
 @login_required
 def index():
     search = request.args.get('search', '')
     status_filter = request.args.get('status', '')
+    sort = request.args.get('sort', 'pertinence' if search else 'nom')
+    if sort not in CLIENT_SORT_COLUMNS and sort != 'pertinence':
+        sort = 'nom'
+    order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+    per_page = min(
+        request.args.get('per_page', current_app.config['CLIENTS_PER_PAGE'], type=int),
+        current_app.config['CLIENTS_MAX_PER_PAGE']
+    )
+    per_page = max(per_page, 1)
     
-    query = Client.query
-    
+    query = Client.query.add_columns(alert_class_expression())
+    rang = None
     if search:
-        query = query.filter(
-            or_(
-                Client.nom.contains(search),
-                Client.email.contains(search),
-                Client.telephone.contains(search)
-            )
-        )
-    
-    if status_filter:
-        query = query.filter(Client.statut == status_filter)
-    
-    clients = query.all()
+        query, rang = appliquer_recherche(query, search)
+    query = filtrer_clients(query, status_filter=status_filter)
+    
+    if sort == 'pertinence' and rang is not None:
+        # Les plus pertinents d'abord, quel que soit l'ordre demandé
+        query = query.add_columns(rang)
+        sort_column, descendant = rang, False
+        cle = lambda row: (row[2], row[0].id)
+    else:
+        if sort == 'pertinence':
+            sort = 'nom'
+        sort_column, descendant = CLIENT_SORT_COLUMNS[sort], order == 'desc'
+        cle = lambda row: (getattr(row[0], sort_column.key), row[0].id)
+    
+    page = keyset_paginate(
+        query, sort_column, Client.id, per_page,
+        curseur=request.args.get('cursor'),
+        descendant=descendant,
+        cle=cle
+    )
     
-    today = datetime.now().date()
-    for client in clients:
-        if client.date_expiration:
-            days_until_expiry = (client.date_expiration - today).days
-            if days_until_expiry <= 2:
-                client.alert_class = 'table-danger'
-            elif days_until_expiry <= 7:
-                client.alert_class = 'table-warning'
-            else:
-                client.alert_class = ''
-        else:
-            client.alert_class = ''
+    clients = []
+    for row in page.items:
+        client = row[0]
+        client.alert_class = row[1]
+        clients.append(client)
     
-    return render_template('index.html', clients=clients, search=search, status_filter=status_filter, datetime=datetime)
+    return render_template('index.html', clients=clients, page=page, search=search,
+                           status_filter=status_filter, sort=sort, order=order,
+                           per_page=per_page, datetime=datetime,
+                           actions_form=actions_groupees_form(search, status_filter))
 
 @main.route('/dashboard')
 @login_required
 def dashboard():
-    total_clients = Client.query.count()
-    clients_actifs = Client.query.filter_by(statut='actif').count()
-    clients_inactifs = Client.query.filter_by(statut='inactif').count()
-    
-    today = datetime.now().date()
-    expiring_soon = Client.query.filter(
-        Client.date_expiration <= today + timedelta(days=7),
-        Client.statut == 'actif'
-    ).count()
-    
-    six_months_ago = today - timedelta(days=180)
-    clients_recent = Client.query.filter(Client.date_ajout >= six_months_ago).all()
-    
-    monthly_data = {}
-    for client in clients_recent:
-        month_key = client.date_ajout.strftime('%Y-%m')
-        monthly_data[month_key] = monthly_data.get(month_key, 0) + 1
-    
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    emails_sent = EmailLog.query.filter(
-        EmailLog.date_envoi >= thirty_days_ago,
-        EmailLog.statut == 'envoyé'
-    ).count()
-    
-    return render_template('dashboard.html', 
-                         total_clients=total_clients,
-                         clients_actifs=clients_actifs,
-                         clients_inactifs=clients_inactifs,
-                         expiring_soon=expiring_soon,
-                         monthly_data=monthly_data,
-                         emails_sent=emails_sent)
+    stats = statistiques_dashboard(ttl=current_app.config['DASHBOARD_CACHE_TTL'])
+    return render_template('dashboard.html', **stats)
 
 @main.route('/export/excel')
 @login_required
 def export_excel():
-    clients = Client.query.all()
-    
-    data = []
-    for client in clients:
-        data.append({
-            'ID': client.id,
-            'Nom': client.nom,
-            'Email': client.email,
-            'Téléphone': client.telephone or '',
-            'Date d\'ajout': client.date_ajout.strftime('%d/%m/%Y') if client.date_ajout else '',
-            'Date d\'expiration': client.date_expiration.strftime('%d/%m/%Y') if client.date_expiration else '',
-            'Dernière visite': client.date_derniere_visite.strftime('%d/%m/%Y') if client.date_derniere_visite else '',
-            'Statut': client.statut,
-            'Notes': client.notes or ''
-        })
-    
-    df = pd.DataFrame(data)
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Clients', index=False)
-    
-    output.seek(0)
+    fichier = exporter_excel(
+        search=request.args.get('search', ''),
+        status_filter=request.args.get('status', '')
+    )
     
+    # Le fichier temporaire est envoyé par blocs puis fermé avec la réponse
     return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        fichier,
+        mimetype=EXCEL_MIMETYPE,
         as_attachment=True,
         download_name=f'clients_{datetime.now().strftime("%Y%m%d")}.xlsx'
     )
@@ -120,40 +84,38 @@ def export_excel():
 @main.route('/export/pdf')
 @login_required
 def export_pdf():
-    clients = Client.query.all()
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    
-    data = [['Nom', 'Email', 'Téléphone', 'Statut', 'Expiration']]
-    
-    for client in clients:
-        data.append([
-            client.nom,
-            client.email,
-            client.telephone or '',
-            client.statut,
-            client.date_expiration.strftime('%d/%m/%Y') if client.date_expiration else ''
-        ])
-    
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    search = request.args.get('search', '')
+    status_filter = request.args.get('status', '')
     
-    doc.build([table])
-    buffer.seek(0)
+    # Gros exports : génération en arrière-plan, lien de téléchargement à la fin
+    if depasse_seuil(search, status_filter, current_app.config['PDF_EXPORT_ASYNC_THRESHOLD']):
+        job = lancer_export_pdf(current_app._get_current_object(), search, status_filter)
+        flash('Export volumineux : le PDF est en cours de génération.', 'info')
+        return redirect(url_for('.export_status', job_id=job.id))
     
+    fichier = exporter_pdf(search, status_filter, current_app.config['PDF_SPOOL_MAX_SIZE'])
     return send_file(
-        buffer,
+        fichier,
         mimetype='application/pdf',
         as_attachment=True,
         download_name=f'clients_{datetime.now().strftime("%Y%m%d")}.pdf'
     )
+
+@main.route('/exports/<job_id>')
+@login_required
+def export_status(job_id):
+    job = ExportJob.query.get_or_404(job_id)
+    return render_template('export_status.html', job=job)
+
+@main.route('/exports/<job_id>/telecharger')
+@login_required
+def telecharger_export(job_id):
+    job = ExportJob.query.get_or_404(job_id)
+    if job.statut != 'done':
+        return redirect(url_for('.export_status', job_id=job.id))
+    return send_file(
+        job.chemin,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'clients_{job.created_at.strftime("%Y%m%d")}.pdf'
+    )
@@ -0,0 +1,168 @@
+"""Construction des messages MIME pour les envois en nombre.
+
+Tout ce qui ne dépend pas du destinataire est préparé une seule fois par
+message : en-têtes, gabarits des corps texte et HTML, structure multipart
+et partie image de la signature, déjà encodée en base64. Le message peut
+être un gabarit personnalisé (voir ``rendu``) : tous les destinataires d'un
+template partagent alors le même builder. Pour chaque destinataire il ne
+reste qu'à rendre le gabarit avec ses variables, insérer son nom et le
+sujet, encoder les deux corps et concaténer.
+"""
+import base64
+import os
+import threading
+import uuid
+from email.header import Header
+from email.mime.image import MIMEImage
+from functools import lru_cache
+from .rendu import rendre_texte
+
+SIGNATURE_PATH = os.path.join('static', 'images', 'signature.png')
+
+GABARIT_HTML = """
+        <html>
+        <body>
+            <p>Bonjour {destinataire_nom},</p>
+            <br>
+            <p>{message}</p>
+            <br>
+            <p>Cordialement,<br>
+            Votre équipe</p>
+            <br>
+            <img src="cid:signature" style="max-width: 300px; height: auto;">
+        </body>
+        </html>
+        """
+
+GABARIT_TEXTE = """
+        Bonjour {destinataire_nom},
+
+        {message}
+
+        Cordialement,
+        """
+
+
+class SignatureCache:
+    """Partie MIME de la signature, encodée une fois par version du fichier."""
+
+    def __init__(self, path=SIGNATURE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._key = None
+        self._part = None
+
+    def version(self):
+        """(mtime, taille) du fichier, ou None s'il est absent ou vide."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        if stat.st_size == 0:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def part(self, version=None):
+        version = version or self.version()
+        if version is None:
+            return None
+        with self._lock:
+            if self._key != version:
+                with open(self.path, 'rb') as f:
+                    image = MIMEImage(f.read())
+                image.add_header('Content-ID', '<signature>')
+                image.add_header('Content-Disposition', 'inline', filename='signature.png')
+                self._part = image.as_string()
+                self._key = version
+            return self._part
+
+
+signature_cache = SignatureCache()
+
+
+def _base64(texte):
+    return base64.encodebytes(texte.encode('utf-8')).decode('ascii')
+
+
+def _boundary():
+    return '===============' + uuid.uuid4().hex + '=='
+
+
+def _gabarits(message):
+    """Gabarits texte et HTML du corps, où il ne reste qu'à insérer le nom."""
+    # On double les accolades du message pour qu'il ne soit pas réinterprété par format()
+    message_texte = message.replace('{', '{{').replace('}', '}}')
+    message_html = message_texte.replace(chr(10), '<br>')
+    return GABARIT_TEXTE.replace('{message}', message_texte), GABARIT_HTML.replace('{message}', message_html)
+
+
+@lru_cache(maxsize=256)
+def _sujet_encode(sujet):
+    return Header(sujet, 'utf-8').encode()
+
+
+class MessageBuilder:
+    """Squelette MIME précompilé pour un message (texte fixe ou gabarit)."""
+
+    def __init__(self, expediteur, message, signature_part=None):
+        self.expediteur = expediteur
+        self.message = message
+        # Sans variables, le message est inséré dans les gabarits une fois pour toutes
+        self.gabarit_texte, self.gabarit_html = _gabarits(message)
+
+        related, alternative = _boundary(), _boundary()
+        self.entete = (
+            f'Content-Type: multipart/related; boundary="{related}"\n'
+            'MIME-Version: 1.0\n'
+            f'From: {expediteur}\n'
+        )
+        self.suite_entete = (
+            '\n'
+            f'--{related}\n'
+            f'Content-Type: multipart/alternative; boundary="{alternative}"\n'
+            'MIME-Version: 1.0\n'
+            '\n'
+        )
+        entete_partie = (
+            'Content-Type: text/{sous_type}; charset="utf-8"\n'
+            'MIME-Version: 1.0\n'
+            'Content-Transfer-Encoding: base64\n'
+            '\n'
+        )
+        self.debut_texte = f'--{alternative}\n' + entete_partie.format(sous_type='plain')
+        self.debut_html = f'--{alternative}\n' + entete_partie.format(sous_type='html')
+        fin = f'--{alternative}--\n'
+        if signature_part:
+            fin += f'\n--{related}\n{signature_part}\n'
+        fin += f'--{related}--\n'
+        self.fin = fin
+
+    def build(self, destinataire_email, destinataire_nom, sujet, variables=None):
+        """Retourne le message complet (str) prêt pour ``sendmail``.
+
+        Avec ``variables``, le message est rendu pour ce destinataire (ErreurRendu).
+        """
+        gabarit_texte, gabarit_html = self.gabarit_texte, self.gabarit_html
+        if variables is not None:
+            gabarit_texte, gabarit_html = _gabarits(rendre_texte(self.message, variables))
+        corps_texte = gabarit_texte.format(destinataire_nom=destinataire_nom)
+        corps_html = gabarit_html.format(destinataire_nom=destinataire_nom)
+        return ''.join((
+            self.entete,
+            'To: ', destinataire_email, '\n',
+            'Subject: ', _sujet_encode(sujet), '\n',
+            self.suite_entete,
+            self.debut_texte, _base64(corps_texte), '\n',
+            self.debut_html, _base64(corps_html), '\n',
+            self.fin,
+        ))
+
+
+@lru_cache(maxsize=64)
+def _builder(expediteur, message, signature_version):
+    return MessageBuilder(expediteur, message, signature_cache.part(signature_version))
+
+
+def message_builder(expediteur, message):
+    """Builder partagé pour ``message`` ; reconstruit si la signature change."""
+    return _builder(expediteur, message, signature_cache.version())
@@ -1,5 +1,10 @@
+import time
 from .extensions import db, bcrypt, login_manager
+from .cache import TTLCache, invalider_sur_ecriture
+from .rendu import rendre_enregistre
+from flask import current_app, session
 from flask_login import UserMixin
+from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime
 
 class Client(db.Model):
@@ -14,24 +19,251 @@ class Client(db.Model):
     statut = db.Column(db.String(20), default='actif')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_client_statut_date_expiration', 'statut', 'date_expiration'),
+        db.Index('ix_client_date_ajout', 'date_ajout', 'id'),
+        db.Index('ix_client_nom', 'nom', 'id'),
+        # Rapprochement des imports sur l'email, sans tenir compte de la casse
+        db.Index('ix_client_email_lower', db.func.lower(db.text('email'))),
+    )
+
 class EmailTemplate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nom = db.Column(db.String(100), nullable=False)
     sujet = db.Column(db.String(200), nullable=False)
     contenu = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class EmailContent(db.Model):
+    __tablename__ = 'email_content'
+
+    # Empreinte SHA-256 du texte : un même corps d'email n'est stocké qu'une fois
+    hash = db.Column(db.String(64), primary_key=True)
+    contenu = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class EmailLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
     sujet = db.Column(db.String(200), nullable=False)
-    contenu = db.Column(db.Text, nullable=False)
+    # Texte stocké dans la ligne (anciens emails) ; vide si content_hash référence email_content.
+    # Pour lire le corps quel que soit son stockage : ``message``
+    contenu = db.Column(db.Text, nullable=False, default='')
+    content_hash = db.Column(db.String(64), db.ForeignKey('email_content.hash'), index=True)
+    # Variables du destinataire (JSON) si le corps est un gabarit, rendu à l'affichage
+    variables = db.Column(db.Text)
+    template_id = db.Column(db.Integer)
     date_envoi = db.Column(db.DateTime, default=datetime.utcnow)
     statut = db.Column(db.String(20), default='envoyé')
     client = db.relationship('Client', backref=db.backref('emails', lazy=True))
+    corps = db.relationship('EmailContent')
+
+    __table_args__ = (
+        db.Index('ix_email_log_date_envoi', 'date_envoi', 'id'),
+        # Ids jamais réutilisés après l'archivage d'un mois : les archives dédoublonnent par id
+        {'sqlite_autoincrement': True},
+    )
+
+    @hybrid_property
+    def message(self):
+        """Corps de l'email, qu'il soit dans la ligne ou dans ``email_content``."""
+        if self.corps is not None:
+            return self.corps.contenu
+        return self.contenu
+
+    @message.expression
+    def message(cls):
+        return db.func.coalesce(
+            db.select(EmailContent.contenu)
+            .where(EmailContent.hash == cls.content_hash)
+            .scalar_subquery(),
+            cls.contenu,
+        )
+
+    @property
+    def message_envoye(self):
+        """Corps tel que le destinataire l'a reçu."""
+        return rendre_enregistre(self.message, self.variables)
+
+    def __repr__(self):
+        return f'<EmailLog {self.id} {self.statut}>'
+
+class EmailLogArchive(db.Model):
+    __tablename__ = 'email_log_archive'
+
+    # Mois archivé (AAAA-MM) et fichier JSONL compressé qui contient ses emails
+    mois = db.Column(db.String(7), primary_key=True)
+    chemin = db.Column(db.String(500), nullable=False)
+    nombre = db.Column(db.Integer, nullable=False, default=0)
+    envoyes = db.Column(db.Integer, nullable=False, default=0)
+    echecs = db.Column(db.Integer, nullable=False, default=0)
+    premier_envoi = db.Column(db.DateTime)
+    dernier_envoi = db.Column(db.DateTime)
+    archive_a = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    destinataire_email = db.Column(db.String(120), nullable=False)
+    destinataire_nom = db.Column(db.String(100), nullable=False)
+    sujet = db.Column(db.String(200), nullable=False)
+    contenu = db.Column(db.Text, nullable=False)
+    # Variables du destinataire (JSON) : sujet et contenu sont alors des gabarits,
+    # rendus par le worker au moment de l'envoi
+    variables = db.Column(db.Text)
+    template_id = db.Column(db.Integer)
+    idempotency_key = db.Column(db.String(128), unique=True, nullable=False)
+    statut = db.Column(db.String(20), nullable=False, default='pending')
+    tentatives = db.Column(db.Integer, nullable=False, default=0)
+    prochaine_tentative = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    derniere_erreur = db.Column(db.Text)
+    verrouille_par = db.Column(db.String(64))
+    verrouille_a = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'))
+    client = db.relationship('Client')
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_statut_prochaine_tentative', 'statut', 'prochaine_tentative'),
+        db.Index('ix_email_outbox_campaign_statut', 'campaign_id', 'statut'),
+    )
 
     def __repr__(self):
-        return f'<Client {self.nom}>'
+        return f'<EmailOutbox {self.id} {self.statut}>'
+
+class ExportJob(db.Model):
+    __tablename__ = 'export_job'
+
+    id = db.Column(db.String(32), primary_key=True)
+    format = db.Column(db.String(10), nullable=False)
+    search = db.Column(db.String(200))
+    status_filter = db.Column(db.String(20))
+    statut = db.Column(db.String(20), nullable=False, default='pending')
+    chemin = db.Column(db.String(500), nullable=False)
+    erreur = db.Column(db.Text)
+    # Worker (hôte:pid) qui exécute la tâche, et dernier signe de vie
+    verrouille_par = db.Column(db.String(64))
+    verrouille_a = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    termine_a = db.Column(db.DateTime)
+
+class ImportJob(db.Model):
+    __tablename__ = 'import_job'
+
+    id = db.Column(db.String(32), primary_key=True)
+    nom_fichier = db.Column(db.String(255), nullable=False)
+    chemin = db.Column(db.String(500), nullable=False)
+    statut = db.Column(db.String(20), nullable=False, default='pending')
+    lignes_lues = db.Column(db.Integer, nullable=False, default=0)
+    crees = db.Column(db.Integer, nullable=False, default=0)
+    mis_a_jour = db.Column(db.Integer, nullable=False, default=0)
+    rejetees = db.Column(db.Integer, nullable=False, default=0)
+    # Rapport CSV des lignes rejetées (numéro de ligne, email, erreurs)
+    rapport_chemin = db.Column(db.String(500))
+    erreur = db.Column(db.Text)
+    verrouille_par = db.Column(db.String(64))
+    verrouille_a = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    termine_a = db.Column(db.DateTime)
+
+class Campaign(db.Model):
+    __tablename__ = 'campaign'
+
+    id = db.Column(db.Integer, primary_key=True)
+    nom = db.Column(db.String(100), nullable=False)
+    template_id = db.Column(db.Integer, db.ForeignKey('email_template.id'), nullable=False)
+    statut = db.Column(db.String(20), nullable=False, default='running')
+    # Filtre d'audience, appliqué une seule fois à la création (instantané)
+    filtre_statut = db.Column(db.String(20))
+    filtre_recherche = db.Column(db.String(200))
+    expiration_min = db.Column(db.Date)
+    expiration_max = db.Column(db.Date)
+    # Débit maximal, en emails par minute
+    debit = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    mis_en_file = db.Column(db.Integer, nullable=False, default=0)
+    ignores = db.Column(db.Integer, nullable=False, default=0)
+    # Dernier client_id mis en file : les destinataires sont parcourus par id croissant
+    curseur = db.Column(db.Integer, nullable=False, default=0)
+    derniere_alimentation = db.Column(db.DateTime)
+    erreur = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    termine_a = db.Column(db.DateTime)
+    template = db.relationship('EmailTemplate')
+
+class CampaignRecipient(db.Model):
+    __tablename__ = 'campaign_recipient'
+
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), primary_key=True)
+    # Sans clé étrangère : supprimer un client ne doit pas être bloqué par une campagne passée
+    client_id = db.Column(db.Integer, primary_key=True)
+
+class ReminderWatermark(db.Model):
+    __tablename__ = 'reminder_watermark'
+
+    # Délai du rappel en jours avant expiration (J-30, J-7, J-2...)
+    lead_days = db.Column(db.Integer, primary_key=True)
+    # Dernière date d'expiration déjà traitée pour ce délai
+    derniere_date = db.Column(db.Date, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class WorkerStatus(db.Model):
+    __tablename__ = 'worker_status'
+
+    # Processus ``flask worker`` (hôte:pid) et compteurs de son pool SMTP (JSON)
+    worker_id = db.Column(db.String(64), primary_key=True)
+    smtp_stats = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class SchedulerLock(db.Model):
+    __tablename__ = 'scheduler_lock'
+
+    name = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(128))
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class LoginAttempt(db.Model):
+    """Tentative de connexion comptée par le limiteur (backend 'base')."""
+    __tablename__ = 'login_attempt'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cle = db.Column(db.String(200), nullable=False)
+    instant = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_login_attempt_cle_instant', 'cle', 'instant'),
+        db.Index('ix_login_attempt_instant', 'instant'),
+    )
+
+class DailyClientStats(db.Model):
+    __tablename__ = 'daily_client_stats'
+
+    jour = db.Column(db.Date, primary_key=True)
+    statut = db.Column(db.String(20), primary_key=True)
+    # Clients ajoutés ce jour-là / expirant ce jour-là, ayant actuellement ce statut
+    ajouts = db.Column(db.Integer, nullable=False, default=0)
+    expirations = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyEmailStats(db.Model):
+    __tablename__ = 'daily_email_stats'
+
+    jour = db.Column(db.Date, primary_key=True)
+    statut = db.Column(db.String(20), primary_key=True)
+    nombre = db.Column(db.Integer, nullable=False, default=0)
+
+def hacher_mot_de_passe(password):
+    return bcrypt.generate_password_hash(password).decode('utf-8')
+
+def cout_bcrypt(password_hash):
+    """Facteur de coût d'un hash bcrypt ('$2b$12$...' -> 12), None s'il est illisible."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -41,14 +273,81 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = hacher_mot_de_passe(password)
     
     def check_password(self, password):
         return bcrypt.check_password_hash(self.password_hash, password)
+
+    def doit_rehacher(self):
+        """Vrai si le hash n'a pas le facteur de coût configuré (BCRYPT_LOG_ROUNDS)."""
+        return cout_bcrypt(self.password_hash) != current_app.config['BCRYPT_LOG_ROUNDS']
     
     def __repr__(self):
         return f'<User {self.username}>'
 
+def creer_utilisateur(username, email, password):
+    """Crée et enregistre un utilisateur ; lève ValueError si le nom ou l'email est déjà pris."""
+    if User.query.filter_by(username=username).first():
+        raise ValueError(f"L'utilisateur '{username}' existe déjà.")
+    if User.query.filter_by(email=email).first():
+        raise ValueError(f"L'email '{email}' est déjà utilisé.")
+    user = User(username=username, email=email)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+class UtilisateurConnecte(UserMixin):
+    """Instantané de l'utilisateur connecté (``current_user``), détaché de la session ORM.
+
+    Pour modifier l'utilisateur, le recharger avec ``db.session.get(User, current_user.id)``.
+    """
+
+    def __init__(self, id, username, email):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    def claims(self):
+        return {'id': self.id, 'username': self.username, 'email': self.email}
+
+    def __repr__(self):
+        return f'<UtilisateurConnecte {self.username}>'
+
+# Instantanés par id, vidés à chaque écriture sur User dans ce processus ;
+# les autres processus les voient au plus tard après USER_CACHE_TTL
+utilisateurs_cache = TTLCache()
+invalider_sur_ecriture(utilisateurs_cache, User)
+
+CLE_SESSION = '_utilisateur'
+
+def instantane_utilisateur(user_id):
+    ligne = db.session.execute(
+        db.select(User.id, User.username, User.email).where(User.id == user_id)
+    ).first()
+    return UtilisateurConnecte(*ligne) if ligne else None
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """Utilisateur de la requête, sans lecture de la table ``user`` dans la plupart des cas.
+
+    Dans l'ordre : les claims signés de la session tant qu'ils n'ont pas
+    expiré, puis le cache du processus, puis la base. Les claims sont
+    rafraîchis à chaque lecture hors session, au plus une fois par
+    USER_CACHE_TTL et par utilisateur connecté.
+    """
+    user_id = int(user_id)
+    claims = session.get(CLE_SESSION)
+    if claims and claims['id'] == user_id and claims['expire'] > time.time():
+        return UtilisateurConnecte(claims['id'], claims['username'], claims['email'])
+
+    config = current_app.config
+    utilisateur = utilisateurs_cache.get(user_id)
+    if utilisateur is None:
+        utilisateur = instantane_utilisateur(user_id)
+        if utilisateur is None:
+            session.pop(CLE_SESSION, None)
+            return None
+        utilisateurs_cache.set(user_id, utilisateur, ttl=config['USER_CACHE_TTL'])
+    session[CLE_SESSION] = dict(utilisateur.claims(), expire=time.time() + config['USER_CACHE_TTL'])
+    return utilisateur
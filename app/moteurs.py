@@ -0,0 +1,86 @@
+"""Chargement différé des bibliothèques lourdes.
+
+openpyxl et reportlab ne servent qu'aux exports et aux imports de
+fichiers. Les importer avec l'application coûterait du temps de démarrage
+et de la mémoire à chaque worker et à chaque commande ``flask`` : ils sont
+enregistrés ici comme moteurs, importés à la première utilisation de
+``moteur(nom)`` puis gardés pour le reste du processus.
+
+``mesurer_demarrage`` mesure le démarrage à froid de ``create_app`` dans un
+interpréteur neuf (``flask startup-check``).
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+from types import SimpleNamespace
+
+# Modules qui ne doivent pas être chargés par create_app
+MODULES_DIFFERES = ('openpyxl', 'reportlab', 'pandas', 'numpy', 'matplotlib', 'seaborn')
+
+_chargeurs = {}
+_moteurs = {}
+_lock = threading.Lock()
+
+
+def enregistrer(nom):
+    """Décorateur : ``chargeur()`` importe le moteur ``nom`` et le retourne."""
+    def decorateur(chargeur):
+        _chargeurs[nom] = chargeur
+        return chargeur
+    return decorateur
+
+
+def moteur(nom):
+    try:
+        return _moteurs[nom]
+    except KeyError:
+        pass
+    with _lock:
+        if nom not in _moteurs:
+            _moteurs[nom] = _chargeurs[nom]()
+        return _moteurs[nom]
+
+
+def moteurs_charges():
+    return sorted(_moteurs)
+
+
+@enregistrer('excel')
+def _excel():
+    from openpyxl import Workbook, load_workbook
+    return SimpleNamespace(Workbook=Workbook, load_workbook=load_workbook)
+
+
+@enregistrer('pdf')
+def _pdf():
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    from reportlab.platypus import Table, TableStyle
+    return SimpleNamespace(colors=colors, letter=letter, canvas=canvas, Table=Table, TableStyle=TableStyle)
+
+
+_SONDE = """
+import json, sys, time
+debut = time.perf_counter()
+from app import create_app
+create_app(%r)
+print(json.dumps({
+    'secondes': time.perf_counter() - debut,
+    'modules': sorted({m.split('.')[0] for m in sys.modules} & set(%r)),
+}))
+"""
+
+
+def mesurer_demarrage(config_name='default', racine=None):
+    """Démarre ``create_app`` dans un nouvel interpréteur ; retourne (secondes, modules différés chargés)."""
+    racine = racine or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, SCHEDULER_ENABLED='false')
+    resultat = subprocess.run(
+        [sys.executable, '-c', _SONDE % (config_name, MODULES_DIFFERES)],
+        cwd=racine, env=env, capture_output=True, text=True, check=True,
+    )
+    mesure = json.loads(resultat.stdout.strip().splitlines()[-1])
+    return mesure['secondes'], mesure['modules']
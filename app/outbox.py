@@ -0,0 +1,268 @@
+"""File d'attente durable des emails sortants (outbox).
+
+Les routes web et les tâches planifiées ne font qu'insérer une ligne
+``EmailOutbox`` ; le processus ``flask worker`` réclame les lignes en
+attente, les envoie et écrit l'``EmailLog`` du résultat final.
+
+Cycle de vie : pending -> sending -> sent, ou retour en pending avec un
+délai exponentiel jusqu'à ``OUTBOX_MAX_ATTEMPTS`` tentatives, puis failed.
+
+Un email personnalisé est mis en file avec le gabarit (sujet, contenu) et
+les variables du destinataire ; il est rendu au moment de l'envoi.
+
+Le même processus exécute les tâches longues (exports, imports : voir
+``taches``). Le pool SMTP vit dans le processus worker : chaque worker publie ses
+compteurs dans ``worker_status`` toutes les ``OUTBOX_STATS_INTERVAL``
+secondes, pour ``/smtp/stats``.
+"""
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import cast, delete, literal, update
+from .bulk import insert_on_conflict
+from .dispatch import DispatchEngine, Envoi, RapportEnvoi
+from .extensions import db, smtp_pool
+from .models import Client, EmailOutbox, WorkerStatus
+from .taches import ExecuteurTaches
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+def nouvelle_cle():
+    return uuid.uuid4().hex
+
+
+def _ligne(client_id, email, nom, sujet, contenu, idempotency_key, variables=None,
+           campaign_id=None, template_id=None):
+    return {
+        'client_id': client_id,
+        'destinataire_email': email,
+        'destinataire_nom': nom,
+        'sujet': sujet,
+        'contenu': contenu,
+        'variables': variables,
+        'template_id': template_id,
+        'idempotency_key': idempotency_key or nouvelle_cle(),
+        'statut': PENDING,
+        'tentatives': 0,
+        'prochaine_tentative': datetime.utcnow(),
+        'campaign_id': campaign_id,
+    }
+
+
+def enqueue(client, sujet, contenu, idempotency_key=None, commit=True, variables=None):
+    """Met un email en file pour ``client``.
+
+    Avec ``variables`` (JSON), ``sujet`` et ``contenu`` sont des gabarits.
+    Un second appel avec la même clé d'idempotence est ignoré. Retourne
+    True si l'email a effectivement été ajouté.
+    """
+    return enqueue_many(
+        [(client.id, client.email, client.nom, sujet, contenu, idempotency_key, variables)],
+        commit=commit,
+    ) == 1
+
+
+def enqueue_many(envois, commit=True, campaign_id=None, template_id=None):
+    """Insère en une requête des tuples (client_id, email, nom, sujet, contenu, clé[, variables])."""
+    lignes = [_ligne(*envoi, campaign_id=campaign_id, template_id=template_id) for envoi in envois]
+    if not lignes:
+        return 0
+    resultat = db.session.execute(
+        insert_on_conflict(EmailOutbox, ['idempotency_key']), lignes
+    )
+    if commit:
+        db.session.commit()
+    return resultat.rowcount if resultat.rowcount >= 0 else len(lignes)
+
+
+def enqueue_selection(condition, sujet, contenu, prefixe_cle=None, commit=True, template_id=None):
+    """Met en file un email pour chaque client vérifiant ``condition``.
+
+    Une seule instruction INSERT ... SELECT, quel que soit le nombre de
+    clients ; la clé d'idempotence est ``prefixe_cle`` suivi de l'id client.
+    """
+    prefixe_cle = prefixe_cle or f'lot:{nouvelle_cle()}:'
+    maintenant = datetime.utcnow()
+    table = EmailOutbox.__table__
+    selection = db.select(
+        Client.id, Client.email, Client.nom,
+        literal(sujet), literal(contenu),
+        literal(prefixe_cle) + cast(Client.id, db.String),
+        literal(PENDING), literal(0), literal(maintenant), literal(maintenant),
+        literal(template_id, db.Integer),
+    ).where(condition)
+    insertion = insert_on_conflict(EmailOutbox, ['idempotency_key']).from_select(
+        [table.c.client_id, table.c.destinataire_email, table.c.destinataire_nom,
+         table.c.sujet, table.c.contenu, table.c.idempotency_key, table.c.statut,
+         table.c.tentatives, table.c.prochaine_tentative, table.c.created_at,
+         table.c.template_id],
+        selection,
+    )
+    resultat = db.session.execute(insertion)
+    if commit:
+        db.session.commit()
+    return resultat.rowcount
+
+
+def delai_nouvelle_tentative(tentatives, config=None):
+    config = config or current_app.config
+    delai = config['OUTBOX_BACKOFF_BASE'] * (2 ** max(tentatives - 1, 0))
+    return timedelta(seconds=min(delai, config['OUTBOX_BACKOFF_MAX']))
+
+
+def liberer_envois_bloques():
+    """Remet en attente les envois restés 'sending' après l'arrêt brutal d'un worker."""
+    limite = datetime.utcnow() - timedelta(seconds=current_app.config['OUTBOX_LOCK_TIMEOUT'])
+    resultat = db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.statut == SENDING, EmailOutbox.verrouille_a < limite)
+        .values(statut=PENDING, verrouille_par=None, verrouille_a=None)
+    )
+    db.session.commit()
+    return resultat.rowcount
+
+
+def reclamer_lot(worker_id, batch_size):
+    """Réserve au plus ``batch_size`` envois dus pour ce worker.
+
+    La réservation est un UPDATE conditionnel sur statut = 'pending' :
+    deux workers ne peuvent pas réclamer la même ligne.
+    """
+    maintenant = datetime.utcnow()
+    ids = [
+        ligne.id for ligne in db.session.query(EmailOutbox.id)
+        .filter(EmailOutbox.statut == PENDING, EmailOutbox.prochaine_tentative <= maintenant)
+        .order_by(EmailOutbox.prochaine_tentative, EmailOutbox.id)
+        .limit(batch_size)
+    ]
+    if not ids:
+        return []
+    db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(ids), EmailOutbox.statut == PENDING)
+        .values(statut=SENDING, verrouille_par=worker_id, verrouille_a=maintenant)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return (
+        EmailOutbox.query
+        .filter(EmailOutbox.id.in_(ids),
+                EmailOutbox.statut == SENDING,
+                EmailOutbox.verrouille_par == worker_id)
+        .order_by(EmailOutbox.id)
+        .all()
+    )
+
+
+def publier_stats_smtp(worker_id, stats, maintenant=None):
+    """Enregistre les compteurs SMTP de ce worker ; oublie les workers muets depuis 10 intervalles."""
+    maintenant = maintenant or datetime.utcnow()
+    db.session.execute(
+        insert_on_conflict(WorkerStatus, ['worker_id'], update_columns=['smtp_stats', 'updated_at']),
+        [{'worker_id': worker_id, 'smtp_stats': json.dumps(stats), 'updated_at': maintenant}],
+    )
+    limite = maintenant - timedelta(seconds=10 * current_app.config['OUTBOX_STATS_INTERVAL'])
+    db.session.execute(delete(WorkerStatus).where(WorkerStatus.updated_at < limite))
+    db.session.commit()
+
+
+def stats_smtp_workers():
+    """Derniers compteurs publiés par chaque worker."""
+    return [
+        dict(json.loads(statut.smtp_stats), worker_id=statut.worker_id,
+             updated_at=statut.updated_at.isoformat())
+        for statut in WorkerStatus.query.order_by(WorkerStatus.worker_id)
+    ]
+
+
+class OutboxWorker:
+    def __init__(self, send_func, worker_id=None, batch_size=None, app=None):
+        self.app = app or current_app._get_current_object()
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.batch_size = batch_size or self.app.config['OUTBOX_BATCH_SIZE']
+        self.engine = DispatchEngine(send_func, app=self.app)
+        self.taches = ExecuteurTaches(self.worker_id, app=self.app)
+        self.max_tentatives = self.app.config['OUTBOX_MAX_ATTEMPTS']
+        self.intervalle_stats = self.app.config['OUTBOX_STATS_INTERVAL']
+        self._stats_publiees = None
+
+    def traiter_lot(self, rapport):
+        """Envoie un lot ; retourne le nombre d'envois traités."""
+        lot = reclamer_lot(self.worker_id, self.batch_size)
+        if not lot:
+            return 0
+
+        envois = [
+            Envoi(ligne.client_id, ligne.destinataire_email, ligne.destinataire_nom,
+                  ligne.sujet, ligne.contenu,
+                  json.loads(ligne.variables) if ligne.variables else None, ligne.template_id)
+            for ligne in lot
+        ]
+        resultats = self.engine.envoyer(envois)
+
+        maintenant = datetime.utcnow()
+        definitifs = []
+        for ligne, resultat in zip(lot, resultats):
+            ligne.tentatives += 1
+            ligne.verrouille_par = None
+            ligne.verrouille_a = None
+            if resultat.succes:
+                ligne.statut = SENT
+                ligne.sent_at = maintenant
+                ligne.derniere_erreur = None
+            elif resultat.definitif or ligne.tentatives >= self.max_tentatives:
+                ligne.statut = FAILED
+                ligne.derniere_erreur = resultat.detail
+            else:
+                ligne.statut = PENDING
+                ligne.derniere_erreur = resultat.detail
+                ligne.prochaine_tentative = maintenant + delai_nouvelle_tentative(
+                    ligne.tentatives, self.app.config)
+                continue
+            definitifs.append(resultat)
+            rapport.ajouter(resultat)
+
+        # Un seul commit : états de l'outbox et EmailLog des résultats définitifs
+        self.engine.journaliser(definitifs, commit=False)
+        db.session.commit()
+        return len(lot)
+
+    def vider(self):
+        """Traite tous les envois dus puis retourne le rapport."""
+        rapport = RapportEnvoi()
+        liberer_envois_bloques()
+        while self.traiter_lot(rapport):
+            pass
+        return rapport.terminer()
+
+    def publier_stats(self, forcer=False):
+        maintenant = time.monotonic()
+        if forcer or self._stats_publiees is None or \
+                maintenant - self._stats_publiees >= self.intervalle_stats:
+            publier_stats_smtp(self.worker_id, smtp_pool.stats())
+            self._stats_publiees = maintenant
+
+    def executer(self, poll_interval=None, once=False):
+        poll_interval = poll_interval or self.app.config['OUTBOX_POLL_INTERVAL']
+        try:
+            while True:
+                self.taches.entretenir()
+                self.taches.lancer()
+                rapport = self.vider()
+                if rapport.total:
+                    print(f"[worker {self.worker_id}] {rapport}")
+                self.publier_stats(forcer=once)
+                if once:
+                    return rapport
+                time.sleep(poll_interval)
+        finally:
+            self.engine.fermer()
+            self.taches.fermer()
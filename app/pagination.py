@@ -0,0 +1,137 @@
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+
+def _serialiser(valeur):
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    return valeur
+
+
+def _deserialiser(colonne, valeur):
+    if valeur is None:
+        return None
+    type_python = colonne.type.python_type
+    if type_python is datetime:
+        return datetime.fromisoformat(valeur)
+    if type_python is date:
+        return date.fromisoformat(valeur)
+    return type_python(valeur)
+
+
+def encoder_curseur(valeur, ident, direction='next'):
+    donnees = {'v': _serialiser(valeur), 'id': ident, 'd': direction}
+    brut = json.dumps(donnees, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(brut).decode('ascii').rstrip('=')
+
+
+def decoder_curseur(jeton):
+    if not jeton:
+        return None
+    try:
+        brut = base64.urlsafe_b64decode(jeton + '=' * (-len(jeton) % 4))
+        donnees = json.loads(brut)
+        return donnees['v'], int(donnees['id']), donnees.get('d', 'next')
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """Page obtenue par pagination par curseur (keyset)."""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _apres(colonne_tri, colonne_id, valeur, ident, nulls_grandes):
+    """Lignes situées strictement après (valeur, ident) dans l'ordre croissant."""
+    if valeur is None:
+        if nulls_grandes:
+            return and_(colonne_tri.is_(None), colonne_id > ident)
+        return or_(colonne_tri.isnot(None), and_(colonne_tri.is_(None), colonne_id > ident))
+    condition = or_(colonne_tri > valeur, and_(colonne_tri == valeur, colonne_id > ident))
+    return or_(condition, colonne_tri.is_(None)) if nulls_grandes else condition
+
+
+def _avant(colonne_tri, colonne_id, valeur, ident, nulls_grandes):
+    """Lignes situées strictement avant (valeur, ident) dans l'ordre croissant."""
+    if valeur is None:
+        if nulls_grandes:
+            return or_(colonne_tri.isnot(None), and_(colonne_tri.is_(None), colonne_id < ident))
+        return and_(colonne_tri.is_(None), colonne_id < ident)
+    condition = or_(colonne_tri < valeur, and_(colonne_tri == valeur, colonne_id < ident))
+    return condition if nulls_grandes else or_(condition, colonne_tri.is_(None))
+
+
+def keyset_paginate(query, colonne_tri, colonne_id, per_page, curseur=None,
+                    descendant=False, cle=None):
+    """Pagine ``query`` sur le couple (colonne_tri, colonne_id).
+
+    Contrairement à OFFSET, chaque page est lue directement depuis l'index :
+    le coût ne dépend pas de la profondeur de la page. ``cle`` extrait le
+    couple (valeur de tri, id) d'une ligne du résultat.
+
+    Une valeur de tri NULL garde la place que lui donne la base dans l'index :
+    après toutes les autres en ordre croissant sur PostgreSQL, avant sur
+    SQLite. Les conditions du curseur suivent la même règle.
+    """
+    if cle is None:
+        cle = lambda ligne: (getattr(ligne, colonne_tri.key), getattr(ligne, colonne_id.key))
+
+    position = decoder_curseur(curseur)
+    direction = 'next'
+    if position is not None:
+        valeur, ident, direction = position
+        valeur = _deserialiser(colonne_tri, valeur)
+        nulls_grandes = query.session.get_bind().dialect.name == 'postgresql'
+        # En remontant (page précédente), on parcourt l'index en sens inverse
+        vers_le_haut = descendant != (direction == 'prev')
+        condition = _avant if vers_le_haut else _apres
+        query = query.filter(condition(colonne_tri, colonne_id, valeur, ident, nulls_grandes))
+
+    inverse = descendant != (direction == 'prev')
+    if inverse:
+        query = query.order_by(colonne_tri.desc(), colonne_id.desc())
+    else:
+        query = query.order_by(colonne_tri.asc(), colonne_id.asc())
+
+    lignes = query.limit(per_page + 1).all()
+    encore = len(lignes) > per_page
+    lignes = lignes[:per_page]
+    if direction == 'prev':
+        lignes.reverse()
+
+    next_cursor = prev_cursor = None
+    if lignes:
+        premiere, derniere = cle(lignes[0]), cle(lignes[-1])
+        if direction == 'prev':
+            if encore:
+                prev_cursor = encoder_curseur(*premiere, direction='prev')
+            next_cursor = encoder_curseur(*derniere, direction='next')
+        else:
+            if encore:
+                next_cursor = encoder_curseur(*derniere, direction='next')
+            if position is not None:
+                prev_cursor = encoder_curseur(*premiere, direction='prev')
+
+    return KeysetPage(lignes, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
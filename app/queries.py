@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, or_
+from .extensions import db
+from .models import Client
+from .search import sous_requete_recherche
+
+# Colonnes autorisées pour le tri de la liste des clients
+CLIENT_SORT_COLUMNS = {
+    'nom': Client.nom,
+    'date_expiration': Client.date_expiration,
+    'date_ajout': Client.date_ajout,
+}
+
+def appliquer_recherche(query, search):
+    """Filtre ``query`` par l'index plein texte.
+
+    Retourne la requête et la colonne de rang (None si l'index n'est pas
+    disponible, auquel cas on retombe sur un LIKE).
+    """
+    recherche = sous_requete_recherche(db.session.connection(), search)
+    if recherche is None:
+        query = query.filter(
+            or_(
+                Client.nom.contains(search),
+                Client.email.contains(search),
+                Client.telephone.contains(search)
+            )
+        )
+        return query, None
+    query = query.join(recherche, recherche.c.client_id == Client.id)
+    return query, recherche.c.rang
+
+def filtrer_clients(query, search='', status_filter=''):
+    if search:
+        query, _ = appliquer_recherche(query, search)
+
+    if status_filter:
+        query = query.filter(Client.statut == status_filter)
+
+    return query
+
+def alert_class_expression(today=None):
+    """Classe CSS d'alerte d'expiration, calculée par la base (CASE)."""
+    today = today or datetime.now().date()
+    return case(
+        (Client.date_expiration <= today + timedelta(days=2), 'table-danger'),
+        (Client.date_expiration <= today + timedelta(days=7), 'table-warning'),
+        else_=''
+    ).label('alert_class')
+
+def expression_mois(colonne):
+    """Clé 'AAAA-MM' d'une colonne date, dans le dialecte de la base."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.to_char(colonne, 'YYYY-MM')
+    return func.strftime('%Y-%m', colonne)
+
+def ajouter_jours(colonne, jours):
+    """``colonne + jours`` pour une colonne date, dans le dialecte de la base."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return colonne + jours
+    return func.date(colonne, f'{jours:+d} days')
@@ -0,0 +1,89 @@
+"""Planification incrémentale des rappels d'expiration.
+
+Pour chaque délai configuré (``REMINDER_LEAD_DAYS``, ex. J-30, J-7, J-2),
+on mémorise la dernière date d'expiration traitée. Chaque exécution ne
+parcourt que la nouvelle fenêtre de dates, via l'index
+(statut, date_expiration), et rattrape automatiquement les jours manqués.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from .extensions import db
+from .models import Client, ReminderWatermark
+from .outbox import enqueue_many
+
+SUJET_RAPPEL = "Rappel : Votre abonnement expire bientôt"
+
+MESSAGE_RAPPEL = """Nous espérons que vous allez bien.
+
+Nous vous informons que votre abonnement expire dans {jours} jours.
+N'hésitez pas à nous contacter pour le renouveler et continuer à bénéficier de nos services.
+
+Nous serions ravis de vous accompagner pour le renouvellement !"""
+
+
+def fenetres_rappels(today, delais, watermarks):
+    """Calcule la fenêtre ]debut, fin] des dates d'expiration à traiter par délai.
+
+    La borne basse d'un délai ne descend jamais sous la borne haute du délai
+    plus court suivant : après une interruption, un client ne reçoit que le
+    rappel le plus proche de son échéance, pas tous ceux manqués.
+    """
+    fenetres = {}
+    delais = sorted(set(delais))
+    for i, delai in enumerate(delais):
+        fin = today + timedelta(days=delai)
+        plancher = today + timedelta(days=delais[i - 1]) if i else today - timedelta(days=1)
+        debut = watermarks.get(delai, fin - timedelta(days=1))
+        debut = max(debut, plancher)
+        if debut < fin:
+            fenetres[delai] = (debut, fin)
+    return fenetres
+
+
+def planifier_rappels(today=None):
+    """Met en file les rappels dus ; retourne le nombre d'emails ajoutés par délai."""
+    today = today or datetime.now().date()
+    config = current_app.config
+    batch_size = config['DISPATCH_BATCH_SIZE']
+
+    watermarks = {w.lead_days: w for w in ReminderWatermark.query.all()}
+    fenetres = fenetres_rappels(
+        today, config['REMINDER_LEAD_DAYS'],
+        {delai: w.derniere_date for delai, w in watermarks.items()}
+    )
+
+    totaux = {}
+    for delai, (debut, fin) in fenetres.items():
+        message = MESSAGE_RAPPEL.format(jours=delai)
+        query = db.session.query(
+            Client.id, Client.email, Client.nom, Client.date_expiration
+        ).filter(
+            Client.statut == 'actif',
+            Client.date_expiration > debut,
+            Client.date_expiration <= fin
+        )
+
+        total = 0
+        dernier_id = 0
+        while True:
+            lignes = query.filter(Client.id > dernier_id).order_by(Client.id).limit(batch_size).all()
+            if not lignes:
+                break
+            dernier_id = lignes[-1].id
+            # Clé d'idempotence : un seul rappel par client, délai et échéance
+            total += enqueue_many([
+                (l.id, l.email, l.nom, SUJET_RAPPEL, message,
+                 f'rappel:J-{delai}:{l.id}:{l.date_expiration.isoformat()}')
+                for l in lignes
+            ], commit=False)
+
+        watermark = watermarks.get(delai)
+        if watermark is None:
+            db.session.add(ReminderWatermark(lead_days=delai, derniere_date=fin))
+        else:
+            watermark.derniere_date = fin
+        # La fenêtre et ses envois sont validés ensemble
+        db.session.commit()
+        totaux[delai] = total
+
+    return totaux
@@ -0,0 +1,178 @@
+"""Rendu des templates d'emails avec les variables de chaque client.
+
+Le sujet et le contenu d'un ``EmailTemplate`` sont des gabarits Jinja
+évalués dans un ``SandboxedEnvironment`` : un template ne peut ni lire les
+attributs internes des objets ni appeler autre chose que les filtres
+autorisés. Les gabarits compilés sont gardés dans un cache LRU indexé par
+(id du template, updated_at) ; modifier un template change donc sa clé.
+
+Un email personnalisé est mis en file sous forme de gabarit accompagné des
+variables du destinataire (JSON) : le worker le rend au moment de l'envoi
+et l'historique à l'affichage. Le corps stocké est ainsi le même pour tous
+les destinataires d'un template.
+
+Variables disponibles : ``nom``, ``email``, ``telephone``, ``statut``,
+``date_expiration`` (JJ/MM/AAAA) et ``jours_restants``. L'ancienne syntaxe
+``{nom}`` des premiers templates est convertie en ``{{ nom }}``.
+"""
+import json
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import date
+from functools import lru_cache
+from jinja2 import StrictUndefined, TemplateError
+from jinja2.sandbox import SandboxedEnvironment
+
+VARIABLES = {
+    'nom': 'Nom du client',
+    'email': 'Email du client',
+    'telephone': 'Téléphone du client',
+    'statut': 'Statut du client',
+    'date_expiration': "Date d'expiration (JJ/MM/AAAA)",
+    'jours_restants': "Nombre de jours avant l'expiration",
+}
+
+EXEMPLE = {
+    'nom': 'Marie Dupont',
+    'email': 'marie.dupont@example.com',
+    'telephone': '06 12 34 56 78',
+    'statut': 'actif',
+    'date_expiration': '31/12/2025',
+    'jours_restants': 7,
+}
+
+_ANCIENNE_SYNTAXE = re.compile(r'(?<!\{)\{(%s)\}(?!\})' % '|'.join(VARIABLES))
+
+environnement = SandboxedEnvironment(
+    undefined=StrictUndefined,
+    autoescape=False,
+    keep_trailing_newline=True,
+)
+
+Gabarit = namedtuple('Gabarit', 'sujet contenu')
+
+
+class ErreurRendu(ValueError):
+    pass
+
+
+def _compiler(source):
+    """Retourne une fonction variables -> texte ; le texte fixe n'est pas compilé."""
+    source = _ANCIENNE_SYNTAXE.sub(r'{{ \1 }}', source or '')
+    if '{' not in source:
+        return lambda variables: source
+    try:
+        return environnement.from_string(source).render
+    except TemplateError as e:
+        raise ErreurRendu(f"Template invalide : {e}") from e
+
+
+def est_personnalise(source):
+    return '{' in _ANCIENNE_SYNTAXE.sub(r'{{ \1 }}', source or '')
+
+
+class CacheGabarits:
+    """Cache LRU des gabarits compilés, indexé par (id, updated_at)."""
+
+    def __init__(self, taille=256):
+        self.taille = taille
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, template):
+        cle = (template.id, template.updated_at or template.created_at)
+        with self._lock:
+            gabarit = self._data.get(cle)
+            if gabarit is not None:
+                self._data.move_to_end(cle)
+                return gabarit
+        gabarit = Gabarit(_compiler(template.sujet), _compiler(template.contenu))
+        with self._lock:
+            self._data[cle] = gabarit
+            self._data.move_to_end(cle)
+            while len(self._data) > self.taille:
+                self._data.popitem(last=False)
+        return gabarit
+
+    def invalidate(self):
+        with self._lock:
+            self._data.clear()
+
+
+gabarits = CacheGabarits()
+
+
+@lru_cache(maxsize=128)
+def _gabarit_texte(source):
+    return _compiler(source)
+
+
+def variables_client(client, today=None):
+    """Variables de rendu pour ``client`` (objet ou ligne avec les mêmes attributs)."""
+    today = today or date.today()
+    expiration = client.date_expiration
+    return {
+        'nom': client.nom,
+        'email': client.email,
+        'telephone': client.telephone or '',
+        'statut': client.statut,
+        'date_expiration': expiration.strftime('%d/%m/%Y') if expiration else '',
+        'jours_restants': (expiration - today).days if expiration else None,
+    }
+
+
+def variables_json(client, today=None):
+    return json.dumps(variables_client(client, today), ensure_ascii=False)
+
+
+def _evaluer(fonction, variables):
+    try:
+        return fonction(variables)
+    except TemplateError as e:
+        raise ErreurRendu(f"Erreur dans le template : {e}") from e
+
+
+def rendre_texte(source, variables):
+    """Rend un texte libre (formulaire d'envoi) avec les ``variables``."""
+    return _evaluer(_gabarit_texte(source), variables)
+
+
+def rendre_enregistre(source, variables):
+    """Rend un texte de l'outbox ou de l'historique avec ses variables (JSON).
+
+    Sans variables, le texte a été rendu avant d'être enregistré. Si le
+    gabarit ne peut pas être rendu, il est retourné tel quel.
+    """
+    if not variables:
+        return source
+    try:
+        return rendre_texte(source, json.loads(variables))
+    except ErreurRendu:
+        return source
+
+
+def rendre(template, client, today=None):
+    """Retourne (sujet, contenu) de ``template`` pour ``client``."""
+    gabarit = gabarits.get(template)
+    variables = variables_client(client, today)
+    return _evaluer(gabarit.sujet, variables), _evaluer(gabarit.contenu, variables)
+
+
+def variables_lot(template, clients, today=None):
+    """Itère sur (client, variables JSON) pour mettre ``template`` en file.
+
+    Le template est compilé d'abord (ErreurRendu s'il est invalide). Sans
+    variable dans le template, les variables sont None.
+    """
+    gabarits.get(template)
+    personnalise = est_personnalise(template.sujet) or est_personnalise(template.contenu)
+    today = today or date.today()
+    for client in clients:
+        yield client, variables_json(client, today) if personnalise else None
+
+
+def valider(sujet, contenu):
+    """Compile et rend le sujet et le contenu avec des valeurs d'exemple ; lève ErreurRendu."""
+    for source in (sujet, contenu):
+        _evaluer(_compiler(source), EXEMPLE)
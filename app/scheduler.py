@@ -0,0 +1,225 @@
+"""Planificateur des tâches périodiques avec élection d'un leader.
+
+La candidature est explicite : seuls les workers gunicorn (hook
+``post_worker_init``, si SCHEDULER_ENABLED) et la commande ``flask
+scheduler`` se portent candidats. ``create_app`` prépare le candidat sans
+le démarrer : les commandes ponctuelles et ``flask worker`` ne prennent
+jamais le bail. Un seul candidat à la fois détient le bail de la ligne
+``scheduler_lock`` et fait tourner l'APScheduler. Les tâches sont stockées
+dans la base (SQLAlchemyJobStore) : après un redémarrage, le nouveau leader
+rattrape les exécutions manquées.
+"""
+import atexit
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import or_, update
+from .bulk import insert_on_conflict
+from .extensions import db
+from .models import SchedulerLock
+
+LOCK_NAME = 'scheduler'
+
+# Application utilisée par les tâches (référencées par leur chemin dans le job store)
+_app = None
+
+
+def job_rappels_automatiques():
+    from .email import envoyer_rappels_automatiques_func
+    with _app.app_context():
+        envoyer_rappels_automatiques_func()
+
+
+def job_archivage_emails():
+    from .archives import archiver_emails
+    with _app.app_context():
+        for mois, nombre in archiver_emails():
+            print(f"Historique {mois} archivé ({nombre} emails)")
+
+
+def job_campagnes():
+    from .campagnes import alimenter_campagnes
+    with _app.app_context():
+        alimenter_campagnes()
+
+
+def jobs(config):
+    return [
+        {
+            'id': 'rappels_automatiques',
+            'func': 'app.scheduler:job_rappels_automatiques',
+            'trigger': CronTrigger(hour=config['REMINDER_HOUR']),  # Chaque jour
+        },
+        {
+            'id': 'archivage_emails',
+            'func': 'app.scheduler:job_archivage_emails',
+            'trigger': CronTrigger(hour=config['EMAIL_ARCHIVE_HOUR']),
+        },
+        {
+            'id': 'campagnes',
+            'func': 'app.scheduler:job_campagnes',
+            'trigger': IntervalTrigger(seconds=config['CAMPAIGN_TICK_SECONDS']),
+        },
+    ]
+
+
+class LeaderLock:
+    """Bail renouvelable sur une ligne de ``scheduler_lock``."""
+
+    def __init__(self, engine, name=LOCK_NAME, ttl=60, owner=None):
+        self.engine = engine
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+    def acquire(self):
+        """Prend ou renouvelle le bail ; retourne True si ce processus est leader."""
+        maintenant = datetime.utcnow()
+        table = SchedulerLock.__table__
+        with self.engine.begin() as conn:
+            conn.execute(
+                insert_on_conflict(table, ['name'], bind=conn)
+                .values(name=self.name, owner=None, expires_at=maintenant)
+            )
+            resultat = conn.execute(
+                update(table)
+                .where(table.c.name == self.name,
+                       or_(table.c.owner == self.owner, table.c.expires_at <= maintenant))
+                .values(owner=self.owner, expires_at=maintenant + timedelta(seconds=self.ttl))
+            )
+        return resultat.rowcount == 1
+
+    def release(self):
+        table = SchedulerLock.__table__
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(table)
+                .where(table.c.name == self.name, table.c.owner == self.owner)
+                .values(owner=None, expires_at=datetime.utcnow())
+            )
+
+
+class LeaderScheduler:
+    """Fait tourner l'APScheduler seulement tant que ce processus est leader."""
+
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.engine = db.engine
+        self.lock = LeaderLock(self.engine, ttl=config['SCHEDULER_LOCK_TTL'])
+        self.interval = max(config['SCHEDULER_LOCK_TTL'] / 3, 1)
+        self.misfire_grace_time = config['SCHEDULER_MISFIRE_GRACE_TIME']
+        self.scheduler = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self.scheduler is not None
+
+    def _demarrer_scheduler(self):
+        global _app
+        _app = self.app
+        scheduler = BackgroundScheduler(
+            # Job store sur le moteur de l'application : pas de second pool de connexions
+            jobstores={'default': SQLAlchemyJobStore(engine=self.engine)},
+            job_defaults={'coalesce': True, 'misfire_grace_time': self.misfire_grace_time},
+        )
+        # Démarrage en pause : les tâches déjà stockées gardent leur prochaine exécution
+        scheduler.start(paused=True)
+        for job in jobs(self.app.config):
+            existant = scheduler.get_job(job['id'])
+            if existant is None:
+                scheduler.add_job(**job)
+            elif str(existant.trigger) != str(job['trigger']):
+                # Planification modifiée dans la configuration depuis le dernier démarrage
+                scheduler.reschedule_job(job['id'], trigger=job['trigger'])
+        scheduler.resume()
+        self.scheduler = scheduler
+        print(f"Planificateur démarré (leader {self.lock.owner})")
+
+    def _arreter_scheduler(self):
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+
+    def _tour(self):
+        with self.app.app_context():
+            try:
+                leader = self.lock.acquire()
+            except Exception as e:
+                print(f"Erreur du verrou du planificateur: {str(e)}")
+                leader = False
+        if leader and not self.is_leader:
+            self._demarrer_scheduler()
+        elif not leader and self.is_leader:
+            print("Bail du planificateur perdu, arrêt des tâches")
+            self._arreter_scheduler()
+
+    def run(self):
+        """Boucle de candidature ; bloque jusqu'à ``stop()``."""
+        try:
+            while not self._stop.is_set():
+                self._tour()
+                self._stop.wait(self.interval)
+        finally:
+            # Arrêt normal ou interruption (Ctrl+C) : le bail est rendu tout de suite
+            self._arreter_scheduler()
+            with self.app.app_context():
+                self.lock.release()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='leader-scheduler', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def attendre(self):
+        """Bloque le processus courant : suit le thread candidat, ou le devient."""
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self.run()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+
+# Candidat unique du processus, quel que soit le nombre d'appels à init_scheduler
+_leader_scheduler = None
+
+
+def init_scheduler(app):
+    """Prépare le candidat du processus, sans le démarrer."""
+    global _leader_scheduler
+    if _leader_scheduler is not None:
+        if _leader_scheduler.app is not app:
+            print("Planificateur déjà initialisé dans ce processus : pas de second planificateur")
+        app.extensions['scheduler'] = _leader_scheduler
+        return _leader_scheduler
+    leader_scheduler = LeaderScheduler(app)
+    app.extensions['scheduler'] = leader_scheduler
+    _leader_scheduler = leader_scheduler
+    return leader_scheduler
+
+
+def demarrer_apres_fork(app):
+    """Démarre le candidat d'un worker gunicorn, si SCHEDULER_ENABLED.
+
+    Un candidat hérité du maître (application préchargée) partagerait son
+    identité de bail avec les autres workers : il est remplacé.
+    """
+    global _leader_scheduler
+    with app.app_context():
+        _leader_scheduler = LeaderScheduler(app)
+    app.extensions['scheduler'] = _leader_scheduler
+    if app.config['SCHEDULER_ENABLED']:
+        _leader_scheduler.start()
+    return _leader_scheduler
@@ -0,0 +1,59 @@
+"""Mise à niveau légère du schéma d'une base existante.
+
+``db.create_all()`` crée les tables absentes mais ne modifie pas celles qui
+existent déjà. ``completer_schema`` ajoute aux tables existantes les
+colonnes et index déclarés dans les modèles qui leur manquent
+(``flask schema upgrade``). Seules les colonnes acceptant NULL peuvent être
+ajoutées ainsi : les valeurs par défaut Python s'appliquent aux écritures
+suivantes.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from .extensions import db
+
+
+def _definition(colonne, dialect):
+    definition = str(CreateColumn(colonne).compile(dialect=dialect))
+    cles = list(colonne.foreign_keys)
+    if len(cles) == 1:
+        cible = cles[0].column
+        definition += f" REFERENCES {cible.table.name} ({cible.name})"
+    return definition
+
+
+def _index_existants(connection, inspecteur, table):
+    if connection.dialect.name == 'sqlite':
+        # L'inspecteur SQLite ignore les index sur expression, comme lower(email)
+        return set(connection.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"
+        ), {'table': table}).scalars())
+    return {index['name'] for index in inspecteur.get_indexes(table)}
+
+
+def completer_schema(connection):
+    """Ajoute les colonnes et index manquants ; retourne la liste des ajouts."""
+    inspecteur = inspect(connection)
+    tables = set(inspecteur.get_table_names())
+    ajouts = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            table.create(connection)
+            ajouts.append(table.name)
+            continue
+        existantes = {colonne['name'] for colonne in inspecteur.get_columns(table.name)}
+        for colonne in table.columns:
+            if colonne.name in existantes:
+                continue
+            if not colonne.nullable:
+                raise RuntimeError(
+                    f"La colonne obligatoire {table.name}.{colonne.name} doit être ajoutée manuellement.")
+            connection.execute(text(
+                f"ALTER TABLE {table.name} ADD COLUMN {_definition(colonne, connection.dialect)}"
+            ))
+            ajouts.append(f'{table.name}.{colonne.name}')
+        index_existants = _index_existants(connection, inspecteur, table.name)
+        for index in table.indexes:
+            if index.name not in index_existants:
+                index.create(connection)
+                ajouts.append(index.name)
+    return ajouts
@@ -0,0 +1,225 @@
+"""Moteur de recherche plein texte sur les clients.
+
+SQLite : table virtuelle FTS5 ``client_fts`` (rowid = id du client).
+PostgreSQL : table ``client_search`` avec une colonne tsvector indexée en GIN.
+
+Les documents sont normalisés côté Python (minuscules, sans accents,
+téléphone réduit aux chiffres) afin que les deux moteurs indexent
+exactement les mêmes jetons. L'index est tenu à jour par les événements
+ORM de ``Client`` dans la même transaction que l'écriture.
+"""
+import re
+import time
+import unicodedata
+from sqlalchemy import event, literal_column, text, Float, Integer
+from sqlalchemy.sql import column, table
+from .extensions import db
+from .models import Client
+
+_MOTS = re.compile(r'\w+', re.UNICODE)
+_TELEPHONE = re.compile(r'^[\d\s().+/-]+$')
+
+# Disponibilité de l'index par base de données (clé : URL du moteur) : une
+# absence n'est retenue que TTL_INDEX_ABSENT secondes, l'index pouvant être
+# créé par un autre processus (flask search rebuild)
+TTL_INDEX_ABSENT = 30
+_index_disponible = {}
+
+
+def normaliser_texte(valeur):
+    if not valeur:
+        return ''
+    decompose = unicodedata.normalize('NFKD', valeur)
+    sans_accents = ''.join(c for c in decompose if not unicodedata.combining(c))
+    return sans_accents.lower()
+
+
+def normaliser_telephone(valeur):
+    if not valeur:
+        return ''
+    return re.sub(r'\D', '', valeur)
+
+
+def jetons_recherche(terme):
+    """Découpe la saisie de l'utilisateur en jetons comparables à l'index."""
+    terme = (terme or '').strip()
+    if not terme:
+        return []
+    if _TELEPHONE.match(terme) and any(c.isdigit() for c in terme):
+        return [normaliser_telephone(terme)]
+    return _MOTS.findall(normaliser_texte(terme))
+
+
+def document_client(nom, email, telephone):
+    mots = _MOTS.findall(normaliser_texte(nom)) + _MOTS.findall(normaliser_texte(email))
+    telephone = normaliser_telephone(telephone)
+    if telephone:
+        mots.append(telephone)
+    return ' '.join(mots)
+
+
+def _dialecte(connection):
+    return connection.dialect.name
+
+
+def _cle(connection):
+    return str(connection.engine.url)
+
+
+def index_disponible(connection, reverifier=False):
+    """Vrai si l'index existe ; ``reverifier`` ignore une absence mise en cache."""
+    cle = _cle(connection)
+    existe, expiration = _index_disponible.get(cle, (False, 0))
+    if not existe and (reverifier or expiration <= time.monotonic()):
+        dialecte = _dialecte(connection)
+        if dialecte == 'sqlite':
+            existe = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'client_fts'"
+            )).first() is not None
+        elif dialecte == 'postgresql':
+            existe = connection.execute(text(
+                "SELECT to_regclass('client_search') IS NOT NULL"
+            )).scalar()
+        else:
+            existe = False
+        existe = bool(existe)
+        _index_disponible[cle] = (existe, time.monotonic() + TTL_INDEX_ABSENT)
+    return existe
+
+
+def creer_index(connection):
+    dialecte = _dialecte(connection)
+    if dialecte == 'sqlite':
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS client_fts USING fts5("
+            "document, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+    elif dialecte == 'postgresql':
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS client_search ("
+            "client_id INTEGER PRIMARY KEY REFERENCES client (id) ON DELETE CASCADE, "
+            "document TSVECTOR NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_client_search_document "
+            "ON client_search USING GIN (document)"
+        ))
+    else:
+        return
+    _index_disponible.pop(_cle(connection), None)
+
+
+def supprimer_index(connection):
+    dialecte = _dialecte(connection)
+    if dialecte == 'sqlite':
+        connection.execute(text("DROP TABLE IF EXISTS client_fts"))
+    elif dialecte == 'postgresql':
+        connection.execute(text("DROP TABLE IF EXISTS client_search"))
+    _index_disponible.pop(_cle(connection), None)
+
+
+def indexer(connection, lignes):
+    """Insère ou remplace les documents de ``lignes`` : (id, nom, email, telephone)."""
+    # Les écritures revérifient l'absence : un index créé ailleurs ne doit manquer aucun client
+    if not lignes or not index_disponible(connection, reverifier=True):
+        return
+    params = [
+        {'id': ident, 'document': document_client(nom, email, telephone)}
+        for ident, nom, email, telephone in lignes
+    ]
+    ids = [{'id': p['id']} for p in params]
+    if _dialecte(connection) == 'sqlite':
+        connection.execute(text("DELETE FROM client_fts WHERE rowid = :id"), ids)
+        connection.execute(text(
+            "INSERT INTO client_fts (rowid, document) VALUES (:id, :document)"
+        ), params)
+    else:
+        connection.execute(text(
+            "INSERT INTO client_search (client_id, document) "
+            "VALUES (:id, to_tsvector('simple', :document)) "
+            "ON CONFLICT (client_id) DO UPDATE SET document = EXCLUDED.document"
+        ), params)
+
+
+def desindexer(connection, ids):
+    if not ids or not index_disponible(connection, reverifier=True):
+        return
+    params = [{'id': ident} for ident in ids]
+    if _dialecte(connection) == 'sqlite':
+        connection.execute(text("DELETE FROM client_fts WHERE rowid = :id"), params)
+    else:
+        connection.execute(text("DELETE FROM client_search WHERE client_id = :id"), params)
+
+
+def reconstruire_index(batch_size=1000):
+    """Recrée l'index et y recharge tous les clients par lots."""
+    connection = db.session.connection()
+    supprimer_index(connection)
+    creer_index(connection)
+    total = 0
+    lot = []
+    resultat = db.session.execute(
+        db.select(Client.id, Client.nom, Client.email, Client.telephone)
+        .execution_options(yield_per=batch_size)
+    )
+    for ligne in resultat:
+        lot.append(tuple(ligne))
+        if len(lot) >= batch_size:
+            indexer(connection, lot)
+            total += len(lot)
+            lot = []
+    indexer(connection, lot)
+    total += len(lot)
+    db.session.commit()
+    return total
+
+
+def sous_requete_recherche(connection, terme):
+    """Sous-requête (client_id, rang) des clients correspondant à ``terme``.
+
+    Le rang est croissant avec la pertinence décroissante, pour un tri
+    ascendant identique sur les deux moteurs. Retourne None si l'index
+    n'est pas disponible sur cette base.
+    """
+    jetons = jetons_recherche(terme)
+    if not jetons or not index_disponible(connection):
+        return None
+    if _dialecte(connection) == 'sqlite':
+        expression = ' '.join(f'"{jeton}"*' for jeton in jetons)
+        fts = table('client_fts', column('rowid'), column('document'))
+        return (
+            db.select(
+                literal_column('client_fts.rowid', Integer).label('client_id'),
+                literal_column('bm25(client_fts)', Float).label('rang'),
+            )
+            .select_from(fts)
+            .where(literal_column('client_fts').op('MATCH')(expression))
+            .subquery('recherche')
+        )
+    expression = ' & '.join(f'{jeton}:*' for jeton in jetons)
+    search = table('client_search', column('client_id'), column('document'))
+    requete = db.func.to_tsquery('simple', expression)
+    return (
+        db.select(
+            search.c.client_id.label('client_id'),
+            (-db.func.ts_rank(search.c.document, requete)).cast(Float).label('rang'),
+        )
+        .where(search.c.document.op('@@')(requete))
+        .subquery('recherche')
+    )
+
+
+@event.listens_for(Client.__table__, 'after_create')
+def _creer_index_apres_table(target, connection, **kw):
+    creer_index(connection)
+
+
+@event.listens_for(Client, 'after_insert')
+@event.listens_for(Client, 'after_update')
+def _indexer_client(mapper, connection, target):
+    indexer(connection, [(target.id, target.nom, target.email, target.telephone)])
+
+
+@event.listens_for(Client, 'after_delete')
+def _desindexer_client(mapper, connection, target):
+    desindexer(connection, [target.id])
@@ -0,0 +1,201 @@
+"""Pool de connexions SMTP persistantes.
+
+La négociation STARTTLS et l'authentification coûtent plusieurs allers-retours
+réseau : elles sont faites une seule fois par connexion, puis la connexion
+est réutilisée pour les envois suivants tant qu'elle reste saine.
+"""
+import atexit
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from flask import current_app
+
+
+class SMTPConnectionPool:
+    """Pool thread-safe de connexions ``smtplib.SMTP`` authentifiées."""
+
+    def __init__(self, host, port, username, password, max_size=4,
+                 idle_timeout=60, health_check_after=10, timeout=30,
+                 use_tls=True, acquire_timeout=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self.use_tls = use_tls
+        self.acquire_timeout = acquire_timeout
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = deque()
+        self._in_use = 0
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'reconnects': 0,
+            'health_check_failures': 0,
+            'expired': 0,
+            'sent': 0,
+        }
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _open(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _is_alive(self, server):
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _take_idle(self):
+        """Retourne une connexion inactive encore utilisable, ou None."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                server, last_used = self._idle.pop()
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.idle_timeout:
+                self._incr('expired')
+                self._close(server)
+                continue
+            if idle_for > self.health_check_after and not self._is_alive(server):
+                self._incr('health_check_failures')
+                self._close(server)
+                continue
+            return server
+
+    def _acquire(self, fresh=False):
+        if self.acquire_timeout is None:
+            self._slots.acquire()
+        elif not self._slots.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError("Aucune connexion SMTP disponible dans le pool")
+        try:
+            server = None if fresh else self._take_idle()
+            if server is not None:
+                self._incr('hits')
+            else:
+                self._incr('misses')
+                server = self._open()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return server
+
+    def _release(self, server, broken=False):
+        with self._lock:
+            self._in_use -= 1
+            if not broken:
+                self._idle.append((server, time.monotonic()))
+        if broken:
+            self._close(server)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, fresh=False):
+        """Prête une connexion du pool ; ``fresh`` en ouvre une nouvelle."""
+        server = self._acquire(fresh)
+        broken = False
+        try:
+            yield server
+        except smtplib.SMTPServerDisconnected:
+            broken = True
+            raise
+        except smtplib.SMTPException:
+            # Erreur protocolaire (destinataire refusé...) : la connexion reste utilisable
+            raise
+        except OSError:
+            broken = True
+            raise
+        finally:
+            self._release(server, broken=broken)
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        """Envoie ``msg`` ; reconnecte une fois si le serveur a coupé la connexion."""
+        try:
+            with self.connection() as server:
+                refused = server.sendmail(from_addr, to_addrs, msg)
+        except smtplib.SMTPServerDisconnected:
+            # Les autres connexions inactives ont sans doute été coupées en même temps
+            self._incr('reconnects')
+            with self.connection(fresh=True) as server:
+                refused = server.sendmail(from_addr, to_addrs, msg)
+        self._incr('sent')
+        return refused
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_use'] = self._in_use
+            stats['idle'] = len(self._idle)
+        stats['max_size'] = self.max_size
+        return stats
+
+    def close_all(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for server, _ in idle:
+            self._close(server)
+
+
+class SMTPPool:
+    """Extension Flask : un pool de connexions SMTP par application."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        pool = SMTPConnectionPool(
+            app.config['SMTP_SERVER'],
+            app.config['SMTP_PORT'],
+            app.config['EMAIL_EXPEDITEUR'],
+            app.config['MOT_DE_PASSE_EMAIL'],
+            max_size=app.config.get('SMTP_POOL_SIZE', 4),
+            idle_timeout=app.config.get('SMTP_POOL_IDLE_TIMEOUT', 60),
+            health_check_after=app.config.get('SMTP_POOL_HEALTH_CHECK_AFTER', 10),
+            timeout=app.config.get('SMTP_TIMEOUT', 30),
+        )
+        app.extensions['smtp_pool'] = pool
+        atexit.register(pool.close_all)
+
+    @property
+    def pool(self):
+        return current_app.extensions['smtp_pool']
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        return self.pool.sendmail(from_addr, to_addrs, msg)
+
+    def stats(self):
+        return self.pool.stats()
@@ -0,0 +1,235 @@
+"""Statistiques du dashboard, lues dans des tables de cumuls journaliers.
+
+``daily_client_stats`` compte, par jour et par statut, les clients ajoutés
+et ceux qui expirent ce jour-là ; ``daily_email_stats`` compte les emails
+par jour d'envoi et par statut. Ces tables sont tenues à jour par les
+événements ORM de ``Client`` et ``EmailLog``, dans la même transaction que
+l'écriture. Les insertions groupées, qui ne déclenchent pas ces événements,
+appellent ``comptabiliser_emails`` elles-mêmes. ``flask stats rebuild``
+recalcule tout à partir des tables sources.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, event, func, inspect
+from .bulk import insert_on_conflict
+from .cache import TTLCache, invalider_sur_ecriture
+from .extensions import db
+from .models import Client, DailyClientStats, DailyEmailStats, EmailLog, EmailLogArchive
+from .queries import expression_mois
+
+dashboard_cache = TTLCache()
+invalider_sur_ecriture(dashboard_cache, Client, EmailLog)
+
+CHAMPS_CLIENT = ('date_ajout', 'date_expiration', 'statut')
+CHAMPS_EMAIL = ('date_envoi', 'statut')
+
+
+def _jour(valeur):
+    if isinstance(valeur, datetime):
+        return valeur.date()
+    return valeur
+
+
+def deltas_client(date_ajout, date_expiration, statut, signe):
+    deltas = Counter()
+    statut = statut or ''
+    if date_ajout is not None:
+        deltas[(_jour(date_ajout), statut, 'ajouts')] += signe
+    if date_expiration is not None:
+        deltas[(_jour(date_expiration), statut, 'expirations')] += signe
+    return deltas
+
+
+def appliquer_deltas_clients(connection, deltas):
+    """Ajoute les ``deltas`` {(jour, statut, colonne): n} à ``daily_client_stats``."""
+    lignes = {}
+    for (jour, statut, colonne), n in deltas.items():
+        if n:
+            ligne = lignes.setdefault((jour, statut), {
+                'jour': jour, 'statut': statut, 'ajouts': 0, 'expirations': 0,
+            })
+            ligne[colonne] += n
+    if lignes:
+        connection.execute(
+            insert_on_conflict(DailyClientStats, ['jour', 'statut'], bind=connection,
+                               increment_columns=['ajouts', 'expirations']),
+            list(lignes.values()),
+        )
+
+
+def comptabiliser_emails(connection, lignes, signe=1):
+    """Ajoute les emails ``lignes`` : (date_envoi, statut) à ``daily_email_stats``."""
+    compteurs = Counter(
+        (_jour(date_envoi), statut or '') for date_envoi, statut in lignes
+        if date_envoi is not None
+    )
+    params = [
+        {'jour': jour, 'statut': statut, 'nombre': n * signe}
+        for (jour, statut), n in compteurs.items()
+    ]
+    if params:
+        connection.execute(
+            insert_on_conflict(DailyEmailStats, ['jour', 'statut'], bind=connection,
+                               increment_columns=['nombre']),
+            params,
+        )
+
+
+def reconstruire_statistiques():
+    """Vide et recalcule les tables de cumuls ; retourne le nombre de lignes écrites."""
+    connection = db.session.connection()
+    connection.execute(delete(DailyClientStats))
+    # Les emails des mois archivés ne sont plus dans email_log : leurs cumuls sont gardés
+    archives = [mois for (mois,) in db.session.query(EmailLogArchive.mois)]
+    connection.execute(delete(DailyEmailStats).where(
+        expression_mois(DailyEmailStats.jour).notin_(archives)))
+
+    deltas = Counter()
+    for colonne, nom in ((Client.date_ajout, 'ajouts'), (Client.date_expiration, 'expirations')):
+        requete = (
+            db.select(colonne, Client.statut, func.count())
+            .where(colonne.isnot(None))
+            .group_by(colonne, Client.statut)
+        )
+        for jour, statut, n in connection.execute(requete):
+            deltas[(_jour(jour), statut or '', nom)] += n
+    appliquer_deltas_clients(connection, deltas)
+
+    jour_envoi = func.date(EmailLog.date_envoi)
+    compteurs = Counter()
+    requete = (
+        db.select(jour_envoi, EmailLog.statut, func.count())
+        .where(EmailLog.date_envoi.isnot(None),
+               expression_mois(EmailLog.date_envoi).notin_(archives))
+        .group_by(jour_envoi, EmailLog.statut)
+    )
+    for jour, statut, n in connection.execute(requete):
+        if isinstance(jour, str):
+            jour = datetime.strptime(jour, '%Y-%m-%d').date()
+        compteurs[(jour, statut or '')] += n
+    if compteurs:
+        connection.execute(
+            insert_on_conflict(DailyEmailStats, ['jour', 'statut'], bind=connection,
+                               increment_columns=['nombre']),
+            [{'jour': j, 'statut': s, 'nombre': n} for (j, s), n in compteurs.items()],
+        )
+    db.session.commit()
+    return len({(j, s) for j, s, _ in deltas}), len(compteurs)
+
+
+def _valeur_precedente(target, champ):
+    """Valeur de ``champ`` avant le flush en cours (ou valeur actuelle si inchangée)."""
+    history = inspect(target).attrs[champ].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(target, champ)
+
+
+def _valeurs(target, champs, precedentes=False):
+    if precedentes:
+        return [_valeur_precedente(target, champ) for champ in champs]
+    return [getattr(target, champ) for champ in champs]
+
+
+# active_history : l'ancienne valeur est chargée avant d'être remplacée, même
+# sur un objet expiré, pour pouvoir décrémenter le bon cumul.
+for _attribut in (Client.date_ajout, Client.date_expiration, Client.statut,
+                  EmailLog.date_envoi, EmailLog.statut):
+    event.listen(_attribut, 'set', lambda target, value, oldvalue, initiator: None,
+                 active_history=True)
+
+
+@event.listens_for(Client, 'after_insert')
+def _client_ajoute(mapper, connection, target):
+    appliquer_deltas_clients(connection, deltas_client(*_valeurs(target, CHAMPS_CLIENT), 1))
+
+
+@event.listens_for(Client, 'after_update')
+def _client_modifie(mapper, connection, target):
+    avant = _valeurs(target, CHAMPS_CLIENT, precedentes=True)
+    apres = _valeurs(target, CHAMPS_CLIENT)
+    if avant != apres:
+        deltas = deltas_client(*avant, -1)
+        deltas.update(deltas_client(*apres, 1))
+        appliquer_deltas_clients(connection, deltas)
+
+
+@event.listens_for(Client, 'after_delete')
+def _client_supprime(mapper, connection, target):
+    avant = _valeurs(target, CHAMPS_CLIENT, precedentes=True)
+    appliquer_deltas_clients(connection, deltas_client(*avant, -1))
+
+
+@event.listens_for(EmailLog, 'after_insert')
+def _email_ajoute(mapper, connection, target):
+    comptabiliser_emails(connection, [_valeurs(target, CHAMPS_EMAIL)])
+
+
+@event.listens_for(EmailLog, 'after_update')
+def _email_modifie(mapper, connection, target):
+    avant = _valeurs(target, CHAMPS_EMAIL, precedentes=True)
+    apres = _valeurs(target, CHAMPS_EMAIL)
+    if avant != apres:
+        comptabiliser_emails(connection, [avant], signe=-1)
+        comptabiliser_emails(connection, [apres])
+
+
+@event.listens_for(EmailLog, 'after_delete')
+def _email_supprime(mapper, connection, target):
+    comptabiliser_emails(connection, [_valeurs(target, CHAMPS_EMAIL, precedentes=True)], signe=-1)
+
+
+def total_emails():
+    """Nombre total d'emails journalisés, lu dans les cumuls plutôt que par COUNT(*)."""
+    return db.session.query(func.coalesce(func.sum(DailyEmailStats.nombre), 0)).scalar()
+
+
+def calculer_dashboard(now=None):
+    """Statistiques du dashboard à partir des cumuls journaliers.
+
+    Le coût dépend du nombre de jours couverts, plus du nombre de clients
+    ou d'emails.
+    """
+    now = now or datetime.now()
+    today = now.date()
+    six_months_ago = today - timedelta(days=180)
+    thirty_days_ago = (now - timedelta(days=30)).date()
+
+    par_statut = {
+        statut: (total, expiring)
+        for statut, total, expiring in db.session.query(
+            DailyClientStats.statut,
+            func.coalesce(func.sum(DailyClientStats.ajouts), 0),
+            func.coalesce(func.sum(case(
+                (DailyClientStats.jour <= today + timedelta(days=7), DailyClientStats.expirations),
+                else_=0,
+            )), 0),
+        ).group_by(DailyClientStats.statut)
+    }
+    mois = expression_mois(DailyClientStats.jour).label('mois')
+    monthly = db.session.query(mois, func.sum(DailyClientStats.ajouts)) \
+        .filter(DailyClientStats.jour >= six_months_ago) \
+        .group_by(mois).order_by(mois).all()
+    emails_sent = db.session.query(func.coalesce(func.sum(DailyEmailStats.nombre), 0)) \
+        .filter(DailyEmailStats.jour >= thirty_days_ago, DailyEmailStats.statut == 'envoyé') \
+        .scalar()
+
+    stats = {
+        'total_clients': sum(total for total, _ in par_statut.values()),
+        'clients_actifs': par_statut.get('actif', (0, 0))[0],
+        'clients_inactifs': par_statut.get('inactif', (0, 0))[0],
+        'expiring_soon': par_statut.get('actif', (0, 0))[1],
+        'emails_sent': emails_sent,
+        'monthly_data': {m: n for m, n in monthly if m and n},
+    }
+    stats['statut_data'] = {
+        'Actifs': stats['clients_actifs'],
+        'Inactifs': stats['clients_inactifs'],
+    }
+    return stats
+
+
+def statistiques_dashboard(ttl=None):
+    return dashboard_cache.get_or_set('dashboard', calculer_dashboard, ttl)
@@ -0,0 +1,152 @@
+"""Tâches longues (exports PDF, imports de clients) exécutées par ``flask worker``.
+
+Les routes web ne font qu'enregistrer un ``ExportJob`` ou un ``ImportJob``
+en attente. Le worker les réclame comme l'outbox (UPDATE conditionnel sur
+statut = 'pending') et les exécute sur son propre pool de
+``EXPORT_MAX_WORKERS`` threads, à côté des envois : le recyclage des
+processus web n'interrompt plus aucune tâche.
+
+Une tâche 'running' sans signe de vie depuis ``JOB_TIMEOUT`` secondes
+(worker arrêté brutalement) passe en 'failed'. Les fichiers des tâches
+(PDF, fichiers téléversés, rapports d'erreurs) sont supprimés
+``JOB_RETENTION_HOURS`` heures après leur fin.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, update
+from .exports import generer_export
+from .extensions import db
+from .imports import executer_import
+from .models import ExportJob, ImportJob
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+TACHES = ((ExportJob, generer_export), (ImportJob, executer_import))
+
+
+def reclamer_tache(modele, worker_id):
+    """Réserve la plus ancienne tâche en attente de ``modele`` ; retourne son id ou None."""
+    job_id = db.session.query(modele.id).filter(modele.statut == PENDING) \
+        .order_by(modele.created_at).limit(1).scalar()
+    if job_id is None:
+        return None
+    resultat = db.session.execute(
+        update(modele)
+        .where(modele.id == job_id, modele.statut == PENDING)
+        .values(statut=RUNNING, verrouille_par=worker_id, verrouille_a=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    # Réclamée entre-temps par un autre worker : elle sera reprise au tour suivant
+    return job_id if resultat.rowcount else None
+
+
+def marquer_taches_interrompues(maintenant=None):
+    """Passe en échec les tâches 'running' dont le worker ne donne plus signe de vie."""
+    maintenant = maintenant or datetime.utcnow()
+    limite = maintenant - timedelta(seconds=current_app.config['JOB_TIMEOUT'])
+    total = 0
+    for modele, _ in TACHES:
+        total += db.session.execute(
+            update(modele)
+            .where(modele.statut == RUNNING,
+                   func.coalesce(modele.verrouille_a, modele.created_at) < limite)
+            .values(statut=FAILED, erreur="Tâche interrompue : le worker s'est arrêté.",
+                    termine_a=maintenant)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    db.session.commit()
+    return total
+
+
+def purger_fichiers(maintenant=None):
+    """Supprime les fichiers et exports expirés ; retourne le nombre de fichiers supprimés."""
+    config = current_app.config
+    maintenant = maintenant or datetime.utcnow()
+    retention = timedelta(hours=config['JOB_RETENTION_HOURS'])
+    actives = set()
+    for modele, _ in TACHES:
+        actives.update(db.session.scalars(
+            db.select(modele.id).where(modele.statut.in_((PENDING, RUNNING)))))
+
+    # Fichiers nommés d'après l'id de leur tâche : <id>.pdf, <id>.csv, <id>-erreurs.csv
+    limite_fichiers = time.time() - retention.total_seconds()
+    supprimes = 0
+    for dossier in (config['EXPORT_DIR'], config['IMPORT_DIR']):
+        if not os.path.isdir(dossier):
+            continue
+        with os.scandir(dossier) as entrees:
+            for entree in entrees:
+                if entree.is_file() and entree.name[:32] not in actives \
+                        and entree.stat().st_mtime < limite_fichiers:
+                    os.remove(entree.path)
+                    supprimes += 1
+
+    limite = maintenant - retention
+    db.session.execute(
+        delete(ExportJob).where(ExportJob.statut.in_((DONE, FAILED)), ExportJob.termine_a < limite)
+    )
+    db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.rapport_chemin.isnot(None), ImportJob.termine_a < limite)
+        .values(rapport_chemin=None)
+    )
+    db.session.commit()
+    return supprimes
+
+
+class ExecuteurTaches:
+    """Pool de threads du worker pour les tâches longues."""
+
+    # Intervalle (s) entre deux passes de détection des tâches interrompues et de purge
+    ENTRETIEN = 300
+
+    def __init__(self, worker_id, app=None):
+        self.app = app or current_app._get_current_object()
+        self.worker_id = worker_id
+        self.max_workers = self.app.config['EXPORT_MAX_WORKERS']
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tache')
+        self._en_cours = set()
+        self._lock = threading.Lock()
+        self._dernier_entretien = None
+
+    def _termine(self, future):
+        with self._lock:
+            self._en_cours.discard(future)
+
+    def lancer(self):
+        """Réclame des tâches tant qu'un thread est libre ; retourne le nombre lancé."""
+        lancees = 0
+        for modele, fonction in TACHES:
+            while True:
+                with self._lock:
+                    if len(self._en_cours) >= self.max_workers:
+                        return lancees
+                job_id = reclamer_tache(modele, self.worker_id)
+                if job_id is None:
+                    break
+                future = self._executor.submit(fonction, self.app, job_id)
+                with self._lock:
+                    self._en_cours.add(future)
+                future.add_done_callback(self._termine)
+                lancees += 1
+        return lancees
+
+    def entretenir(self, forcer=False):
+        maintenant = time.monotonic()
+        if forcer or self._dernier_entretien is None or \
+                maintenant - self._dernier_entretien >= self.ENTRETIEN:
+            marquer_taches_interrompues()
+            purger_fichiers()
+            self._dernier_entretien = maintenant
+
+    def fermer(self):
+        """Attend la fin des tâches en cours puis arrête le pool."""
+        self._executor.shutdown(wait=True)
@@ -1,9 +1,18 @@
 import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'votre_cle_secrete_par_defaut')
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
+    # Base SQLite relative au dossier instance/, comme l'ancienne application monolithique
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///clients.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Pagination de la liste des clients
+    CLIENTS_PER_PAGE = int(os.environ.get('CLIENTS_PER_PAGE', 50))
+    CLIENTS_MAX_PER_PAGE = int(os.environ.get('CLIENTS_MAX_PER_PAGE', 200))
+    EMAIL_LOGS_PER_PAGE = int(os.environ.get('EMAIL_LOGS_PER_PAGE', 20))
     
     # Configuration email
     SMTP_SERVER = 'smtp.example.com'
@@ -11,14 +20,124 @@ class Config:
     EMAIL_EXPEDITEUR = os.environ.get('EMAIL_EXPEDITEUR')
     MOT_DE_PASSE_EMAIL = os.environ.get('MOT_DE_PASSE_EMAIL')
 
+    # Pool de connexions SMTP
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4))
+    SMTP_POOL_IDLE_TIMEOUT = int(os.environ.get('SMTP_POOL_IDLE_TIMEOUT', 60))
+    SMTP_POOL_HEALTH_CHECK_AFTER = int(os.environ.get('SMTP_POOL_HEALTH_CHECK_AFTER', 10))
+    SMTP_TIMEOUT = int(os.environ.get('SMTP_TIMEOUT', 30))
+    SMTP_MAX_CONCURRENCY_PER_SERVER = int(os.environ.get('SMTP_MAX_CONCURRENCY_PER_SERVER', 4))
+
+    # Envoi groupé des rappels
+    DISPATCH_MAX_WORKERS = int(os.environ.get('DISPATCH_MAX_WORKERS', 8))
+    DISPATCH_BATCH_SIZE = int(os.environ.get('DISPATCH_BATCH_SIZE', 200))
+
+    # File d'attente des emails sortants (flask worker)
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+    OUTBOX_POLL_INTERVAL = int(os.environ.get('OUTBOX_POLL_INTERVAL', 5))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+    OUTBOX_BACKOFF_BASE = int(os.environ.get('OUTBOX_BACKOFF_BASE', 60))
+    OUTBOX_BACKOFF_MAX = int(os.environ.get('OUTBOX_BACKOFF_MAX', 3600))
+    OUTBOX_LOCK_TIMEOUT = int(os.environ.get('OUTBOX_LOCK_TIMEOUT', 900))
+    # Intervalle (s) de publication des compteurs du pool SMTP de chaque worker (/smtp/stats)
+    OUTBOX_STATS_INTERVAL = int(os.environ.get('OUTBOX_STATS_INTERVAL', 60))
+
+    # Campagnes : débit par défaut (emails/minute), tranche maximale et intervalle (s) d'alimentation
+    CAMPAIGN_DEFAULT_RATE = int(os.environ.get('CAMPAIGN_DEFAULT_RATE', 600))
+    CAMPAIGN_BATCH_SIZE = int(os.environ.get('CAMPAIGN_BATCH_SIZE', 500))
+    CAMPAIGN_TICK_SECONDS = int(os.environ.get('CAMPAIGN_TICK_SECONDS', 10))
+
+    # Durée de vie (s) du cache des statistiques du dashboard
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 60))
+
+    # Utilisateur connecté : durée de vie (s) de l'instantané en cache et dans la session, taille du cache
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+
+    # Mots de passe : facteur de coût bcrypt (les hashes d'un autre coût sont refaits à la connexion),
+    # vérifications simultanées par processus, attente maximale en file et durée maximale (s)
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    BCRYPT_MAX_CONCURRENCY = int(os.environ.get('BCRYPT_MAX_CONCURRENCY', 2))
+    BCRYPT_QUEUE_SIZE = int(os.environ.get('BCRYPT_QUEUE_SIZE', 8))
+    BCRYPT_TIMEOUT = int(os.environ.get('BCRYPT_TIMEOUT', 10))
+
+    # Limitation des connexions sur une fenêtre glissante : tentatives par IP, échecs par nom d'utilisateur.
+    # Backend : 'memoire' (par processus), 'base' (partagé entre processus et serveurs) ou 'module:Classe'
+    LOGIN_RATE_WINDOW = int(os.environ.get('LOGIN_RATE_WINDOW', 300))
+    LOGIN_MAX_ATTEMPTS_PER_IP = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_IP', 20))
+    LOGIN_MAX_FAILURES_PER_USERNAME = int(os.environ.get('LOGIN_MAX_FAILURES_PER_USERNAME', 5))
+    LOGIN_RATE_LIMIT_BACKEND = os.environ.get('LOGIN_RATE_LIMIT_BACKEND', 'memoire')
+    # Proxys de confiance devant l'application (Nginx : 1), pour l'IP réelle du client
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+
+    # Exports : au-delà du seuil, le PDF est généré par flask worker dans EXPORT_DIR
+    EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'exports'))
+    # Tâches longues (exports, imports) menées en parallèle par chaque flask worker
+    EXPORT_MAX_WORKERS = int(os.environ.get('EXPORT_MAX_WORKERS', 2))
+    # Tâche 'running' sans signe de vie depuis JOB_TIMEOUT s : marquée en échec ;
+    # fichiers des tâches supprimés JOB_RETENTION_HOURS heures après leur fin
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 3600))
+    JOB_RETENTION_HOURS = int(os.environ.get('JOB_RETENTION_HOURS', 24))
+    PDF_EXPORT_ASYNC_THRESHOLD = int(os.environ.get('PDF_EXPORT_ASYNC_THRESHOLD', 5000))
+    PDF_SPOOL_MAX_SIZE = int(os.environ.get('PDF_SPOOL_MAX_SIZE', 8 * 1024 * 1024))
+
+    # Durée maximale (s) du démarrage à froid de create_app (flask startup-check)
+    STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', 2.0))
+
+    # Import de clients (CSV/XLSX) par flask worker, par lots d'upserts
+    IMPORT_DIR = os.environ.get('IMPORT_DIR', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'imports'))
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+
+    # Archivage de l'historique des emails : mois entiers plus vieux que la rétention
+    EMAIL_LOG_RETENTION_DAYS = int(os.environ.get('EMAIL_LOG_RETENTION_DAYS', 365))
+    EMAIL_ARCHIVE_DIR = os.environ.get('EMAIL_ARCHIVE_DIR', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'archives'))
+    EMAIL_ARCHIVE_HOUR = int(os.environ.get('EMAIL_ARCHIVE_HOUR', 3))
+
+    # Rappels d'expiration : délais en jours avant l'échéance, heure d'exécution quotidienne
+    REMINDER_LEAD_DAYS = [int(j) for j in os.environ.get('REMINDER_LEAD_DAYS', '30,7,2').split(',') if j.strip()]
+    REMINDER_HOUR = int(os.environ.get('REMINDER_HOUR', 8))
+
+    # Planificateur : un seul processus leader exécute les tâches. SCHEDULER_ENABLED=false
+    # retire les workers gunicorn de la candidature (planificateur lancé par « flask scheduler »)
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    SCHEDULER_LOCK_TTL = int(os.environ.get('SCHEDULER_LOCK_TTL', 60))
+    SCHEDULER_MISFIRE_GRACE_TIME = int(os.environ.get('SCHEDULER_MISFIRE_GRACE_TIME', 86400))
+
 class DevelopmentConfig(Config):
     DEBUG = True
 
+def options_pool(uri):
+    """Pool de connexions d'un worker : une connexion par thread de requête, plus les tâches de fond."""
+    if uri.startswith('sqlite'):
+        return {}
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', threads + 2)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', threads)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        # Connexions coupées par le serveur ou un pare-feu : vérifiées avant usage, renouvelées
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+
 class ProductionConfig(Config):
     DEBUG = False
+    SQLALCHEMY_ENGINE_OPTIONS = options_pool(Config.SQLALCHEMY_DATABASE_URI)
+
+class TestingConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    SCHEDULER_ENABLED = False
+    BCRYPT_LOG_ROUNDS = 4
+    LOGIN_RATE_LIMIT_BACKEND = 'memoire'
+
+def nom_config():
+    """Configuration choisie par FLASK_CONFIG (ou FLASK_ENV, utilisé par les déploiements existants)."""
+    return os.environ.get('FLASK_CONFIG') or os.environ.get('FLASK_ENV') or 'default'
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
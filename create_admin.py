@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 """
 Script pour créer un utilisateur administrateur
-Usage: python create_admin.py
+Usage: python create_admin.py (équivalent à: flask --app wsgi create-admin)
 """
 
-from app import app, db, User
 import getpass
+from app import create_app, db
+from app.models import creer_utilisateur
+from app.schema import completer_schema
 
 def create_admin_user():
+    app = create_app()
     with app.app_context():
         # Créer les tables si elles n'existent pas
-        db.create_all()
+        completer_schema(db.session.connection())
+        db.session.commit()
         
         print("=== Création d'un utilisateur administrateur ===")
         
@@ -18,22 +22,12 @@ def create_admin_user():
         email = input("Email: ")
         password = getpass.getpass("Mot de passe: ")
         
-        # Vérifier si l'utilisateur existe déjà
-        if User.query.filter_by(username=username).first():
-            print(f"Erreur: L'utilisateur '{username}' existe déjà!")
-            return
-        
-        if User.query.filter_by(email=email).first():
-            print(f"Erreur: L'email '{email}' est déjà utilisé!")
+        try:
+            creer_utilisateur(username, email, password)
+        except ValueError as e:
+            print(f"Erreur: {e}")
             return
         
-        # Créer l'utilisateur
-        user = User(username=username, email=email)
-        user.set_password(password)
-        
-        db.session.add(user)
-        db.session.commit()
-        
         print(f"✅ Utilisateur administrateur '{username}' créé avec succès!")
         print("Vous pouvez maintenant vous connecter à l'application.")
 
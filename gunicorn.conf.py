@@ -0,0 +1,36 @@
+"""Configuration gunicorn de production.
+
+Usage : gunicorn -c gunicorn.conf.py wsgi:app
+
+Workers synchrones à threads (gthread) : les requêtes attendent surtout la
+base et le SMTP, les threads couvrent ces attentes sans multiplier la
+mémoire. Chaque valeur peut être surchargée par sa variable d'environnement.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+# Lu aussi par config.options_pool pour dimensionner le pool SQLAlchemy de chaque worker
+threads = int(os.environ.setdefault('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recyclage périodique des workers, décalé pour ne pas tous les relancer ensemble
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+# Préchargement : l'application est importée une fois dans le maître puis
+# partagée par fork (démarrage plus rapide, mémoire partagée).
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    # Application chargée dans le worker (préchargée ou non) : pool neuf, candidature au planificateur
+    from app import apres_fork
+    apres_fork()
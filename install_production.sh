@@ -87,7 +87,7 @@ EOF
 
 echo "📊 Initialisation de la base de données..."
 mkdir -p instance
-python3 -c "from app import app, db; app.app_context().push(); db.create_all()"
+FLASK_CONFIG=production flask --app wsgi schema upgrade
 
 echo "👤 Création d'un utilisateur administrateur..."
 python3 create_admin.py
@@ -122,14 +122,26 @@ sudo systemctl reload nginx
 echo "🔄 Configuration de Supervisor..."
 sudo tee /etc/supervisor/conf.d/$APP_NAME.conf > /dev/null << EOF
 [program:$APP_NAME]
-command=$APP_DIR/venv/bin/python app.py
+command=$APP_DIR/venv/bin/gunicorn -c gunicorn.conf.py wsgi:app
 directory=$APP_DIR
 user=www-data
 autostart=true
 autorestart=true
 redirect_stderr=true
 stdout_logfile=/var/log/$APP_NAME.log
-environment=FLASK_ENV=production
+environment=FLASK_CONFIG=production,TRUSTED_PROXIES=1
+
+; Envoi des emails en file, exports PDF et imports de clients
+[program:$APP_NAME-worker]
+command=$APP_DIR/venv/bin/flask --app wsgi worker
+directory=$APP_DIR
+user=www-data
+autostart=true
+autorestart=true
+stopwaitsecs=60
+redirect_stderr=true
+stdout_logfile=/var/log/$APP_NAME-worker.log
+environment=FLASK_CONFIG=production
 EOF
 
 echo "🛡️ Configuration des permissions..."
@@ -146,7 +158,7 @@ sudo ufw allow 'Nginx Full'
 echo "🚀 Démarrage de l'application..."
 sudo supervisorctl reread
 sudo supervisorctl update
-sudo supervisorctl start $APP_NAME
+sudo supervisorctl start $APP_NAME $APP_NAME-worker
 
 # Configuration HTTPS si domaine fourni
 if [ "$DOMAIN" != "localhost" ]; then
@@ -180,9 +192,9 @@ if [ "$DOMAIN" != "localhost" ]; then
     echo "🔒 HTTPS: https://$DOMAIN (si configuré)"
 fi
 echo "📁 Répertoire: $APP_DIR"
-echo "📊 Logs: sudo tail -f /var/log/$APP_NAME.log"
-echo "🔄 Redémarrer: sudo supervisorctl restart $APP_NAME"
-echo "📋 Status: sudo supervisorctl status $APP_NAME"
+echo "📊 Logs: sudo tail -f /var/log/$APP_NAME.log /var/log/$APP_NAME-worker.log"
+echo "🔄 Redémarrer: sudo supervisorctl restart $APP_NAME $APP_NAME-worker"
+echo "📋 Status: sudo supervisorctl status $APP_NAME $APP_NAME-worker"
 echo ""
 echo "⚠️  N'oubliez pas de:"
 echo "   1. Modifier les paramètres email dans $APP_DIR/.env"
@@ -6,7 +6,6 @@ Usage: python production_setup.py
 
 import os
 import ssl
-from app import app
 
 def setup_https():
     """Configure HTTPS pour la production"""
@@ -46,16 +45,18 @@ def run_production():
         print("Veuillez configurer le fichier .env avant de lancer en production")
         return
     
-    # Configuration HTTPS
-    ssl_context = setup_https()
-    
-    # Lancer l'application
-    if ssl_context:
+    os.environ['FLASK_CONFIG'] = 'production'
+
+    # Serveur WSGI de production (voir gunicorn.conf.py) ; le certificat est
+    # chargé par gunicorn, setup_https ne sert qu'à vérifier sa présence
+    commande = ['gunicorn', '-c', 'gunicorn.conf.py']
+    if setup_https():
         print("🚀 Lancement en HTTPS sur le port 443")
-        app.run(host='0.0.0.0', port=443, ssl_context=ssl_context, debug=False)
+        commande += ['--bind', '0.0.0.0:443', '--certfile', 'cert.pem', '--keyfile', 'key.pem']
     else:
         print("🚀 Lancement en HTTP sur le port 80 (non sécurisé)")
-        app.run(host='0.0.0.0', port=80, debug=False)
+        commande += ['--bind', '0.0.0.0:80']
+    os.execvp(commande[0], commande + ['wsgi:app'])
 
 if __name__ == '__main__':
     run_production()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+# Base SQLite jetable, choisie avant le premier import de config
+os.environ.setdefault(
+    'TEST_DATABASE_URL',
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='clients-tests-'), 'clients.db'),
+)
+
+from datetime import date
+
+import pytest
+
+from app import create_app
+from app.auth import securite
+from app.extensions import db
+from app.models import Client, User, hacher_mot_de_passe, utilisateurs_cache
+from app.search import supprimer_index
+from app.stats import dashboard_cache
+
+
+@pytest.fixture(scope='session')
+def app():
+    return create_app('testing')
+
+
+@pytest.fixture
+def base(app, tmp_path):
+    """Schéma recréé pour chaque test, dans un contexte d'application."""
+    app.config.update(
+        EMAIL_ARCHIVE_DIR=str(tmp_path / 'archives'),
+        EXPORT_DIR=str(tmp_path / 'exports'),
+        IMPORT_DIR=str(tmp_path / 'imports'),
+    )
+    with app.app_context():
+        supprimer_index(db.session.connection())
+        db.session.commit()
+        db.drop_all()
+        db.create_all()
+        dashboard_cache.invalidate()
+        utilisateurs_cache.invalidate()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def nouveau_client(base):
+    def creer(nom='Client', email=None, **champs):
+        champs.setdefault('date_expiration', date(2030, 1, 1))
+        client = Client(nom=nom, email=email or f'{nom.lower().replace(" ", ".")}@example.com', **champs)
+        db.session.add(client)
+        db.session.commit()
+        return client
+    return creer
+
+
+@pytest.fixture
+def client_connecte(app, base, monkeypatch):
+    """Client HTTP connecté en tant que ``admin`` (mot de passe ``secret-admin``)."""
+    monkeypatch.setattr(securite, '_limiteur', None)
+    db.session.add(User(username='admin', email='admin@example.com',
+                        password_hash=hacher_mot_de_passe('secret-admin')))
+    db.session.commit()
+    client_http = app.test_client()
+    reponse = client_http.post('/auth/login', data={'username': 'admin', 'password': 'secret-admin'})
+    assert reponse.status_code == 302
+    return client_http
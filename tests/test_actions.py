@@ -0,0 +1,31 @@
+from app.actions import condition_selection, supprimer
+from app.extensions import db
+from app.models import Client, EmailLog, EmailOutbox
+from app.outbox import SENDING, enqueue
+
+
+def test_supprimer_conserve_les_clients_avec_historique(nouveau_client):
+    sans_email, en_attente, envoye, en_cours = (nouveau_client(f'Client {i}') for i in range(4))
+    enqueue(en_attente, 'Rappel', 'Bonjour')
+    db.session.add(EmailLog(client_id=envoye.id, sujet='Rappel', contenu='Bonjour'))
+    enqueue(en_cours, 'Rappel', 'Bonjour')
+    EmailOutbox.query.filter_by(client_id=en_cours.id).one().statut = SENDING
+    db.session.commit()
+    ids = [sans_email.id, en_attente.id, envoye.id, en_cours.id]
+
+    assert supprimer(condition_selection(ids=ids)) == (2, 2)
+    assert sorted(ident for (ident,) in db.session.query(Client.id)) == [envoye.id, en_cours.id]
+    assert [l.client_id for l in EmailOutbox.query] == [en_cours.id]
+
+
+def test_suppression_individuelle(client_connecte, nouveau_client):
+    sans_email, envoye = nouveau_client('Sans email'), nouveau_client('Envoyé')
+    enqueue(sans_email, 'Rappel', 'Bonjour')
+    db.session.add(EmailLog(client_id=envoye.id, sujet='Rappel', contenu='Bonjour'))
+    db.session.commit()
+    ids = sans_email.id, envoye.id
+
+    for ident in ids:
+        assert client_connecte.get(f'/supprimer_client/{ident}').status_code == 302
+    assert [ident for (ident,) in db.session.query(Client.id)] == [ids[1]]
+    assert EmailOutbox.query.count() == 0
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, text
+
+from app.archives import archiver_mois, contenu_archive, page_archive, partitionner_email_log
+from app.extensions import db
+from app.models import EmailLog, EmailLogArchive
+
+
+def emails(client, debut, nombre):
+    # Trois emails par instant : le tri départage par id
+    lignes = [
+        {'client_id': client.id, 'sujet': f'Rappel {i}', 'contenu': f'Message {i}',
+         'date_envoi': debut + timedelta(minutes=i // 3), 'statut': ('envoyé', 'échec')[i % 5 == 0]}
+        for i in range(nombre)
+    ]
+    db.session.execute(insert(EmailLog), lignes)
+    db.session.commit()
+
+
+def ordre_historique(mois):
+    return [
+        ident for (ident,) in db.session.execute(
+            db.select(EmailLog.id)
+            .where(db.func.strftime('%Y-%m', EmailLog.date_envoi) == mois)
+            .order_by(EmailLog.date_envoi.desc(), EmailLog.id.desc()))
+    ]
+
+
+def test_pages_de_l_archive(nouveau_client):
+    client = nouveau_client('Alice')
+    emails(client, datetime(2024, 1, 1), 1234)
+    emails(client, datetime(2024, 2, 1), 5)
+    attendu = ordre_historique('2024-01')
+
+    assert archiver_mois('2024-01') == 1234
+    assert EmailLog.query.count() == 5
+    archive = db.session.get(EmailLogArchive, '2024-01')
+    assert (archive.nombre, archive.envoyes, archive.echecs) == (1234, 987, 247)
+
+    pages, curseur = [], None
+    while True:
+        page = page_archive('2024-01', 100, curseur)
+        pages.append([e.id for e in page.items])
+        curseur = page.next_cursor
+        if curseur is None:
+            break
+    assert [ident for page in pages for ident in page] == attendu
+    assert [len(page) for page in pages] == [100] * 12 + [34]
+
+    # Retour en arrière depuis la dernière page
+    for precedente in reversed(pages[:-1]):
+        page = page_archive('2024-01', 100, page.prev_cursor)
+        assert [e.id for e in page.items] == precedente
+    assert page.prev_cursor is None
+
+
+def test_contenu_et_fusion(nouveau_client):
+    client = nouveau_client('Alice')
+    emails(client, datetime(2024, 1, 1), 3)
+    personnalise = EmailLog(client_id=client.id, sujet='Bonjour', contenu='Cher {{ nom }}',
+                            variables='{"nom": "Alice"}', date_envoi=datetime(2024, 1, 20))
+    db.session.add(personnalise)
+    db.session.commit()
+    ident = personnalise.id
+
+    assert archiver_mois('2024-01') == 4
+    assert contenu_archive('2024-01', ident).message_envoye == 'Cher Alice'
+    assert contenu_archive('2024-01', ident + 100) is None
+
+    # Emails du même mois arrivés après l'archivage : fusionnés avec l'archive
+    emails(client, datetime(2024, 1, 31), 2)
+    assert archiver_mois('2024-01') == 2
+    assert db.session.get(EmailLogArchive, '2024-01').nombre == 6
+    assert len(page_archive('2024-01', 10).items) == 6
+    assert archiver_mois('2024-01') == 0
+
+
+def test_partitionnement_garde_les_contraintes_du_contenu(base):
+    if db.engine.dialect.name != 'postgresql':
+        pytest.skip('partitionnement natif : PostgreSQL seulement')
+    assert partitionner_email_log()
+    connection = db.session.connection()
+
+    assert connection.execute(text(
+        "SELECT 1 FROM pg_indexes WHERE tablename = 'email_log' AND indexname = 'ix_email_log_content_hash'"
+    )).first()
+    assert connection.execute(text(
+        "SELECT 1 FROM pg_constraint WHERE contype = 'f' AND conrelid = 'email_log'::regclass "
+        "AND confrelid = 'email_content'::regclass"
+    )).first()
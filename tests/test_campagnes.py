@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.campagnes import (CANCELLED, DONE, PAUSED, RUNNING, alimenter, alimenter_campagnes, annuler,
+                           creer_campagne, mettre_en_pause, progression, reprendre)
+from app.extensions import db
+from app.models import EmailOutbox, EmailTemplate
+from app.outbox import PENDING, SENT
+
+
+@pytest.fixture
+def template(base):
+    template = EmailTemplate(nom='Relance', sujet='Relance {{ nom }}', contenu='Bonjour {{ nom }}')
+    db.session.add(template)
+    db.session.commit()
+    return template
+
+
+def campagne(nouveau_client, template, nombre, debit=60, **filtre):
+    for i in range(nombre):
+        nouveau_client(f'Client {i}')
+    nouveau_client('Inactif', statut='inactif')
+    return creer_campagne('Relance', template, debit, statut='actif', **filtre)
+
+
+def test_audience_figee_a_la_creation(nouveau_client, template):
+    relance = campagne(nouveau_client, template, 5)
+    nouveau_client('Arrivé après')
+    assert (relance.statut, relance.total) == (RUNNING, 5)
+    assert creer_campagne('Vide', template, 60, statut='suspendu').statut == DONE
+
+
+def test_debit_et_credit_limite_a_un_tour(nouveau_client, template):
+    relance = campagne(nouveau_client, template, 30)
+    debut = datetime(2024, 1, 1, 12)
+    relance.derniere_alimentation = debut
+
+    # 60/min : un email par seconde écoulée
+    assert alimenter(relance, debut + timedelta(seconds=5), batch_size=100, intervalle=10) == 5
+    assert alimenter(relance, debut + timedelta(seconds=5), batch_size=100, intervalle=10) == 0
+
+    # Après une longue interruption : au plus un lot, puis le crédit d'un seul tour
+    reprise = debut + timedelta(hours=1)
+    assert alimenter(relance, reprise, batch_size=4, intervalle=10) == 4
+    assert alimenter(relance, reprise, batch_size=100, intervalle=10) == 10
+    db.session.commit()
+
+    assert relance.mis_en_file == 19
+    cles = sorted(l.idempotency_key for l in EmailOutbox.query)
+    assert len(set(cles)) == 19 and all(c.startswith(f'campagne:{relance.id}:') for c in cles)
+
+
+def test_pause_reprise_et_annulation(nouveau_client, template):
+    relance = campagne(nouveau_client, template, 10)
+    relance.derniere_alimentation = datetime.utcnow() - timedelta(seconds=3)
+    db.session.commit()
+    assert alimenter_campagnes() == 3
+
+    mettre_en_pause(relance)
+    relance.derniere_alimentation = datetime.utcnow() - timedelta(minutes=5)
+    db.session.commit()
+    assert alimenter_campagnes() == 0
+
+    # Pas de rattrapage du temps passé en pause
+    reprendre(relance)
+    assert relance.statut == RUNNING
+    assert alimenter_campagnes() == 0
+
+    db.session.execute(update(EmailOutbox).where(EmailOutbox.id == 1).values(statut=SENT))
+    db.session.commit()
+    assert annuler(relance) == 2
+    assert relance.statut == CANCELLED
+    assert [l.statut for l in EmailOutbox.query] == [SENT]
+    assert annuler(relance) == 0
+
+
+def test_erreur_de_template_met_en_pause(nouveau_client, template):
+    template.contenu = 'Bonjour {{ nom '
+    relance = campagne(nouveau_client, template, 3)
+    relance.derniere_alimentation = datetime.utcnow() - timedelta(minutes=1)
+    db.session.commit()
+
+    assert alimenter_campagnes() == 0
+    assert relance.statut == PAUSED and relance.erreur
+    assert EmailOutbox.query.count() == 0
+
+
+def test_terminee_quand_tout_est_envoye(nouveau_client, template):
+    relance = campagne(nouveau_client, template, 3, debit=600)
+    relance.derniere_alimentation = datetime.utcnow() - timedelta(minutes=1)
+    db.session.commit()
+    assert alimenter_campagnes() == 3
+    assert relance.statut == RUNNING
+
+    db.session.execute(update(EmailOutbox).values(statut=SENT, sent_at=datetime.utcnow()))
+    db.session.commit()
+    alimenter_campagnes()
+    assert relance.statut == DONE
+
+
+def test_progression(nouveau_client, template):
+    relance = campagne(nouveau_client, template, 70, debit=600)
+    relance.derniere_alimentation = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert alimenter_campagnes() == 10
+
+    maintenant = datetime.utcnow()
+    db.session.execute(
+        update(EmailOutbox).where(EmailOutbox.id <= 8)
+        .values(statut=SENT, sent_at=maintenant - timedelta(minutes=1))
+    )
+    db.session.execute(update(EmailOutbox).where(EmailOutbox.id == 9).values(statut='failed'))
+    db.session.commit()
+
+    etat = progression(relance, maintenant)
+    assert (etat['envoyes'], etat['echecs'], etat['en_file'], etat['a_mettre_en_file']) == (8, 1, 1, 60)
+    assert etat['pourcentage'] == round(100 * 9 / 70, 1)
+    assert etat['debit_recent'] == 1.6
+    # 61 destinataires restants à 600/min : une minute, pas zéro
+    assert etat['minutes_restantes'] == 1
+    assert EmailOutbox.query.filter_by(statut=PENDING).count() == 1
+
+    mettre_en_pause(relance)
+    assert progression(relance, maintenant)['minutes_restantes'] is None
@@ -0,0 +1,59 @@
+import csv
+import io
+import os
+from datetime import date
+
+from werkzeug.datastructures import FileStorage
+
+from app.extensions import db
+from app.imports import lancer_import
+from app.models import Client, ImportJob
+from app.queries import filtrer_clients
+from app.taches import ExecuteurTaches
+
+CSV = """Nom;Email;Téléphone;Date d'expiration;Statut
+Alice Martin;ALICE@example.com;06 00 00 00 00;01/06/2031;Inactif
+Bruno;bruno@example.com;;2031-02-03;
+Sans email;;;2031-01-01;actif
+Date invalide;date@example.com;;pas une date;actif
+"""
+
+
+def test_import_par_le_worker(app, nouveau_client):
+    alice = nouveau_client('Alice', email='Alice@Example.com', date_expiration=date(2030, 1, 1))
+    job = lancer_import(app, FileStorage(io.BytesIO(CSV.encode('utf-8')), filename='clients.csv'))
+    assert job.statut == 'pending'
+
+    executeur = ExecuteurTaches('test', app)
+    assert executeur.lancer() == 1
+    executeur.fermer()
+
+    db.session.expire_all()
+    job = db.session.get(ImportJob, job.id)
+    assert (job.statut, job.lignes_lues, job.crees, job.mis_a_jour, job.rejetees) == ('done', 4, 1, 1, 2)
+    assert not os.path.exists(job.chemin)
+    with open(job.rapport_chemin, encoding='utf-8-sig') as rapport:
+        assert [ligne[0] for ligne in csv.reader(rapport, delimiter=';')] == ['Ligne', '4', '5']
+
+    alice = db.session.get(Client, alice.id)
+    assert (alice.nom, alice.telephone, alice.date_expiration, alice.statut) == \
+        ('Alice Martin', '06 00 00 00 00', date(2031, 6, 1), 'inactif')
+    bruno = Client.query.filter_by(email='bruno@example.com').one()
+    assert (bruno.date_expiration, bruno.statut) == (date(2031, 2, 3), 'actif')
+    assert Client.query.count() == 2
+    assert [c.id for c in filtrer_clients(Client.query, 'martin')] == [alice.id]
+
+
+def test_cellule_vide_garde_la_valeur(app, nouveau_client):
+    alice = nouveau_client('Alice', telephone='06 11 22 33 44', statut='inactif', notes='VIP')
+    contenu = "Nom;Email;Téléphone;Date d'expiration;Statut;Notes\nAlice Martin;alice@example.com;;2031-06-01;;\n"
+    job = lancer_import(app, FileStorage(io.BytesIO(contenu.encode('utf-8')), filename='clients.csv'))
+    executeur = ExecuteurTaches('test', app)
+    executeur.lancer()
+    executeur.fermer()
+
+    db.session.expire_all()
+    assert db.session.get(ImportJob, job.id).mis_a_jour == 1
+    alice = db.session.get(Client, alice.id)
+    assert (alice.nom, alice.telephone, alice.statut, alice.notes, alice.date_expiration) == \
+        ('Alice Martin', '06 11 22 33 44', 'inactif', 'VIP', date(2031, 6, 1))
@@ -0,0 +1,12 @@
+from app.moteurs import mesurer_demarrage
+
+
+def test_create_app_ne_charge_aucun_module_differe():
+    _, modules = mesurer_demarrage('testing')
+    assert modules == []
+
+
+def test_demarrage_dans_le_budget(app):
+    # Meilleure de trois mesures, comme flask startup-check
+    secondes = min(mesurer_demarrage('testing')[0] for _ in range(3))
+    assert secondes < app.config['STARTUP_BUDGET_SECONDS']
@@ -0,0 +1,107 @@
+from datetime import datetime
+
+import pytest
+
+from app.actions import condition_selection, envoyer_template
+from app.extensions import db
+from app.models import EmailContent, EmailLog, EmailOutbox, EmailTemplate
+from app.outbox import FAILED, PENDING, SENT, OutboxWorker, enqueue, enqueue_selection
+
+
+@pytest.fixture
+def worker(app, base):
+    envois = []
+    reponses = {}
+
+    def envoyer(email, nom, sujet, message, variables):
+        envois.append((email, sujet, message))
+        return reponses.get(email, (True, 'ok'))
+
+    worker = OutboxWorker(envoyer, worker_id='test', app=app)
+    worker.envois, worker.reponses = envois, reponses
+    yield worker
+    worker.engine.fermer()
+    worker.taches.fermer()
+
+
+def test_enqueue_ignore_une_cle_deja_vue(nouveau_client):
+    client = nouveau_client('Alice')
+    assert enqueue(client, 'Rappel', 'Bonjour', idempotency_key='rappel:1')
+    assert not enqueue(client, 'Rappel', 'Bonjour', idempotency_key='rappel:1')
+    assert enqueue(client, 'Rappel', 'Bonjour', idempotency_key='rappel:2')
+    assert EmailOutbox.query.count() == 2
+
+
+def test_enqueue_selection_ignore_les_clients_deja_en_file(nouveau_client):
+    ids = [nouveau_client(f'Client {i}').id for i in range(3)]
+    assert enqueue_selection(condition_selection(ids=ids[:2]), 'Sujet', 'Corps', 'lot:1:') == 2
+    assert enqueue_selection(condition_selection(ids=ids), 'Sujet', 'Corps', 'lot:1:') == 1
+    assert sorted(l.idempotency_key for l in EmailOutbox.query) == [f'lot:1:{i}' for i in ids]
+
+
+def test_worker_envoie_et_journalise(nouveau_client, worker):
+    client = nouveau_client('Alice')
+    enqueue(client, 'Bonjour {{ nom }}', 'Cher {{ nom }}', variables='{"nom": "Alice"}')
+
+    rapport = worker.vider()
+
+    assert (rapport.envoyes, rapport.echecs) == (1, 0)
+    assert worker.envois == [('alice@example.com', 'Bonjour Alice', 'Cher {{ nom }}')]
+    ligne = EmailOutbox.query.one()
+    assert (ligne.statut, ligne.tentatives) == (SENT, 1)
+    log = EmailLog.query.one()
+    assert (log.sujet, log.statut, log.message_envoye) == ('Bonjour Alice', 'envoyé', 'Cher Alice')
+
+
+def test_worker_reessaie_puis_abandonne(nouveau_client, worker):
+    worker.max_tentatives = 2
+    client = nouveau_client('Alice')
+    worker.reponses[client.email] = (False, 'boîte pleine')
+    enqueue(client, 'Rappel', 'Bonjour')
+
+    worker.vider()
+    ligne = EmailOutbox.query.one()
+    assert (ligne.statut, ligne.tentatives) == (PENDING, 1)
+    assert ligne.prochaine_tentative > datetime.utcnow()
+    assert EmailLog.query.count() == 0
+
+    ligne.prochaine_tentative = datetime.utcnow()
+    db.session.commit()
+    worker.vider()
+    ligne = EmailOutbox.query.one()
+    assert (ligne.statut, ligne.tentatives, ligne.derniere_erreur) == (FAILED, 2, 'boîte pleine')
+    assert EmailLog.query.one().statut == 'échec'
+
+
+def test_template_personnalise_un_seul_contenu(nouveau_client, worker):
+    ids = [nouveau_client(nom).id for nom in ('Alice', 'Bruno', 'Chloé')]
+    template = EmailTemplate(nom='Relance', sujet='Relance {{ nom }}', contenu='Bonjour {{ nom }}')
+    db.session.add(template)
+    db.session.commit()
+
+    assert envoyer_template(condition_selection(ids=ids), template) == 3
+    assert {l.contenu for l in EmailOutbox.query} == {'Bonjour {{ nom }}'}
+
+    assert worker.vider().envoyes == 3
+    assert EmailContent.query.count() == 1
+    assert sorted((l.sujet, l.message_envoye) for l in EmailLog.query) == [
+        ('Relance Alice', 'Bonjour Alice'), ('Relance Bruno', 'Bonjour Bruno'),
+        ('Relance Chloé', 'Bonjour Chloé'),
+    ]
+    assert {l.template_id for l in EmailLog.query} == {template.id}
+
+
+def test_envoi_manuel_texte_libre_tel_quel(client_connecte, nouveau_client, worker):
+    client = nouveau_client('Alice')
+    url = f'/envoyer_email/{client.id}'
+    libre = {'sujet': 'Code {promo}', 'message': 'Tarif {{ 10 }} € {nom}', 'idempotency_key': 'libre'}
+    assert client_connecte.post(url, data=libre).status_code == 302
+    modele = dict(libre, idempotency_key='modele', template_id='1')
+    assert client_connecte.post(url, data=modele).status_code == 302
+
+    lignes = {l.idempotency_key: l for l in EmailOutbox.query}
+    assert lignes['libre'].variables is None
+    assert lignes['modele'].variables is not None
+
+    assert worker.vider().envoyes == 2
+    assert sorted(l.message_envoye for l in EmailLog.query) == ['Tarif 10 € Alice', 'Tarif {{ 10 }} € {nom}']
@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import update
+
+from app.extensions import db
+from app.models import Client
+from app.pagination import decoder_curseur, encoder_curseur, keyset_paginate
+
+
+def parcourir(colonne, descendant, per_page=4):
+    """Pages successives jusqu'à la fin, puis retour arrière jusqu'au début."""
+    pages, curseur = [], None
+    while True:
+        page = keyset_paginate(Client.query, colonne, Client.id, per_page, curseur, descendant=descendant)
+        pages.append([client.id for client in page])
+        if not page.next_cursor:
+            break
+        curseur = page.next_cursor
+    retour = [pages[-1]]
+    while page.prev_cursor:
+        page = keyset_paginate(Client.query, colonne, Client.id, per_page, page.prev_cursor,
+                               descendant=descendant)
+        retour.append([client.id for client in page])
+    return pages, retour[::-1]
+
+
+def test_curseur_aller_retour():
+    jeton = encoder_curseur(date(2024, 5, 1), 42, direction='prev')
+    assert decoder_curseur(jeton) == ('2024-05-01', 42, 'prev')
+    assert decoder_curseur('pas-un-curseur') is None
+    assert decoder_curseur(None) is None
+
+
+@pytest.mark.parametrize('descendant', [False, True])
+def test_pages_dans_les_deux_sens(nouveau_client, descendant):
+    for i in range(11):
+        nouveau_client(f'Client {i:02d}')
+    pages, retour = parcourir(Client.nom, descendant)
+    noms = [db.session.get(Client, ident).nom for page in pages for ident in page]
+    assert noms == sorted(noms, reverse=descendant)
+    assert len(noms) == 11
+    assert retour == pages
+
+
+@pytest.mark.parametrize('descendant', [False, True])
+def test_cles_de_tri_nulles(nouveau_client, descendant):
+    for i in range(13):
+        nouveau_client(f'Client {i}', date_ajout=date(2024, 1, 1 + i % 4))
+    # Le défaut de la colonne remplacerait un None passé à la création
+    db.session.execute(update(Client).where(Client.id % 3 == 0).values(date_ajout=None))
+    db.session.commit()
+    pages, retour = parcourir(Client.date_ajout, descendant)
+    # Même ordre que la base, NULL compris
+    ordre = (Client.date_ajout.desc(), Client.id.desc()) if descendant else (Client.date_ajout, Client.id)
+    assert [ident for page in pages for ident in page] == \
+        [client.id for client in Client.query.order_by(*ordre)]
+    assert retour == pages
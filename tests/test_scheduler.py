@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+
+from app import scheduler
+from app.extensions import db
+from app.models import EmailOutbox, ReminderWatermark, SchedulerLock
+from app.reminders import fenetres_rappels, planifier_rappels
+from app.scheduler import LeaderLock, demarrer_apres_fork
+
+
+def test_un_seul_detenteur_du_bail(base):
+    premier = LeaderLock(db.engine, ttl=60, owner='premier')
+    second = LeaderLock(db.engine, ttl=60, owner='second')
+
+    assert premier.acquire()
+    assert not second.acquire()
+    assert premier.acquire()
+
+    premier.release()
+    assert second.acquire()
+    assert not premier.acquire()
+
+
+def test_bail_expire_repris(base):
+    assert LeaderLock(db.engine, ttl=0, owner='arrete').acquire()
+    suivant = LeaderLock(db.engine, ttl=60, owner='suivant')
+    assert suivant.acquire()
+    assert db.session.get(SchedulerLock, 'scheduler').owner == 'suivant'
+
+
+def test_candidature_explicite(app, base, monkeypatch):
+    # create_app prépare le candidat sans le démarrer
+    assert app.extensions['scheduler']._thread is None
+    assert SchedulerLock.query.count() == 0
+
+    monkeypatch.setattr(scheduler, '_leader_scheduler', None)
+    monkeypatch.setitem(app.extensions, 'scheduler', app.extensions['scheduler'])
+    candidat = demarrer_apres_fork(app)
+    assert candidat._thread is None and not candidat.is_leader
+
+
+def test_fenetres_rattrapent_sans_rappels_en_double():
+    today = date(2024, 3, 10)
+    jour = lambda n: today + timedelta(days=n)
+
+    assert fenetres_rappels(today, [30, 7, 2], {}) == {
+        2: (jour(1), jour(2)), 7: (jour(6), jour(7)), 30: (jour(29), jour(30)),
+    }
+    # Trois jours sans exécution : les dates manquées sont reprises
+    assert fenetres_rappels(today, [30, 7, 2], {2: jour(-1), 7: jour(4), 30: jour(27)}) == {
+        2: (jour(-1), jour(2)), 7: (jour(4), jour(7)), 30: (jour(27), jour(30)),
+    }
+    # Longue interruption : seul le rappel le plus proche de l'échéance est envoyé
+    assert fenetres_rappels(today, [30, 7, 2], {2: jour(-20), 7: jour(-13), 30: jour(3)}) == {
+        2: (jour(-1), jour(2)), 7: (jour(2), jour(7)), 30: (jour(7), jour(30)),
+    }
+    # Déjà traitées aujourd'hui
+    assert fenetres_rappels(today, [30, 7, 2], {2: jour(2), 7: jour(7), 30: jour(30)}) == {}
+
+
+def test_planifier_rappels(app, nouveau_client, monkeypatch):
+    monkeypatch.setitem(app.config, 'REMINDER_LEAD_DAYS', [30, 7, 2])
+    today = date(2024, 3, 10)
+    for jours in (2, 5, 7, 9, 30):
+        nouveau_client(f'J{jours}', date_expiration=today + timedelta(days=jours))
+    nouveau_client('Inactif', date_expiration=today + timedelta(days=7), statut='inactif')
+
+    assert planifier_rappels(today) == {2: 1, 7: 1, 30: 1}
+    assert planifier_rappels(today) == {}
+
+    # Deux exécutions manquées : trois jours plus tard, J5 (J-2) et J9 (J-7) sont rattrapés
+    assert planifier_rappels(today + timedelta(days=3)) == {2: 1, 7: 1, 30: 0}
+    cles = sorted(ligne.idempotency_key.split(':')[1] + ' ' + ligne.destinataire_nom
+                  for ligne in EmailOutbox.query)
+    assert cles == ['J-2 J2', 'J-2 J5', 'J-30 J30', 'J-7 J7', 'J-7 J9']
+
+    # Fenêtres rejouées (repères perdus) : aucun rappel en double
+    ReminderWatermark.query.delete()
+    db.session.commit()
+    assert planifier_rappels(today) == {2: 0, 7: 0, 30: 0}
+    assert EmailOutbox.query.count() == 5
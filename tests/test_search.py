@@ -0,0 +1,53 @@
+import time
+
+from sqlalchemy import text
+
+from app import search
+from app.actions import condition_selection, supprimer
+from app.extensions import db
+from app.models import Client
+from app.queries import filtrer_clients
+from app.search import index_disponible, supprimer_index
+
+
+def recherche(terme):
+    return sorted(c.nom for c in filtrer_clients(Client.query, terme))
+
+
+def test_index_suit_les_ecritures(nouveau_client):
+    helene = nouveau_client('Hélène Dupré', email='h.d@example.com', telephone='06 12 34 56 78')
+    nouveau_client('Marc Petit')
+
+    assert recherche('helene') == ['Hélène Dupré']
+    assert recherche('DUPRE hel') == ['Hélène Dupré']
+    assert recherche('06.12.34') == ['Hélène Dupré']
+
+    helene.nom = 'Hélène Martin'
+    db.session.commit()
+    assert recherche('dupre') == []
+    assert recherche('martin') == ['Hélène Martin']
+
+    db.session.delete(helene)
+    db.session.commit()
+    assert recherche('helene') == []
+
+
+def test_suppression_groupee_desindexe(nouveau_client):
+    ids = [nouveau_client(f'Durand {i}').id for i in range(3)]
+    assert supprimer(condition_selection(ids=ids[:2])) == (2, 0)
+    assert recherche('durand') == ['Durand 2']
+
+
+def test_absence_de_l_index_non_retenue_indefiniment(base, monkeypatch):
+    connection = db.session.connection()
+    supprimer_index(connection)
+    db.session.commit()
+    assert not index_disponible(db.session.connection())
+
+    # Index recréé par un autre processus
+    with db.engine.begin() as autre:
+        autre.execute(text("CREATE VIRTUAL TABLE client_fts USING fts5(document)"))
+    assert not index_disponible(db.session.connection())
+    maintenant = time.monotonic() + search.TTL_INDEX_ABSENT + 1
+    monkeypatch.setattr(search.time, 'monotonic', lambda: maintenant)
+    assert index_disponible(db.session.connection())
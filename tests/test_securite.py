@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.auth import securite
+from app.auth.securite import BackendMemoire, LimiteurConnexions
+from app.extensions import db
+from app.models import User, hacher_mot_de_passe
+
+
+@pytest.fixture
+def client_http(app, base, monkeypatch):
+    monkeypatch.setitem(app.config, 'LOGIN_MAX_ATTEMPTS_PER_IP', 3)
+    monkeypatch.setitem(app.config, 'LOGIN_MAX_FAILURES_PER_USERNAME', 2)
+    monkeypatch.setattr(securite, '_limiteur', None)
+    return app.test_client()
+
+
+def connexion(client_http, username, password):
+    return client_http.post('/auth/login', data={'username': username, 'password': password})
+
+
+def test_limite_des_echecs_par_utilisateur(client_http):
+    db.session.add(User(username='alice', email='alice@example.com',
+                        password_hash=hacher_mot_de_passe('secret-alice')))
+    db.session.commit()
+
+    assert connexion(client_http, 'alice', 'faux').status_code == 200
+    assert connexion(client_http, 'Alice', 'faux').status_code == 200
+    # Même le bon mot de passe est refusé tant que la fenêtre n'est pas écoulée
+    reponse = connexion(client_http, 'alice', 'secret-alice')
+    assert reponse.status_code == 429
+    assert 0 < int(reponse.headers['Retry-After']) <= 300
+    # Les refus ne comptent pas : l'IP a encore droit à une tentative
+    assert connexion(client_http, 'bob', 'faux').status_code == 200
+    assert connexion(client_http, 'bob', 'faux').status_code == 429
+
+
+def test_limite_des_inscriptions_par_ip(client_http):
+    for i in range(3):
+        reponse = client_http.post('/auth/register', data={
+            'username': f'membre{i}', 'email': f'membre{i}@example.com', 'password': 'secret123',
+        })
+        assert reponse.status_code == 302
+    reponse = client_http.post('/auth/register', data={
+        'username': 'membre3', 'email': 'membre3@example.com', 'password': 'secret123',
+    })
+    assert reponse.status_code == 429
+    assert 'Retry-After' in reponse.headers
+    assert User.query.count() == 3
+
+
+def test_fenetre_glissante():
+    limiteur = LimiteurConnexions(BackendMemoire(), fenetre=60, max_par_ip=2,
+                                  max_echecs_par_utilisateur=5)
+    debut = datetime(2024, 1, 1, 12)
+    limiteur.enregistrer('10.0.0.1', 'alice', False, debut)
+    limiteur.enregistrer('10.0.0.1', 'alice', True, debut + timedelta(seconds=20))
+    assert limiteur.attente('10.0.0.1', 'bob', debut + timedelta(seconds=30)) == 30
+    assert limiteur.attente('10.0.0.2', 'bob', debut + timedelta(seconds=30)) == 0
+    assert limiteur.attente('10.0.0.1', 'bob', debut + timedelta(seconds=61)) == 0
@@ -0,0 +1,90 @@
+import smtplib
+
+import pytest
+
+from app.smtp_pool import SMTPConnectionPool
+
+
+class FauxSMTP:
+    """Serveur SMTP simulé : une instance par connexion ouverte."""
+
+    ouvertes = []
+
+    def __init__(self, host, port, timeout=None):
+        self.coupe = False
+        self.fermee = False
+        self.envois = []
+        FauxSMTP.ouvertes.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def noop(self):
+        if self.coupe:
+            raise smtplib.SMTPServerDisconnected('connexion fermée')
+        return 250, b'OK'
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.coupe:
+            raise smtplib.SMTPServerDisconnected('connexion fermée')
+        self.envois.append((from_addr, to_addrs, msg))
+        return {}
+
+    def quit(self):
+        self.fermee = True
+
+    def close(self):
+        self.fermee = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(FauxSMTP, 'ouvertes', [])
+    monkeypatch.setattr(smtplib, 'SMTP', FauxSMTP)
+    pool = SMTPConnectionPool('smtp.example.com', 587, 'expediteur@example.com', 'secret',
+                              max_size=2, acquire_timeout=0.1)
+    yield pool
+    pool.close_all()
+
+
+def test_connexion_reutilisee(pool):
+    for i in range(3):
+        pool.sendmail('expediteur@example.com', ['alice@example.com'], f'message {i}')
+
+    assert len(FauxSMTP.ouvertes) == 1
+    assert len(FauxSMTP.ouvertes[0].envois) == 3
+    stats = pool.stats()
+    assert (stats['misses'], stats['hits'], stats['sent'], stats['idle'], stats['in_use']) == (1, 2, 3, 1, 0)
+
+
+def test_taille_maximale(pool):
+    with pool.connection() as premiere, pool.connection() as seconde:
+        assert premiere is not seconde
+        assert pool.stats()['in_use'] == 2
+        with pytest.raises(TimeoutError):
+            with pool.connection():
+                pass
+
+    assert pool.stats()['idle'] == 2
+    with pool.connection() as server:
+        assert server in (premiere, seconde)
+    assert len(FauxSMTP.ouvertes) == 2
+
+
+def test_reconnexion_sur_une_connexion_neuve(pool):
+    with pool.connection(), pool.connection():
+        pass
+    # Redémarrage du serveur : toutes les connexions inactives sont coupées
+    for server in FauxSMTP.ouvertes:
+        server.coupe = True
+
+    assert pool.sendmail('expediteur@example.com', ['alice@example.com'], 'message') == {}
+
+    assert len(FauxSMTP.ouvertes) == 3
+    neuve = FauxSMTP.ouvertes[-1]
+    assert len(neuve.envois) == 1
+    assert pool.stats()['reconnects'] == 1
+    assert sum(server.fermee for server in FauxSMTP.ouvertes[:2]) == 1
@@ -0,0 +1,51 @@
+from datetime import date, datetime
+
+from app.actions import changer_statut, condition_selection, prolonger
+from app.dispatch import DispatchEngine, Envoi
+from app.extensions import db
+from app.models import DailyClientStats, DailyEmailStats, EmailLog
+from app.stats import reconstruire_statistiques
+
+
+def cumuls():
+    """Contenu non nul des deux tables de cumuls."""
+    clients = {
+        (l.jour, l.statut): (l.ajouts, l.expirations)
+        for l in DailyClientStats.query if l.ajouts or l.expirations
+    }
+    emails = {(l.jour, l.statut): l.nombre for l in DailyEmailStats.query if l.nombre}
+    return clients, emails
+
+
+def test_cumuls_egaux_au_recalcul(app, nouveau_client):
+    clients = [
+        nouveau_client(f'Client {i}', date_ajout=date(2024, 1 + i % 3, 1 + i),
+                       date_expiration=date(2025, 1 + i % 4, 10), statut=('actif', 'inactif')[i % 2])
+        for i in range(12)
+    ]
+
+    # Écritures ORM : modification, suppression, emails unitaires
+    clients[0].statut = 'inactif'
+    clients[1].date_expiration = date(2026, 6, 1)
+    db.session.delete(clients[2])
+    log = EmailLog(client_id=clients[3].id, sujet='Rappel', contenu='Bonjour',
+                   date_envoi=datetime(2024, 3, 5, 9, 30))
+    db.session.add(log)
+    db.session.commit()
+    log.statut = 'échec'
+    db.session.commit()
+
+    # Écritures ensemblistes, hors événements ORM
+    changer_statut(condition_selection(ids=[c.id for c in clients[4:8]]), 'suspendu')
+    prolonger(condition_selection(status_filter='actif'), 30)
+
+    engine = DispatchEngine(lambda *envoi: (envoi[0] != clients[5].email, ''), max_workers=2, app=app)
+    try:
+        engine.executer([[Envoi(c.id, c.email, c.nom, 'Sujet', 'Corps') for c in clients[4:9]]])
+    finally:
+        engine.fermer()
+
+    avant = cumuls()
+    assert avant[0] and avant[1]
+    reconstruire_statistiques()
+    assert cumuls() == avant
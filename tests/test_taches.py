@@ -0,0 +1,101 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import exports
+from app.exports import generer_export
+from app.extensions import db
+from app.models import ExportJob
+from app.taches import marquer_taches_interrompues, purger_fichiers, reclamer_tache
+
+
+def tache(app, ident, **champs):
+    chemin = os.path.join(app.config['EXPORT_DIR'], f'{ident}.pdf')
+    job = ExportJob(id=ident, format='pdf', chemin=chemin, **champs)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def fichier(chemin, age_heures):
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    open(chemin, 'wb').close()
+    instant = time.time() - age_heures * 3600
+    os.utime(chemin, (instant, instant))
+
+
+def test_reclamation_et_taches_interrompues(app, base):
+    tache(app, 'a' * 32)
+    assert reclamer_tache(ExportJob, 'w1') == 'a' * 32
+    assert reclamer_tache(ExportJob, 'w2') is None
+
+    assert marquer_taches_interrompues() == 0
+    assert marquer_taches_interrompues(datetime.utcnow() + timedelta(hours=2)) == 1
+    job = db.session.get(ExportJob, 'a' * 32)
+    assert (job.statut, job.verrouille_par) == ('failed', 'w1')
+
+
+def test_purge_des_fichiers_expires(app, base):
+    ancien = datetime.utcnow() - timedelta(days=2)
+    termine = tache(app, 'b' * 32, statut='done', termine_a=ancien)
+    en_cours = tache(app, 'c' * 32, statut='running', verrouille_a=datetime.utcnow())
+    recent = tache(app, 'd' * 32, statut='done', termine_a=datetime.utcnow())
+    orphelin = os.path.join(app.config['IMPORT_DIR'], 'e' * 32 + '-erreurs.csv')
+    chemins = [termine.chemin, en_cours.chemin, recent.chemin, orphelin]
+    for chemin, age in zip(chemins, (48, 48, 1, 48)):
+        fichier(chemin, age)
+
+    assert purger_fichiers() == 2
+    assert [os.path.exists(chemin) for chemin in chemins] == [False, True, True, False]
+    assert sorted(j.id for j in ExportJob.query) == ['c' * 32, 'd' * 32]
+
+
+def export_long(app, monkeypatch, nouveau_client, a_chaque_page):
+    """Export de trois pages réclamé par ``w1``, avec un signe de vie par page."""
+    for i in range(100):
+        nouveau_client(f'Client {i:03}')
+    job = tache(app, 'f' * 32)
+    reclamer_tache(ExportJob, 'w1')
+    monkeypatch.setattr(exports, 'PDF_PAGES_PAR_LOT', 1)
+    dessiner_page = exports._dessiner_page
+
+    def dessiner_et_observer(pdf, lignes, page):
+        dessiner_page(pdf, lignes, page)
+        a_chaque_page(page)
+    monkeypatch.setattr(exports, '_dessiner_page', dessiner_et_observer)
+
+    generer_export(app, job.id)
+    db.session.expire_all()
+    return db.session.get(ExportJob, job.id)
+
+
+def test_export_long_prolonge_son_bail(app, monkeypatch, nouveau_client):
+    interrompues = []
+
+    def page_lente(page):
+        # La page a pris plus de JOB_TIMEOUT : seul le signe de vie suivant sauve la tâche
+        interrompues.append(marquer_taches_interrompues())
+        db.session.execute(
+            update(ExportJob)
+            .values(verrouille_a=datetime.utcnow() - timedelta(seconds=app.config['JOB_TIMEOUT'] - 1))
+        )
+        db.session.commit()
+
+    job = export_long(app, monkeypatch, nouveau_client, page_lente)
+    assert interrompues == [0, 0, 0]
+    assert job.statut == 'done'
+    assert job.verrouille_a > datetime.utcnow() - timedelta(minutes=1)
+    with open(job.chemin, 'rb') as pdf:
+        assert pdf.read().count(b'/Type /Page\n') == 3
+
+
+def test_export_interrompu_abandonne(app, monkeypatch, nouveau_client):
+    def worker_declare_mort(page):
+        if page == 1:
+            marquer_taches_interrompues(datetime.utcnow() + timedelta(hours=2))
+
+    job = export_long(app, monkeypatch, nouveau_client, worker_declare_mort)
+    assert job.statut == 'failed'
+    assert 'interrompue' in job.erreur
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+from flask import session
+
+from app import models
+from app.extensions import db
+from app.models import CLE_SESSION, User, UtilisateurConnecte, load_user, utilisateurs_cache
+
+
+@pytest.fixture
+def utilisateur(base):
+    user = User(username='alice', email='alice@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def claims(user_id, username='alice', expire_dans=60):
+    return {'id': user_id, 'username': username, 'email': f'{username}@example.com',
+            'expire': time.time() + expire_dans}
+
+
+def sans_base(monkeypatch):
+    def lecture_interdite(user_id):
+        raise AssertionError('lecture de la table user')
+    monkeypatch.setattr(models, 'instantane_utilisateur', lecture_interdite)
+
+
+def test_claims_de_session_avant_cache_et_base(app, utilisateur, monkeypatch):
+    utilisateurs_cache.set(utilisateur.id, UtilisateurConnecte(utilisateur.id, 'cache', 'c@example.com'))
+    sans_base(monkeypatch)
+    with app.test_request_context():
+        session[CLE_SESSION] = claims(utilisateur.id, 'session')
+        assert load_user(str(utilisateur.id)).username == 'session'
+
+
+def test_claims_expires_relus_puis_rafraichis(app, utilisateur, monkeypatch):
+    with app.test_request_context():
+        # Claims expirés ou d'un autre utilisateur : base, puis cache
+        for perimes in (claims(utilisateur.id, 'ancien', expire_dans=-1), claims(utilisateur.id + 1)):
+            session[CLE_SESSION] = perimes
+            assert load_user(str(utilisateur.id)).username == 'alice'
+        assert utilisateurs_cache.get(utilisateur.id).username == 'alice'
+        rafraichis = session[CLE_SESSION]
+        assert rafraichis['id'] == utilisateur.id
+        assert rafraichis['expire'] == pytest.approx(time.time() + app.config['USER_CACHE_TTL'], abs=5)
+
+        sans_base(monkeypatch)
+        session[CLE_SESSION] = claims(utilisateur.id, expire_dans=-1)
+        assert load_user(str(utilisateur.id)).username == 'alice'
+
+
+def test_ecriture_validee_vide_le_cache(app, utilisateur):
+    with app.test_request_context():
+        load_user(str(utilisateur.id))
+    assert utilisateurs_cache.get(utilisateur.id) is not None
+
+    utilisateur.email = 'alice@exemple.fr'
+    db.session.flush()
+    db.session.rollback()
+    assert utilisateurs_cache.get(utilisateur.id) is not None
+
+    utilisateur.email = 'alice@exemple.fr'
+    db.session.commit()
+    assert utilisateurs_cache.get(utilisateur.id) is None
+
+
+def test_utilisateur_supprime(app, utilisateur):
+    user_id = utilisateur.id
+    db.session.delete(utilisateur)
+    db.session.commit()
+    with app.test_request_context():
+        session[CLE_SESSION] = claims(user_id, expire_dans=-1)
+        assert load_user(str(user_id)) is None
+        assert CLE_SESSION not in session
+
+
+def get(client_http, url):
+    # Contexte d'application propre à la requête : ``g`` (utilisateur chargé) n'est pas
+    # partagé avec le contexte ouvert par la fixture ``base``
+    with client_http.application.app_context():
+        return client_http.get(url)
+
+
+def test_deconnexion_oublie_les_claims(client_connecte):
+    assert get(client_connecte, '/').status_code == 200
+    with client_connecte.session_transaction() as session_http:
+        assert session_http[CLE_SESSION]['username'] == 'admin'
+
+    get(client_connecte, '/auth/logout')
+    with client_connecte.session_transaction() as session_http:
+        assert CLE_SESSION not in session_http
+    assert get(client_connecte, '/').status_code == 302
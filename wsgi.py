@@ -0,0 +1,7 @@
+"""Point d'entrée WSGI et CLI : ``gunicorn wsgi:app`` ou ``flask --app wsgi <commande>``.
+
+La configuration est choisie par FLASK_CONFIG (ou FLASK_ENV).
+"""
+from app import create_app
+
+app = create_app()